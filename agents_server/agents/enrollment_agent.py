@@ -1,18 +1,31 @@
 # agents/enrollment_agent.py
+import atexit
 import os
+import re
 import chromadb
 import numpy as np
 import pandas as pd
-import faiss
 import pickle
+import tempfile
 from typing import List, Dict, Any, Optional
 from sentence_transformers import SentenceTransformer
+from storage.bm25_index import BM25Index, rrf_fuse
+from storage.trial_filters import TrialFilterIndex, chroma_where, clean_filters
+from storage.trial_store import NCTIndex, TrialStore, normalize_nct_id
+from storage.ttl_cache import LRUCache
+from storage.vector_index import build_index, filtered_search, load_index
 from .base_agent import LLMAgent
+from .enrollment_scoring import EnrollmentScores, score_trial
 
 class EnrollmentAgent(LLMAgent):
     # Class-level cache for shared resources
     _model_cache = None
     _faiss_cache = {}
+    MODEL_NAME = "all-MiniLM-L6-v2"
+    # Normalized query text -> embedding, shared by all instances
+    _embedding_cache: Optional[LRUCache] = None
+    _embedding_cache_path: Optional[str] = None
+    _embedding_stats = {"hits": 0, "misses": 0}
     
     def __init__(self, llm, collection_name=None, api_key=None, tenant=None, database=None, verbose: bool = False):
         super().__init__("Enrollment", "Analyze patient enrollment data and search clinical trials", llm)
@@ -27,15 +40,39 @@ class EnrollmentAgent(LLMAgent):
         
         # Use cached sentence transformer (expensive to load)
         if EnrollmentAgent._model_cache is None:
-            EnrollmentAgent._model_cache = SentenceTransformer("all-MiniLM-L6-v2")
+            EnrollmentAgent._model_cache = SentenceTransformer(self.MODEL_NAME)
         self.model = EnrollmentAgent._model_cache
+        if EnrollmentAgent._embedding_cache is None:
+            EnrollmentAgent._init_embedding_cache()
         
         # Backends
         self.client = None
         self.collection = None
         self.faiss_index = None
-        self.faiss_documents: List[str] = []
-        self.faiss_df: Optional[pd.DataFrame] = None
+        # True when the index pages are shared through the page cache
+        self.faiss_mapped = False
+        # Trial rows and documents, read lazily by FAISS row position
+        self.trials: Optional[TrialStore] = None
+        # Normalized NCT ID -> row position in trials
+        self.nct_index: Optional[NCTIndex] = None
+        # Sorted row positions per phase/status/study type/disease value for filtered search
+        self.trial_filters: Optional[TrialFilterIndex] = None
+        # Lexical index fused with FAISS results for auto/hybrid search
+        self.bm25: Optional[BM25Index] = None
+        # Optional executor for the CPU-bound retrieval/scoring stage (set by the
+        # orchestrator); the LLM call stays on the calling (I/O) thread
+        self.cpu_executor = None
+        # Enrollment success score/factors for every local trial, by row position
+        self.enrollment_scores: Optional[EnrollmentScores] = None
+        self.hybrid_enabled = os.getenv('HYBRID_SEARCH', '1') != '0'
+        try:
+            self.rrf_k = int(os.getenv('HYBRID_RRF_K', '60'))
+        except ValueError:
+            self.rrf_k = 60
+        try:
+            self.hybrid_candidates = int(os.getenv('HYBRID_CANDIDATES', '50'))
+        except ValueError:
+            self.hybrid_candidates = 50
         
         # Prefer Chroma if credentials exist, else fallback to local FAISS/CSV
         if self.api_key and self.tenant:
@@ -48,6 +85,91 @@ class EnrollmentAgent(LLMAgent):
                 print("ChromaDB credentials not found. Falling back to local FAISS/CSV search.")
             self.init_faiss()
     
+    @classmethod
+    def _init_embedding_cache(cls):
+        """
+        Bounded LRU of query embeddings (EMBEDDING_CACHE_SIZE entries). When
+        EMBEDDING_CACHE_PATH is set the cache is loaded from / saved to that
+        .npz file so restarts begin warm.
+        """
+        try:
+            size = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+        except Exception:
+            size = 2048
+        cls._embedding_cache = LRUCache(max_entries=size)
+        cls._embedding_cache_path = os.getenv("EMBEDDING_CACHE_PATH") or None
+        if not cls._embedding_cache_path:
+            return
+        if os.path.exists(cls._embedding_cache_path):
+            try:
+                with np.load(cls._embedding_cache_path, allow_pickle=False) as data:
+                    if str(data["model"]) == cls.MODEL_NAME:
+                        for key, vector in zip(data["keys"].tolist(), data["vectors"]):
+                            cls._embedding_cache.set(key, vector.astype(np.float32))
+                print(f"Loaded {len(cls._embedding_cache)} cached query embeddings from {cls._embedding_cache_path}")
+            except Exception as e:
+                print(f"Warning: Failed to load embedding cache: {e}")
+        atexit.register(cls.save_embedding_cache)
+    
+    @classmethod
+    def save_embedding_cache(cls):
+        """Persist the query-embedding cache to EMBEDDING_CACHE_PATH (no-op when unset)"""
+        if not cls._embedding_cache_path or cls._embedding_cache is None:
+            return
+        items = cls._embedding_cache.items()
+        if not items:
+            return
+        tmp_path = None
+        try:
+            cache_dir = os.path.dirname(os.path.abspath(cls._embedding_cache_path))
+            os.makedirs(cache_dir, exist_ok=True)
+            # Unique per writer: several worker processes may save at exit concurrently
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".npz")
+            with os.fdopen(fd, "wb") as f:
+                np.savez(
+                    f,
+                    model=np.array(cls.MODEL_NAME),
+                    keys=np.array([k for k, _ in items]),
+                    vectors=np.stack([v for _, v in items]),
+                )
+            os.replace(tmp_path, cls._embedding_cache_path)
+            tmp_path = None
+        except Exception as e:
+            print(f"Warning: Failed to save embedding cache: {e}")
+        finally:
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    @staticmethod
+    def _normalize_query(query):
+        return " ".join(str(query).lower().split())
+    
+    def encode_query(self, query):
+        """
+        Embedding of a search query as a (1, d) float32 array, served from the
+        shared LRU when this text has been seen before. all-MiniLM-L6-v2 is
+        uncased, so encoding the normalized text gives the same vector.
+        """
+        key = self._normalize_query(query)
+        vector = EnrollmentAgent._embedding_cache.get(key)
+        if vector is None:
+            EnrollmentAgent._embedding_stats["misses"] += 1
+            vector = self.model.encode([key], convert_to_numpy=True, normalize_embeddings=True)[0].astype(np.float32)
+            EnrollmentAgent._embedding_cache.set(key, vector)
+        else:
+            EnrollmentAgent._embedding_stats["hits"] += 1
+        return vector.reshape(1, -1)
+    
+    @classmethod
+    def embedding_cache_stats(cls):
+        hits, misses = cls._embedding_stats["hits"], cls._embedding_stats["misses"]
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": (hits / (hits + misses)) if (hits + misses) else 0.0,
+            "entries": len(cls._embedding_cache) if cls._embedding_cache is not None else 0,
+        }
+    
     def init_chromadb(self):
         """Initialize ChromaDB client and collection"""
         try:
@@ -82,10 +204,14 @@ class EnrollmentAgent(LLMAgent):
             if cache_key in EnrollmentAgent._faiss_cache:
                 cached = EnrollmentAgent._faiss_cache[cache_key]
                 self.faiss_index = cached.get('index')
-                self.faiss_documents = cached.get('documents', [])
-                self.faiss_df = cached.get('df')
+                self.faiss_mapped = cached.get('mapped', False)
+                self.trials = cached.get('trials')
+                self.nct_index = cached.get('nct_index')
+                self.trial_filters = cached.get('filters')
+                self.bm25 = cached.get('bm25')
+                self.enrollment_scores = cached.get('scores')
                 if self.verbose:
-                    print(f"Using cached FAISS data ({len(self.faiss_documents)} documents)")
+                    print(f"Using cached FAISS data ({len(self.trials) if self.trials else 0} documents)")
                 return
             
             datasets_dir = os.path.join(base_dir, 'datasets')
@@ -97,6 +223,11 @@ class EnrollmentAgent(LLMAgent):
                 os.path.join(datasets_dir, 'clinical_trials.csv'),
                 os.path.join(base_dir, 'scripts', '..', 'datasets', 'clinical_trials.csv'),
             ]
+            # Columnar store written by scripts/load_faiss.py next to the index
+            store_candidates = [
+                os.path.join(datasets_dir, 'clinical_trials'),
+                os.path.join(base_dir, 'scripts', 'clinical_trials'),
+            ]
             metadata_pkl_candidates = [
                 os.path.join(base_dir, 'scripts', 'clinical_trials_metadata.pkl')
             ]
@@ -104,75 +235,151 @@ class EnrollmentAgent(LLMAgent):
             # Load FAISS index
             faiss_path = next((p for p in faiss_path_candidates if os.path.exists(p)), None)
             if faiss_path and os.path.exists(faiss_path):
-                self.faiss_index = faiss.read_index(faiss_path)
+                # Applies the nprobe/efSearch saved next to the index
+                self.faiss_index, self.faiss_mapped = load_index(faiss_path)
                 if self.verbose:
-                    print(f"Loaded FAISS index from {faiss_path} with {self.faiss_index.ntotal} vectors")
+                    how = "memory-mapped" if self.faiss_mapped else "read into memory"
+                    print(f"Loaded FAISS index from {faiss_path} with {self.faiss_index.ntotal} vectors ({how})")
+
+            # Load metadata: memory-mapped store, else legacy pkl, else CSV and synthesize text
+            store_path = next((p for p in store_candidates if TrialStore.exists(p)), None)
+            if store_path:
+                try:
+                    self.trials = TrialStore.open(store_path)
+                    if self.verbose:
+                        print(f"Memory-mapped trial store {store_path} with {len(self.trials)} documents")
+                except Exception as e:
+                    if self.verbose:
+                        print(f"Warning: Failed to open trial store: {e}")
 
-            # Load metadata (prefer pkl if available, else CSV and synthesize text)
             pkl_path = next((p for p in metadata_pkl_candidates if os.path.exists(p)), None)
-            if pkl_path:
+            if self.trials is None and pkl_path:
                 try:
                     with open(pkl_path, 'rb') as f:
                         meta = pickle.load(f)
-                    self.faiss_documents = meta.get('documents', [])
-                    self.faiss_df = meta.get('df')
+                    self.trials = TrialStore.from_dataframe(meta['df'], meta.get('documents'))
                     if self.verbose:
-                        print(f"Loaded metadata from {pkl_path} with {len(self.faiss_documents)} documents")
+                        print(f"Loaded legacy metadata from {pkl_path} with {len(self.trials)} documents "
+                              "(re-run scripts/load_faiss.py to switch to the memory-mapped store)")
                 except Exception as e:
                     if self.verbose:
                         print(f"Warning: Failed to load metadata pkl: {e}")
 
-            if self.faiss_df is None:
+            if self.trials is None:
                 csv_path = next((p for p in csv_candidates if os.path.exists(p)), None)
                 if csv_path and os.path.exists(csv_path):
-                    self.faiss_df = pd.read_csv(csv_path)
-                    # Build documents similar to indexing pipeline
-                    def row_to_text(row):
-                        def safe_get(field, default="N/A"):
-                            value = row.get(field, default)
-                            return str(value) if pd.notna(value) else default
-                        return (
-                            f"Disease: {safe_get('Disease')}. "
-                            f"NCT ID: {safe_get('NCT ID')}. "
-                            f"Status: {safe_get('Overall Status')}. "
-                            f"Why Stopped: {safe_get('Why Stopped')}. "
-                            f"Eligibility: {safe_get('Eligibility Criteria')}. "
-                            f"Phase: {safe_get('Phase')}. "
-                            f"Conditions: {safe_get('Conditions')}. "
-                            f"Study Type: {safe_get('Study type')}."
-                        )
-                    self.faiss_documents = self.faiss_df.apply(row_to_text, axis=1).tolist()
+                    # Documents are built the same way as in the indexing pipeline
+                    self.trials = TrialStore.from_dataframe(pd.read_csv(csv_path))
                     if self.verbose:
-                        print(f"Loaded CSV from {csv_path} with {len(self.faiss_documents)} documents")
+                        print(f"Loaded CSV from {csv_path} with {len(self.trials)} documents")
 
-            if self.faiss_index is None and self.faiss_df is not None:
+            if self.faiss_index is None and self.trials is not None:
                 # As a last resort, build an in-memory FAISS index from CSV (slower but functional)
                 try:
                     if self.verbose:
                         print("FAISS index not found. Building transient index from CSV (first run may be slow)...")
-                    embeddings = self.model.encode(self.faiss_documents, convert_to_numpy=True, normalize_embeddings=True)
-                    d = embeddings.shape[1]
-                    self.faiss_index = faiss.IndexFlatIP(d)
-                    self.faiss_index.add(embeddings)
+                    embeddings = self.model.encode(list(self.trials.documents), convert_to_numpy=True, normalize_embeddings=True)
+                    self.faiss_index, _ = build_index(embeddings, os.getenv('FAISS_INDEX_TYPE', 'flat'))
                     if self.verbose:
                         print(f"Built transient FAISS index with {self.faiss_index.ntotal} vectors")
                 except Exception as e:
                     if self.verbose:
                         print(f"Error building transient FAISS index: {e}")
             
+            if self.trials is not None:
+                self._load_lookups()
+            
             # Cache for future instances
             EnrollmentAgent._faiss_cache[cache_key] = {
                 'index': self.faiss_index,
-                'documents': self.faiss_documents,
-                'df': self.faiss_df
+                'mapped': self.faiss_mapped,
+                'trials': self.trials,
+                'nct_index': self.nct_index,
+                'filters': self.trial_filters,
+                'bm25': self.bm25,
+                'scores': self.enrollment_scores
             }
         except Exception as e:
             if self.verbose:
                 print(f"Error initializing local FAISS/CSV backend: {e}")
     
+    def _load_lookups(self):
+        """
+        NCT index, filter postings, scores and BM25 for self.trials. For the
+        memory-mapped store these are arrays saved by scripts/load_faiss.py and
+        mapped here (shared by all workers); they are only built in memory for
+        CSV/pickle trials or stores written before the arrays existed.
+        """
+        mapped = self.trials.base_path is not None
+        missing = []
+
+        self.nct_index = NCTIndex.load(self.trials)
+        if self.nct_index is None:
+            missing.append('NCT index')
+            self.nct_index = NCTIndex.build(self.trials.column('NCT ID'))
+
+        self.trial_filters = TrialFilterIndex.load(self.trials)
+        if self.trial_filters is None:
+            missing.append('filter postings')
+            self.trial_filters = TrialFilterIndex.build(self.trials)
+
+        try:
+            # Stored columns are read zero-copy; scored here for older stores and CSV
+            self.enrollment_scores = EnrollmentScores.from_trials(self.trials)
+        except Exception as e:
+            if self.verbose:
+                print(f"Warning: Failed to score trials: {e}")
+
+        if self.hybrid_enabled:
+            try:
+                self.bm25 = BM25Index.load(self.trials)
+                if self.bm25 is not None and len(self.bm25) != len(self.trials):
+                    print(f"Warning: BM25 index covers {len(self.bm25)} trials, store has {len(self.trials)}; ignoring it")
+                    self.bm25 = None
+            except Exception as e:
+                print(f"Warning: Failed to load BM25 index: {e}")
+                self.bm25 = None
+            if self.bm25 is None and mapped:
+                # Building it would copy every document into each worker
+                missing.append('BM25 index (hybrid search disabled)')
+            elif self.bm25 is None:
+                try:
+                    self.bm25 = BM25Index.build(self.trials.documents)
+                    if self.verbose:
+                        print(f"Built BM25 index over {len(self.bm25)} documents")
+                except Exception as e:
+                    if self.verbose:
+                        print(f"Error building BM25 index: {e}")
+
+        if mapped and missing:
+            print(f"Warning: {self.trials.base_path} has no saved {', '.join(missing)}; "
+                  "re-run scripts/load_faiss.py to share them between workers")
+        elif self.verbose and mapped:
+            print(f"Memory-mapped NCT index, filter postings and BM25 index from {self.trials.base_path}")
+    
+    @staticmethod
+    def _normalize_nct_id(nct_id):
+        return normalize_nct_id(nct_id)
+    
+    @staticmethod
+    def _row_metadata(row):
+        return {
+            'nct_id': row.get('NCT ID', 'N/A'),
+            'disease': row.get('Disease', 'N/A'),
+            'status': row.get('Overall Status', 'N/A'),
+            'phase': row.get('Phase', 'N/A'),
+            'study_type': row.get('Study type', 'N/A'),
+            'conditions': row.get('Conditions', 'N/A'),
+            'why_stopped': row.get('Why Stopped', 'N/A'),
+            'eligibility_criteria': row.get('Eligibility Criteria', 'N/A'),
+        }
+    
+    def _local_trial(self, pos):
+        return {'document': self.trials.document(pos), 'metadata': self._row_metadata(self.trials.row(pos)), 'id': str(pos), 'position': pos}
+    
     def search_by_nct_id(self, nct_id):
         """Search for a specific clinical trial by NCT ID"""
-        # Prefer Chroma, else local DataFrame filter
+        # Prefer Chroma, else local hash index
         if self.collection:
             try:
                 results = self.collection.get(where={"nct_id": nct_id})
@@ -187,48 +394,61 @@ class EnrollmentAgent(LLMAgent):
                 print(f"Error searching by NCT ID (Chroma): {e}")
                 return None
         
-        if self.faiss_df is not None:
+        if self.trials is not None:
             try:
-                matches = self.faiss_df[self.faiss_df.get('NCT ID') == nct_id]
-                if not matches.empty:
-                    row = matches.iloc[0]
-                    idx = int(matches.index[0])
-                    doc = self.faiss_documents[idx] if 0 <= idx < len(self.faiss_documents) else ''
-                    meta = {
-                        'nct_id': row.get('NCT ID', 'N/A'),
-                        'disease': row.get('Disease', 'N/A'),
-                        'status': row.get('Overall Status', 'N/A'),
-                        'phase': row.get('Phase', 'N/A'),
-                        'study_type': row.get('Study type', 'N/A'),
-                        'conditions': row.get('Conditions', 'N/A'),
-                        'why_stopped': row.get('Why Stopped', 'N/A'),
-                        'eligibility_criteria': row.get('Eligibility Criteria', 'N/A'),
-                    }
-                    return {'document': doc, 'metadata': meta, 'id': str(idx)}
+                pos = self.nct_index.get(self._normalize_nct_id(nct_id))
+                if pos is not None:
+                    return self._local_trial(pos)
             except Exception as e:
                 print(f"Error searching by NCT ID (local): {e}")
         return None
     
-    def search_by_disease(self, disease, top_k=10):
+    def search_by_nct_ids(self, nct_ids):
+        """Batch lookup of several NCT IDs; returns found trials in input order"""
+        ids = list(dict.fromkeys(self._normalize_nct_id(n) for n in nct_ids if n))
+        if self.collection:
+            try:
+                results = self.collection.get(where={"nct_id": {"$in": ids}})
+                by_id = {}
+                for doc, meta, rid in zip(results['documents'], results['metadatas'], results['ids']):
+                    by_id.setdefault(self._normalize_nct_id(meta.get('nct_id', '')), {'document': doc, 'metadata': meta, 'id': rid})
+                return [by_id[n] for n in ids if n in by_id]
+            except Exception as e:
+                print(f"Error searching by NCT IDs (Chroma): {e}")
+                return []
+        
+        if self.trials is None:
+            return []
+        return [self._local_trial(self.nct_index[n]) for n in ids if n in self.nct_index]
+    
+    def search_by_disease(self, disease, top_k=10, filters=None):
         """Search for clinical trials by disease name"""
         if self.collection:
             try:
-                return self.semantic_search(f"{disease} disease condition clinical trial", top_k)
+                return self.semantic_search(f"{disease} disease condition clinical trial", top_k, filters)
             except Exception as e:
                 print(f"Error searching by disease (Chroma): {e}")
-                return self.semantic_search(disease, top_k)
-        # Local FAISS
-        return self.semantic_search(disease, top_k)
+                return self.semantic_search(disease, top_k, filters)
+        # Local FAISS (+ BM25, which matches rare condition names exactly)
+        return self.hybrid_search(disease, top_k, filters)
     
-    def semantic_search(self, query, top_k=5):
-        """Perform semantic search using ChromaDB or local FAISS"""
+    def semantic_search(self, query, top_k=5, filters=None):
+        """
+        Perform semantic search using ChromaDB or local FAISS. `filters` restricts
+        results by phase, status, study_type and/or disease (see storage/trial_filters.py)
+        """
         # ChromaDB path
         if self.collection:
             try:
-                query_embedding = self.model.encode([query], convert_to_numpy=True, normalize_embeddings=True)
+                query_embedding = self.encode_query(query)
+                query_kwargs = {}
+                where = chroma_where(filters)
+                if where:
+                    query_kwargs['where'] = where
                 results = self.collection.query(
                     query_embeddings=query_embedding.tolist(),
-                    n_results=top_k
+                    n_results=top_k,
+                    **query_kwargs
                 )
                 formatted_results = []
                 for i in range(len(results['documents'][0])):
@@ -245,47 +465,87 @@ class EnrollmentAgent(LLMAgent):
                 # fall through to local
         
         # Local FAISS path
-        if self.faiss_index is None or self.faiss_df is None or not self.faiss_documents:
+        if self.faiss_index is None or self.trials is None or not len(self.trials):
             return []
         try:
-            q_emb = self.model.encode([query], convert_to_numpy=True, normalize_embeddings=True)
-            D, I = self.faiss_index.search(q_emb.astype(np.float32), k=min(top_k, self.faiss_index.ntotal))
-            results: List[Dict[str, Any]] = []
-            for rank, idx in enumerate(I[0]):
-                row = self.faiss_df.iloc[int(idx)]
-                meta = {
-                    'nct_id': row.get('NCT ID', 'N/A'),
-                    'disease': row.get('Disease', 'N/A'),
-                    'status': row.get('Overall Status', 'N/A'),
-                    'phase': row.get('Phase', 'N/A'),
-                    'study_type': row.get('Study type', 'N/A'),
-                    'conditions': row.get('Conditions', 'N/A'),
-                    'why_stopped': row.get('Why Stopped', 'N/A'),
-                    'eligibility_criteria': row.get('Eligibility Criteria', 'N/A'),
-                }
-                results.append({
-                    'document': self.faiss_documents[int(idx)],
-                    'metadata': meta,
-                    'id': str(int(idx)),
-                    'similarity_score': float(D[0][rank]),
-                    'rank': rank + 1,
-                })
-            return results
+            hits = self._vector_hits(query, top_k, filters)
+            return [
+                {**self._local_trial(pos), 'similarity_score': score, 'rank': rank}
+                for rank, (pos, score) in enumerate(hits, start=1)
+            ]
         except Exception as e:
             print(f"Error in semantic search (local FAISS): {e}")
             return []
     
-    def search_clinical_trials(self, search_term, search_type="auto", top_k=5):
+    def _filter_rows(self, filters):
+        """Sorted row positions matching filters on the local backend (None = unfiltered)"""
+        rows = self.trial_filters.rows(filters) if (filters and self.trial_filters) else None
+        if rows is not None and self.verbose:
+            print(f"Filters {clean_filters(filters)} match {len(rows)} trials")
+        return rows
+    
+    def _vector_hits(self, query, k, filters=None):
+        """(row position, cosine score) pairs from FAISS, best first"""
+        q_emb = self.encode_query(query)
+        selection = self.trial_filters.selection(filters, self.faiss_index.ntotal) if (filters and self.trial_filters) else None
+        if selection is None:
+            D, I = self.faiss_index.search(q_emb, k=min(k, self.faiss_index.ntotal))
+        else:
+            # Packed bitmap is memoized per filter; excluded rows are skipped inside the FAISS scan
+            bitmap, count = selection
+            if not count:
+                return []
+            D, I = filtered_search(self.faiss_index, q_emb, min(k, count), bitmap)
+        return [(int(idx), float(score)) for idx, score in zip(I[0], D[0]) if idx >= 0]
+    
+    def hybrid_search(self, query, top_k=5, filters=None):
+        """
+        BM25 + vector search over the local trials, merged with reciprocal-rank
+        fusion. Both retrievers fetch `hybrid_candidates` rows under the same
+        filter rows; falls back to semantic search without a BM25 index.
+        """
+        if self.collection or self.bm25 is None or self.faiss_index is None or self.trials is None:
+            return self.semantic_search(query, top_k, filters)
+        try:
+            rows = self._filter_rows(filters)
+            depth = max(top_k, self.hybrid_candidates)
+            vector_hits = self._vector_hits(query, depth, filters)
+            lexical_hits = self.bm25.search(query, depth, rows)
+            vector_scores = dict(vector_hits)
+            lexical_scores = dict(lexical_hits)
+            fused = rrf_fuse([[pos for pos, _ in vector_hits], [pos for pos, _ in lexical_hits]], k=self.rrf_k, top_k=top_k)
+            results: List[Dict[str, Any]] = []
+            for rank, (pos, score) in enumerate(fused, start=1):
+                result = {**self._local_trial(pos), 'fusion_score': score, 'rank': rank}
+                if pos in vector_scores:
+                    result['similarity_score'] = vector_scores[pos]
+                if pos in lexical_scores:
+                    result['bm25_score'] = lexical_scores[pos]
+                results.append(result)
+            return results
+        except Exception as e:
+            print(f"Error in hybrid search: {e}. Falling back to semantic search...")
+            return self.semantic_search(query, top_k, filters)
+    
+    def search_clinical_trials(self, search_term, search_type="auto", top_k=5, filters=None):
         # Convert search_term to string if it's not already
         if isinstance(search_term, (np.ndarray, list)):
             search_term = str(search_term[0]) if len(search_term) > 0 else ""
         elif not isinstance(search_term, str):
             search_term = str(search_term)
         
+        # Queries naming several trials are served by one batch lookup
+        nct_ids = re.findall(r'NCT\d{8}', search_term.upper())
+        if search_type in ("auto", "nct_id") and len(nct_ids) > 1:
+            return self.search_by_nct_ids(nct_ids)
+        
         # Auto-detect search type if not specified
         if search_type == "auto":
             if search_term.upper().startswith("NCT"):
                 search_type = "nct_id"
+            elif self.bm25 is not None and not self.collection:
+                # Lexical + vector fusion covers rare conditions and drug names
+                search_type = "hybrid"
             elif any(disease in search_term.lower() for disease in ['cancer', 'diabetes', 'alzheimer', 'asthma', 'hiv', 'heart', 'stroke', 'parkinson', 'covid', 'depression']):
                 search_type = "disease"
             else:
@@ -296,112 +556,73 @@ class EnrollmentAgent(LLMAgent):
             return [result] if result else []
         
         elif search_type == "disease":
-            return self.search_by_disease(search_term, top_k)
+            return self.search_by_disease(search_term, top_k, filters)
         
         elif search_type == "semantic":
-            return self.semantic_search(search_term, top_k)
+            return self.semantic_search(search_term, top_k, filters)
+        
+        elif search_type == "hybrid":
+            return self.hybrid_search(search_term, top_k, filters)
         
         else:
             print(f"Unknown search type: {search_type}")
             return []
     
-    def predict_enrollment_success(self, trial_metadata):
+    def predict_enrollment_success(self, trial_metadata, position=None):
         """
         Predict enrollment success rate based on trial metadata
-        Returns a success score (0-100) with reasoning
+        Returns a success score (0-100) with reasoning. Local trials (given their
+        row position) are looked up from the precomputed scores; other trials are
+        scored with the same rules (agents/enrollment_scoring.py)
         """
-        status = trial_metadata.get('status', '').lower()
-        phase = trial_metadata.get('phase', '').lower()
-        why_stopped = trial_metadata.get('why_stopped', '').lower()
-        study_type = trial_metadata.get('study_type', '').lower()
-        
-        # Base score
-        score = 50
-        factors = []
-        
-        # Status-based scoring
-        if 'completed' in status:
-            score += 30
-            factors.append("✓ Trial successfully completed (+30)")
-        elif 'recruiting' in status or 'active' in status:
-            score += 20
-            factors.append("✓ Currently recruiting or active (+20)")
-        elif 'terminated' in status or 'suspended' in status or 'withdrawn' in status:
-            score -= 40
-            factors.append("✗ Trial was terminated/suspended (-40)")
-        
-        # Phase-based scoring
-        if 'phase 3' in phase or 'phase iii' in phase:
-            score += 15
-            factors.append("✓ Phase 3 trial - higher success rate (+15)")
-        elif 'phase 4' in phase or 'phase iv' in phase:
-            score += 20
-            factors.append("✓ Phase 4 trial - post-market study (+20)")
-        elif 'phase 1' in phase or 'phase i' in phase:
-            score -= 10
-            factors.append("⚠ Early phase trial - higher risk (-10)")
-        
-        # Stop reason analysis
-        if why_stopped and why_stopped != 'n/a' and 'not' not in why_stopped.lower():
-            if 'lack of funding' in why_stopped or 'business' in why_stopped:
-                score -= 15
-                factors.append("⚠ Stopped due to funding/business (-15)")
-            elif 'enrollment' in why_stopped or 'accrual' in why_stopped:
-                score -= 25
-                factors.append("✗ Poor enrollment history (-25)")
-            elif 'safety' in why_stopped or 'adverse' in why_stopped:
-                score -= 35
-                factors.append("✗ Safety concerns led to stop (-35)")
-        
-        # Study type consideration
-        if 'interventional' in study_type:
-            score += 10
-            factors.append("✓ Interventional study (+10)")
-        elif 'observational' in study_type:
-            score += 5
-            factors.append("✓ Observational study (+5)")
-        
-        # Ensure score is within 0-100
-        score = max(0, min(100, score))
-        
-        # Determine success category
-        if score >= 75:
-            category = "High Success Probability"
-            emoji = "🟢"
-        elif score >= 50:
-            category = "Moderate Success Probability"
-            emoji = "🟡"
-        else:
-            category = "Lower Success Probability"
-            emoji = "🔴"
-        
-        return {
-            'score': score,
-            'category': category,
-            'emoji': emoji,
-            'factors': factors
-        }
+        if position is not None and self.enrollment_scores is not None:
+            stored = self.enrollment_scores.prediction(position)
+            if stored is not None:
+                return stored
+        return score_trial(trial_metadata)
+    
+    def enrollment_score_distribution(self, by='Disease', min_trials=1):
+        """
+        Enrollment success score statistics over the local corpus, per value of
+        a trial column (e.g. 'Disease', 'Phase') or overall when by is None
+        """
+        if self.enrollment_scores is None:
+            return None
+        groups = None
+        if by:
+            groups = [value if value is not None and pd.notna(value) else 'N/A' for value in self.trials.column(by)]
+            if not groups:
+                return None
+        return self.enrollment_scores.score_distribution(groups, min_trials)
+    
+    def _retrieve_and_score(self, search_term, search_type="auto", filters=None):
+        """Search trials and predict enrollment success for each hit (no LLM calls)"""
+        trials = self.search_clinical_trials(search_term, search_type, top_k=5, filters=filters)
+        predictions = [self.predict_enrollment_success(trial.get('metadata', {}), trial.get('position')) for trial in trials]
+        return trials, predictions
     
-    def analyze_enrollment(self, search_term, search_type="auto", context=None):
+    def analyze_enrollment(self, search_term, search_type="auto", context=None, filters=None):
         """
         Analyze enrollment patterns for clinical trials based on search results
         """
-        trials = self.search_clinical_trials(search_term, search_type, top_k=5)
+        # Encode + FAISS/BM25 + scoring: CPU-bound, run in cpu_executor when provided
+        if self.cpu_executor is not None:
+            trials, success_predictions = self.cpu_executor.submit(self._retrieve_and_score, search_term, search_type, filters).result()
+        else:
+            trials, success_predictions = self._retrieve_and_score(search_term, search_type, filters)
         
+        filters = clean_filters(filters)
         if not trials:
+            if filters:
+                return f"No clinical trials found for search term: '{search_term}' with filters {filters}"
             return f"No clinical trials found for search term: '{search_term}'"
         
         # Prepare trial summaries for analysis with success predictions
         trial_summaries = []
-        success_predictions = []
         
-        for i, trial in enumerate(trials, 1):
+        for i, (trial, prediction) in enumerate(zip(trials, success_predictions), 1):
             metadata = trial.get('metadata', {})
             
-            # Predict success rate
-            prediction = self.predict_enrollment_success(metadata)
-            success_predictions.append(prediction)
-            
             summary = f"""
             Trial {i} (NCT ID: {metadata.get('nct_id', 'N/A')}):
             - Disease: {metadata.get('disease', 'N/A')}
@@ -420,6 +641,8 @@ class EnrollmentAgent(LLMAgent):
             trial_summaries.append(summary)
         
         analysis_context = context or search_term
+        if filters:
+            analysis_context += " (" + "; ".join(f"{k.replace('_', ' ')}: {', '.join(v)}" for k, v in filters.items()) + ")"
         
         # Frame as educational/clinical research context to avoid content policy issues
         prompt = f"""
@@ -552,6 +775,7 @@ Success Rate Distribution:
        
         search_type = kwargs.get('search_type', 'auto')
         context = kwargs.get('context', None)
+        filters = kwargs.get('filters', None)
         
         # Convert query to string if it's not already
         if isinstance(query, (np.ndarray, list)):
@@ -560,4 +784,4 @@ Success Rate Distribution:
             query = str(query)
         
         # Use the enrollment analysis method
-        return self.analyze_enrollment(query, search_type, context)
\ No newline at end of file
+        return self.analyze_enrollment(query, search_type, context, filters)
\ No newline at end of file
@@ -0,0 +1,235 @@
+"""
+Enrollment success scoring for the whole trial corpus at once.
+
+The single definition of the enrollment success rules (status, phase, stop
+reason, study type on top of a base of 50, clamped to 0-100), evaluated with
+NumPy over the distinct lower-cased values of each column instead of per trial.
+The substring checks keep the behaviour of the original per-trial rules (e.g.
+'phase ii' also contains 'phase i'). EnrollmentAgent.predict_enrollment_success
+uses score_trial() for trials without a stored score, so both paths share the
+tables below.
+
+scripts/load_faiss.py writes the result into the trial store as columns
+(SCORE_COLUMNS); the agent computes them once at load for stores built before
+that. Query-time predictions are then a lookup by row position, and
+score_distribution() summarises the corpus (e.g. per disease).
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+BASE_SCORE = 50
+
+# (message, delta) per factor; code 0 means the rule did not fire
+STATUS_FACTORS: Tuple[Tuple[str, int], ...] = (
+    ("", 0),
+    ("✓ Trial successfully completed (+30)", 30),
+    ("✓ Currently recruiting or active (+20)", 20),
+    ("✗ Trial was terminated/suspended (-40)", -40),
+)
+PHASE_FACTORS: Tuple[Tuple[str, int], ...] = (
+    ("", 0),
+    ("✓ Phase 3 trial - higher success rate (+15)", 15),
+    ("✓ Phase 4 trial - post-market study (+20)", 20),
+    ("⚠ Early phase trial - higher risk (-10)", -10),
+)
+STOP_FACTORS: Tuple[Tuple[str, int], ...] = (
+    ("", 0),
+    ("⚠ Stopped due to funding/business (-15)", -15),
+    ("✗ Poor enrollment history (-25)", -25),
+    ("✗ Safety concerns led to stop (-35)", -35),
+)
+STUDY_TYPE_FACTORS: Tuple[Tuple[str, int], ...] = (
+    ("", 0),
+    ("✓ Interventional study (+10)", 10),
+    ("✓ Observational study (+5)", 5),
+)
+
+# (min score, category, emoji), highest first
+CATEGORIES = (
+    (75, "High Success Probability", "🟢"),
+    (50, "Moderate Success Probability", "🟡"),
+    (0, "Lower Success Probability", "🔴"),
+)
+
+# Agent metadata key -> trial store column
+METADATA_COLUMNS = {
+    "status": "Overall Status",
+    "phase": "Phase",
+    "why_stopped": "Why Stopped",
+    "study_type": "Study type",
+}
+
+# Trial store column -> factor table, in the order factors are reported
+FACTOR_COLUMNS = {
+    "Status Factor": STATUS_FACTORS,
+    "Phase Factor": PHASE_FACTORS,
+    "Stop Factor": STOP_FACTORS,
+    "Study Type Factor": STUDY_TYPE_FACTORS,
+}
+SCORE_COLUMNS = ("Enrollment Score", "Enrollment Category") + tuple(FACTOR_COLUMNS)
+INPUT_COLUMNS = ("Overall Status", "Phase", "Why Stopped", "Study type")
+
+
+def category_for(score: int) -> Tuple[str, str]:
+    for threshold, category, emoji in CATEGORIES:
+        if score >= threshold:
+            return category, emoji
+    return CATEGORIES[-1][1], CATEGORIES[-1][2]
+
+
+def categories(score: np.ndarray) -> np.ndarray:
+    """Vectorised category_for over an array of scores."""
+    thresholds = [threshold for threshold, _, _ in CATEGORIES]
+    return np.select([score >= t for t in thresholds], [c for _, c, _ in CATEGORIES], default=CATEGORIES[-1][1])
+
+
+def _contains(values: np.ndarray, *needles: str) -> np.ndarray:
+    return np.array([any(n in v for n in needles) for v in values], dtype=bool)
+
+
+def _factor_codes(column: pd.Series, rules) -> np.ndarray:
+    """
+    Evaluate `rules(uniques) -> (conditions, codes)` once per distinct
+    lower-cased value and broadcast the codes back to every row.
+    """
+    lowered = column.fillna("").astype(str).str.lower()
+    codes, uniques = pd.factorize(lowered)
+    conditions, choices = rules(np.asarray(uniques, dtype=object))
+    per_unique = np.select(conditions, choices, default=0).astype(np.int8)
+    if not len(per_unique):
+        return np.zeros(len(column), dtype=np.int8)
+    return per_unique[codes]
+
+
+def _status_rules(v):
+    return [
+        _contains(v, "completed"),
+        _contains(v, "recruiting", "active"),
+        _contains(v, "terminated", "suspended", "withdrawn"),
+    ], [1, 2, 3]
+
+
+def _phase_rules(v):
+    return [
+        _contains(v, "phase 3", "phase iii"),
+        _contains(v, "phase 4", "phase iv"),
+        _contains(v, "phase 1", "phase i"),
+    ], [1, 2, 3]
+
+
+def _stop_rules(v):
+    # Stop reasons mentioning "not" anywhere are ignored, as in the scalar rule
+    considered = np.array([bool(s) and s != "n/a" and "not" not in s for s in v], dtype=bool)
+    return [
+        considered & _contains(v, "lack of funding", "business"),
+        considered & _contains(v, "enrollment", "accrual"),
+        considered & _contains(v, "safety", "adverse"),
+    ], [1, 2, 3]
+
+
+def _study_type_rules(v):
+    return [
+        _contains(v, "interventional"),
+        _contains(v, "observational"),
+    ], [1, 2]
+
+
+def score_trials(df: pd.DataFrame) -> pd.DataFrame:
+    """Score, category and factor codes for every row of df (missing input columns count as empty)."""
+    n = len(df)
+
+    def column(name):
+        return df[name].reset_index(drop=True) if name in df.columns else pd.Series([""] * n, dtype=object)
+
+    factors = {
+        "Status Factor": _factor_codes(column("Overall Status"), _status_rules),
+        "Phase Factor": _factor_codes(column("Phase"), _phase_rules),
+        "Stop Factor": _factor_codes(column("Why Stopped"), _stop_rules),
+        "Study Type Factor": _factor_codes(column("Study type"), _study_type_rules),
+    }
+    score = np.full(n, BASE_SCORE, dtype=np.int16)
+    for name, table in FACTOR_COLUMNS.items():
+        deltas = np.array([delta for _, delta in table], dtype=np.int16)
+        score += deltas[factors[name]]
+    score = np.clip(score, 0, 100)
+    return pd.DataFrame({
+        "Enrollment Score": score,
+        "Enrollment Category": categories(score),
+        **factors,
+    }, index=df.index)
+
+
+def prediction(score: int, factor_codes: Dict[str, int]) -> Dict[str, Any]:
+    """Rebuild the predict_enrollment_success result from stored columns."""
+    category, emoji = category_for(int(score))
+    factors = [FACTOR_COLUMNS[name][code][0] for name, code in factor_codes.items() if code]
+    return {"score": int(score), "category": category, "emoji": emoji, "factors": factors}
+
+
+def score_trial(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Prediction for one trial's agent metadata (status/phase/why_stopped/study_type keys)."""
+    row = pd.DataFrame({column: [metadata.get(key)] for key, column in METADATA_COLUMNS.items()})
+    scored = score_trials(row).iloc[0]
+    return prediction(scored["Enrollment Score"], {name: int(scored[name]) for name in FACTOR_COLUMNS})
+
+
+class EnrollmentScores:
+    """
+    Per-trial scores aligned with trial store row positions, held as arrays
+    (zero-copy views of the stored columns when the store has them).
+    """
+
+    def __init__(self, score: np.ndarray, codes: Dict[str, np.ndarray]):
+        self._score = score
+        self._codes = codes
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame) -> "EnrollmentScores":
+        return cls(frame["Enrollment Score"].to_numpy(), {name: frame[name].to_numpy() for name in FACTOR_COLUMNS})
+
+    @classmethod
+    def from_trials(cls, trials) -> "EnrollmentScores":
+        """Stored columns when the store has them, else scored now from the input columns."""
+        if all(name in trials.columns for name in SCORE_COLUMNS):
+            return cls(trials.column_array("Enrollment Score"), {name: trials.column_array(name) for name in FACTOR_COLUMNS})
+        available = set(trials.columns)
+        # score_trials treats absent input columns as empty
+        inputs = pd.DataFrame({name: trials.column(name) for name in INPUT_COLUMNS if name in available}, index=pd.RangeIndex(len(trials)))
+        return cls.from_frame(score_trials(inputs))
+
+    def __len__(self) -> int:
+        return len(self._score)
+
+    def prediction(self, pos: int) -> Optional[Dict[str, Any]]:
+        if not 0 <= pos < len(self._score):
+            return None
+        return prediction(self._score[pos], {name: int(codes[pos]) for name, codes in self._codes.items()})
+
+    def score_distribution(self, groups: Optional[Sequence[Any]] = None, min_trials: int = 1) -> pd.DataFrame:
+        """
+        Score statistics per group (e.g. the 'Disease' column) or for the whole
+        corpus: trial count, mean/median/quartiles and the share of each category.
+        """
+        score = np.asarray(self._score)
+        frame = pd.DataFrame({"Enrollment Score": score, "Enrollment Category": categories(score)})
+        frame["group"] = list(groups) if groups is not None else "all"
+        grouped = frame.groupby("group")["Enrollment Score"]
+        stats = grouped.describe()[["count", "mean", "25%", "50%", "75%", "min", "max"]]
+        stats = stats.rename(columns={"50%": "median"})
+        shares = pd.crosstab(frame["group"], frame["Enrollment Category"], normalize="index")
+        for _, category, _ in CATEGORIES:
+            stats[f"{category} share"] = shares[category] if category in shares.columns else 0.0
+        stats = stats[stats["count"] >= min_trials]
+        return stats.sort_values(["mean", "count"], ascending=[False, False])
+
+    def factor_counts(self) -> List[Tuple[str, int]]:
+        """How often each factor fires across the corpus, most frequent first."""
+        counts: List[Tuple[str, int]] = []
+        for name, table in FACTOR_COLUMNS.items():
+            fired = np.bincount(self._codes[name].astype(np.int64), minlength=len(table))
+            counts += [(table[code][0], int(fired[code])) for code in range(1, len(table))]
+        return sorted(counts, key=lambda item: -item[1])
@@ -10,10 +10,12 @@ from __future__ import annotations
 import asyncio
 import uuid
 import os
-from typing import Any, Dict, Optional
+from typing import Any, AsyncIterator, Dict, Optional
 
 from agents.reasoner_agent import ReasonerAgent
 from agents.reviewer_agent import ReviewerAgent
+from agents.review_policy import ReviewPolicy
+from gemini_client import StreamInterrupted
 from simple_dynamic_orchestrator import SimpleDynamicOrchestrator
 from storage.mongo_async import AsyncMongoStore
 
@@ -25,6 +27,7 @@ class HumanProxyAgent:
         store: Optional[AsyncMongoStore] = None,
         orchestrator: Optional[SimpleDynamicOrchestrator] = None,
         session_id: Optional[str] = None,
+        review_policy: Optional[ReviewPolicy] = None,
     ):
         self.llm = llm
         self.session_id = session_id or str(uuid.uuid4())
@@ -32,16 +35,59 @@ class HumanProxyAgent:
         self.orchestrator = orchestrator or SimpleDynamicOrchestrator(llm)
         self.reasoner = ReasonerAgent(llm)
         self.reviewer = ReviewerAgent(llm)
+        self.review_policy = review_policy or ReviewPolicy.from_env()
+        # "chain" = reason -> review -> revise; "fused" = one reason+self-review call
+        self.pipeline_mode = self._normalize_mode(os.getenv("PIPELINE_MODE", "chain"))
         # Snapshot cadence (every N turns). 1 = every turn
         try:
             self.snapshot_every = max(1, int(os.getenv("SNAPSHOT_EVERY", "1")))
         except Exception:
             self.snapshot_every = 1
         self._turn_counts: dict[str, int] = {}
+        # Prior messages fed to the reasoner (ReasonerAgent keeps the last 5)
+        try:
+            self.history_window = max(1, int(os.getenv("HISTORY_WINDOW", "5")))
+        except Exception:
+            self.history_window = 5
+
+    PIPELINE_MODES = ("chain", "fused")
+
+    @classmethod
+    def _normalize_mode(cls, mode: Optional[str]) -> str:
+        mode = (mode or "").strip().lower()
+        return mode if mode in cls.PIPELINE_MODES else "chain"
 
     # -------- async core --------
-    async def handle_user_prompt_async(self, prompt: str) -> Dict[str, Any]:
+    async def handle_user_prompt_async(self, prompt: str, pipeline_mode: Optional[str] = None) -> Dict[str, Any]:
+        result: Dict[str, Any] = {}
+        async for event in self._run_pipeline(prompt, stream=False, pipeline_mode=pipeline_mode):
+            if event["event"] == "done":
+                result = event["data"]
+        return result
+
+    async def stream_user_prompt(self, prompt: str, pipeline_mode: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Same pipeline as handle_user_prompt_async, yielding events as it goes:
+        "stage" after each step, "token" chunks of the answer while the reasoner
+        (and, if the reviewer asks for one, the revision) generates it, "reset"
+        when the tokens sent so far are superseded, "error" when an upstream
+        stream fails partway and a closing "done" event carrying the full /chat
+        payload. Callers that stop early should aclose() the iterator so the
+        Gemini stream (and its limiter slot) is released."""
+        events = self._run_pipeline(prompt, stream=True, pipeline_mode=pipeline_mode)
+        try:
+            async for event in events:
+                yield event
+        finally:
+            await events.aclose()
+
+    @staticmethod
+    def _stage(name: str, **data: Any) -> Dict[str, Any]:
+        return {"event": "stage", "data": {"stage": name, **data}}
+
+    async def _run_pipeline(self, prompt: str, stream: bool, pipeline_mode: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
         sid = self.session_id
+        mode = self._normalize_mode(pipeline_mode) if pipeline_mode else self.pipeline_mode
+        yield self._stage("received", session_id=sid, pipeline_mode=mode)
         # 1) log user prompt
         try:
             await self.store.log_event(sid, event="user_prompt", agent_name="user", content={"prompt": prompt}, status="received")
@@ -50,40 +96,111 @@ class HumanProxyAgent:
             # Storage failures should not block the conversation
             pass
 
-        # 2) orchestrate specialized agents
-        agent_results = self.orchestrator.process_query(prompt)
+        # 2) orchestrate specialized agents (off the event loop)
+        agent_results = await self.orchestrator.aprocess_query(prompt)
         try:
             await self.store.log_event(sid, event="orchestrator_results", agent_name="orchestrator", content=agent_results, status=agent_results.get("status", "ok"))
         except Exception:
             pass
+        yield self._stage("orchestrated", status=agent_results.get("status"), activated_agents=agent_results.get("activated_agents", []))
 
         # 3) build context for reasoner and fetch prior history
         try:
-            history = await self.store.get_session_history(sid)
+            history = await self.store.get_recent_history(sid, limit=self.history_window)
         except Exception:
             history = []
-        reasoner_out = self.reasoner.reason(prompt, agent_results, history)
+        review: Optional[Dict[str, Any]] = None
+        streamed = ""
+        if stream:
+            # Forward the answer as the reasoner writes it
+            reasoning = self.reasoner.astream_reason(prompt, agent_results, history, fused=mode == "fused")
+            try:
+                async for kind, payload in reasoning:
+                    if kind == "token":
+                        streamed += payload
+                        yield {"event": "token", "data": payload}
+                    elif kind == "error":
+                        yield {"event": "error", "data": {"stage": "reasoning", "detail": payload}}
+                        if streamed:
+                            streamed = ""
+                            yield {"event": "reset", "data": {"reason": "stream_interrupted"}}
+                    else:
+                        reasoner_out, review = payload
+            finally:
+                await reasoning.aclose()
+        elif mode == "fused":
+            reasoner_out, review = await self.reasoner.areason_and_review(prompt, agent_results, history)
+        else:
+            reasoner_out = await self.reasoner.areason(prompt, agent_results, history)
         try:
             await self.store.log_event(sid, event="reasoner_output", agent_name="ReasonerAgent", content=reasoner_out, status="ok")
         except Exception:
             pass
+        yield self._stage("reasoned", confidence=reasoner_out.get("confidence"))
 
-        # 4) review before finalizing
-        review = self.reviewer.review(prompt, reasoner_out)
+        # 4) review before finalizing (unless the review policy lets this turn through).
+        # In fused mode the self-review stands in for ReviewerAgent when it parsed;
+        # a missing or malformed one falls back to the separate review call.
+        self_review = review if mode == "fused" else None
+        decision = self.review_policy.decide(reasoner_out, agent_results)
+        try:
+            await self.store.log_event(sid, event="review_policy", agent_name="HumanProxyAgent", content=decision, status="review" if decision["review"] else "skipped")
+        except Exception:
+            pass
+        if not decision["review"]:
+            review = ReviewPolicy.skipped_review(decision)
+            if self_review is not None:
+                review["self_review"] = self_review
+        elif self_review is not None:
+            review = self_review
+            review["policy"] = decision
+        else:
+            review = await self.reviewer.areview(prompt, reasoner_out)
+            review["policy"] = decision
+            if mode == "fused":
+                review["mode"] = "fused_fallback"
+        reviewed_by = "ReasonerAgent" if self_review is not None and review is self_review else "ReviewerAgent"
         try:
-            await self.store.log_event(sid, event="review", agent_name="ReviewerAgent", content=review, status=review.get("status", "ok"))
+            await self.store.log_event(sid, event="review", agent_name=reviewed_by, content=review, status=review.get("status", "ok"))
         except Exception:
             pass
+        yield self._stage("reviewed", status=review.get("status"))
 
         final_answer = reasoner_out.get("answer", "")
+        # The fused prompt already applies its own fixes, so a fused "needs_revision"
+        # means issues remained; both modes then get one revision pass
         if review.get("status") == "needs_revision":
             suggestions = review.get("suggestions", [])
-            revised = self.reasoner.revise(final_answer, suggestions)
+            if stream:
+                # The revised answer replaces the draft streamed above
+                yield {"event": "reset", "data": {"reason": "revision"}}
+                chunks = []
+                revision = self.reasoner.astream_revision(final_answer, suggestions)
+                try:
+                    async for chunk in revision:
+                        chunks.append(chunk)
+                        yield {"event": "token", "data": chunk}
+                    revised = "".join(chunks)
+                except StreamInterrupted as e:
+                    # Keep the reviewed draft rather than a truncated revision
+                    yield {"event": "error", "data": {"stage": "revision", "detail": str(e)}}
+                    yield {"event": "reset", "data": {"reason": "stream_interrupted"}}
+                    yield {"event": "token", "data": final_answer}
+                    revised = ""
+                finally:
+                    await revision.aclose()
+            else:
+                revised = await self.reasoner.arevise(final_answer, suggestions)
             final_answer = revised or final_answer
             try:
                 await self.store.log_event(sid, event="revision_applied", agent_name="ReasonerAgent", content={"suggestions": suggestions, "revised": final_answer}, status="ok")
             except Exception:
                 pass
+        elif stream and streamed != final_answer:
+            # Non-JSON output, cache hit or fallback: the answer was not (fully) streamed
+            if streamed:
+                yield {"event": "reset", "data": {"reason": "answer_mismatch"}}
+            yield {"event": "token", "data": final_answer}
 
         # 5) save assistant message & snapshot
         try:
@@ -91,6 +208,7 @@ class HumanProxyAgent:
             "activated_agents": agent_results.get("activated_agents", []),
             "reasoner": reasoner_out,
             "review": review,
+            "pipeline_mode": mode,
         })
             # Increment turn count and snapshot conditionally
             self._turn_counts[sid] = self._turn_counts.get(sid, 0) + 1
@@ -99,13 +217,14 @@ class HumanProxyAgent:
         except Exception:
             pass
 
-        return {
+        yield {"event": "done", "data": {
             "session_id": sid,
             "final_output": final_answer,
             "review": review,
             "reasoner": reasoner_out,
             "agent_results": agent_results,
-        }
+            "pipeline_mode": mode,
+        }}
 
     # -------- sync wrapper for ease-of-use in existing code --------
     def handle_user_prompt(self, prompt: str) -> Dict[str, Any]:
@@ -132,3 +251,8 @@ class HumanProxyAgent:
         audits = await self.store.get_audit_logs(sid)
         # A simple replay returns ordered events; a full re-execution could be implemented if needed
         return {"session_id": sid, "events": audits}
+
+    async def restore_session(self, session_id: Optional[str] = None) -> Dict[str, Any]:
+        sid = session_id or self.session_id
+        # Rebuilt from the latest checkpoint plus incremental deltas in `backups`
+        return await self.store.restore_session(sid)
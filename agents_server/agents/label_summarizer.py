@@ -0,0 +1,196 @@
+"""
+LabelSummarizer
+ - Trims FDA label sections before they are put into a Safety Agent prompt
+ - Splits each section into sentences and keeps the highest-ranked ones
+   (severity terms, frequencies, query terms, position) up to a per-section
+   token budget, with a total budget shared across all labels
+ - Drops boilerplate that repeats across labels (reporting hotlines,
+   "see full prescribing information", identical sentences from generics)
+ - Reports original vs. prompt tokens for each call
+
+Environment variables:
+- LABEL_SECTION_TOKENS: max tokens kept per label section (default 250)
+- LABEL_TOTAL_TOKENS: max label tokens per prompt (default 3000)
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from llm_concurrency import estimate_tokens
+
+# Most safety-critical sections first; they are served first from the total budget
+SECTION_PRIORITY = (
+    "boxed_warning",
+    "contraindications",
+    "warnings",
+    "indications",
+    "adverse_reactions",
+    "drug_interactions",
+    "precautions",
+)
+
+SECTION_LABELS = {
+    "boxed_warning": "Boxed warning",
+    "contraindications": "Contraindications",
+    "warnings": "Warnings",
+    "indications": "Indications",
+    "adverse_reactions": "Adverse reactions",
+    "drug_interactions": "Drug interactions",
+    "precautions": "Precautions",
+}
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.;!?])\s+(?=[A-Z0-9(\[•])")
+# Leading "6 ADVERSE REACTIONS" style headings
+_SECTION_HEADING = re.compile(r"^\s*(\d+(\.\d+)*\s+)?([A-Z][A-Z&,/\-]+\s+)+(?=[A-Z][a-z])")
+_FREQUENCY = re.compile(r"\d+(\.\d+)?\s*%|\b(most common|incidence|frequen)", re.IGNORECASE)
+_SEVERITY = re.compile(
+    r"\b(fatal|death|life-threatening|serious|severe|boxed|contraindicated|do not (use|take)|"
+    r"avoid|discontinue|hepatotoxicity|anaphyla|bleeding|suicid|overdose|pregnan|monitor)",
+    re.IGNORECASE,
+)
+_BOILERPLATE = re.compile(
+    r"to report suspected adverse reactions|www\.fda\.gov/medwatch|1-800-fda-1088|"
+    r"see full prescribing information|because clinical trials are conducted under widely varying|"
+    r"keep out of reach of children|ask a doctor or pharmacist",
+    re.IGNORECASE,
+)
+_CROSS_REFERENCE = re.compile(r"\s*(\[see [^\]]*\]|\(see [^)]*\))", re.IGNORECASE)
+_WORD = re.compile(r"[a-z][a-z0-9\-]{2,}")
+
+
+def _sentences(paragraphs: List[str]) -> List[str]:
+    text = " ".join(_SECTION_HEADING.sub("", " ".join(p.split())) for p in paragraphs)
+    text = _CROSS_REFERENCE.sub("", text)
+    return [s.strip() for s in _SENTENCE_SPLIT.split(text) if s.strip()]
+
+
+def _fingerprint(sentence: str) -> str:
+    return hashlib.md5(" ".join(_WORD.findall(sentence.lower())).encode("utf-8")).hexdigest()
+
+
+class LabelSummarizer:
+    def __init__(self, section_tokens: int = 250, total_tokens: int = 3000):
+        self.section_tokens = max(1, int(section_tokens))
+        self.total_tokens = max(1, int(total_tokens))
+        self.last_report: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_env(cls) -> "LabelSummarizer":
+        try:
+            section_tokens = int(os.getenv("LABEL_SECTION_TOKENS", "250"))
+            total_tokens = int(os.getenv("LABEL_TOTAL_TOKENS", "3000"))
+        except Exception:
+            section_tokens, total_tokens = 250, 3000
+        return cls(section_tokens=section_tokens, total_tokens=total_tokens)
+
+    # ---------- ranking ----------
+    @staticmethod
+    def _score(sentence: str, position: int, query_terms: set) -> float:
+        score = 1.0 / (1 + position)  # labels lead with the most important statements
+        score += 2.0 * len(_SEVERITY.findall(sentence))
+        if _FREQUENCY.search(sentence):
+            score += 1.5
+        if query_terms:
+            score += 1.0 * len(query_terms & set(_WORD.findall(sentence.lower())))
+        # Very long sentences are usually tables flattened into prose
+        return score / (1 + len(sentence) / 600)
+
+    def _trim_section(self, paragraphs: List[str], budget: int, seen: set, query_terms: set) -> Tuple[str, int]:
+        """Best sentences of one section within budget; returns (text, deduped count)."""
+        candidates = []
+        deduped = 0
+        for position, sentence in enumerate(_sentences(paragraphs)):
+            if _BOILERPLATE.search(sentence):
+                deduped += 1
+                continue
+            fp = _fingerprint(sentence)
+            if fp in seen:
+                deduped += 1
+                continue
+            seen.add(fp)
+            candidates.append((self._score(sentence, position, query_terms), position, sentence))
+
+        kept = []
+        used = 0
+        for _, position, sentence in sorted(candidates, key=lambda c: (-c[0], c[1])):
+            cost = estimate_tokens(sentence)
+            if used + cost > budget:
+                if not kept and budget >= 16:
+                    # Always keep the top sentence, cut to the budget
+                    kept.append((position, sentence[: budget * 4].rstrip() + "..."))
+                    used = budget
+                continue
+            kept.append((position, sentence))
+            used += cost
+        # Restore label order so the excerpt still reads naturally
+        return " ".join(s for _, s in sorted(kept)), deduped
+
+    # ---------- public API ----------
+    def summarize(self, records: List[Dict[str, Any]], query: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Trim the SECTION_PRIORITY fields of each record (lists of label
+        paragraphs, as returned by openFDA) to budgeted strings. Other fields
+        are passed through. The per-call token report is kept in last_report.
+        """
+        query_terms = set(_WORD.findall((query or "").lower()))
+        jobs = []
+        for index, record in enumerate(records):
+            for field in SECTION_PRIORITY:
+                value = record.get(field)
+                paragraphs = [str(v) for v in value if v] if isinstance(value, list) else ([str(value)] if value else [])
+                if paragraphs:
+                    jobs.append((SECTION_PRIORITY.index(field), index, field, paragraphs))
+        # Serve every label's boxed warnings before anyone's precautions
+        jobs.sort(key=lambda j: (j[0], j[1]))
+
+        summaries = [{k: v for k, v in record.items() if k not in SECTION_PRIORITY} for record in records]
+        seen: set = set()
+        original = kept = deduped = 0
+        remaining = self.total_tokens
+        for n, (_, index, field, paragraphs) in enumerate(jobs):
+            original += sum(estimate_tokens(p) for p in paragraphs)
+            budget = min(self.section_tokens, remaining // max(1, len(jobs) - n))
+            trimmed, dropped = self._trim_section(paragraphs, budget, seen, query_terms)
+            deduped += dropped
+            if trimmed:
+                summaries[index][field] = trimmed
+                cost = estimate_tokens(trimmed)
+                kept += cost
+                remaining = max(0, remaining - cost)
+
+        self.last_report = {
+            "labels": len(records),
+            "sections": len(jobs),
+            "original_tokens": original,
+            "prompt_tokens": kept,
+            "tokens_saved": max(0, original - kept),
+            "deduped_sentences": deduped,
+        }
+        print(
+            f"Label summarizer: {original} -> {kept} tokens "
+            f"({self.last_report['tokens_saved']} saved, {deduped} duplicate/boilerplate sentences dropped)"
+        )
+        return summaries
+
+    @staticmethod
+    def render(summaries: Iterable[Dict[str, Any]], name_fields: Iterable[str] = ()) -> str:
+        """Compact text block for a prompt (instead of a dict repr)."""
+        name_fields = tuple(name_fields)
+        blocks = []
+        for summary in summaries:
+            lines = []
+            for field, value in summary.items():
+                if field in SECTION_PRIORITY or not value:
+                    continue
+                if isinstance(value, list):
+                    value = ", ".join(str(v) for v in value)
+                title = field.replace("_", " ").capitalize()
+                lines.append(f"### {value}" if field in name_fields else f"- {title}: {value}")
+            for field in SECTION_PRIORITY:
+                if summary.get(field):
+                    lines.append(f"- {SECTION_LABELS[field]}: {summary[field]}")
+            blocks.append("\n".join(lines))
+        return "\n\n".join(blocks)
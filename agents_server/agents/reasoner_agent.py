@@ -6,7 +6,10 @@ ReasonerAgent
 from __future__ import annotations
 
 import json
-from typing import Any, Dict, List, Optional
+import re
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from gemini_client import StreamInterrupted
 
 def _extract_json(text: str) -> str:
     """Extract a JSON object from raw LLM output.
@@ -27,6 +30,50 @@ def _extract_json(text: str) -> str:
     return text
 
 
+class _AnswerStream:
+    """Decodes the "answer" string of a streamed reasoner JSON object as it
+    arrives, so its text can be forwarded before the object is complete."""
+
+    _KEY = re.compile(r'"answer"\s*:\s*"')
+
+    def __init__(self):
+        self.raw = ""
+        self._pos: Optional[int] = None  # next undecoded index inside the string
+        self.closed = False
+
+    def feed(self, chunk: str) -> str:
+        self.raw += chunk
+        if self.closed:
+            return ""
+        if self._pos is None:
+            match = self._KEY.search(self.raw)
+            if not match:
+                return ""
+            self._pos = match.end()
+        start = i = self._pos
+        n = len(self.raw)
+        while i < n:
+            c = self.raw[i]
+            if c == '"':
+                self.closed = True
+                break
+            if c == '\\':
+                # Only decode complete escapes; \uD800-\uDBFF needs its low surrogate too
+                width = 2
+                if self.raw[i + 1:i + 2] == "u":
+                    width = 12 if self.raw[i + 2:i + 4].lower() in ("d8", "d9", "da", "db") else 6
+                if i + width > n:
+                    break
+                i += width
+            else:
+                i += 1
+        self._pos = i + 1 if self.closed else i
+        try:
+            return json.loads('"' + self.raw[start:i] + '"', strict=False)
+        except ValueError:
+            return ""
+
+
 class ReasonerAgent:
     def __init__(self, llm):
         self.llm = llm
@@ -86,9 +133,25 @@ Important:
 """
         return prompt
 
-    def reason(self, user_prompt: str, context: Dict[str, Any], history: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
-        prompt = self._build_prompt(user_prompt, context, history)
-        raw = self.llm.generate(prompt, max_tokens=1200, temperature=0.4)
+    def _build_fused_prompt(self, user_prompt: str, context: Dict[str, Any], history: Optional[List[Dict[str, Any]]] = None) -> str:
+        """Reasoner prompt extended with a self-review block so answer and review come back in one call."""
+        return self._build_prompt(user_prompt, context, history) + """
+Before returning, review your own answer as a factuality and clarity reviewer for clinical-trial assistant responses:
+- Flag unsupported claims, unclear phrasing, or inconsistencies.
+- If you find issues, fix them in "answer" and list what you fixed.
+
+Add a "review" key to the same JSON object with this exact schema:
+"review": {
+  "status": "approved" | "needs_revision",   // "needs_revision" only if issues remain after your fixes
+  "issues": [string, ...],
+  "suggestions": [string, ...],
+  "quality": "low" | "medium" | "high",
+  "consistency": "low" | "medium" | "high",
+  "safety_notes": string
+}
+"""
+
+    def _parse_reasoning(self, raw: str, context: Dict[str, Any]) -> Dict[str, Any]:
         try:
             data = json.loads(_extract_json(raw))
         except Exception:
@@ -103,8 +166,8 @@ Important:
             }
         return data
 
-    def revise(self, current_answer: str, suggestions: List[str]) -> str:
-        prompt = f"""
+    def _build_revision_prompt(self, current_answer: str, suggestions: List[str]) -> str:
+        return f"""
 Revise the following answer to improve accuracy, clarity, and consistency based on reviewer suggestions.
 
 CURRENT_ANSWER:\n{current_answer}
@@ -113,4 +176,82 @@ REVIEWER_SUGGESTIONS:\n{json.dumps(suggestions, ensure_ascii=False)}
 
 Return only the revised answer text.
 """
+
+    def reason(self, user_prompt: str, context: Dict[str, Any], history: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        prompt = self._build_prompt(user_prompt, context, history)
+        raw = self.llm.generate(prompt, max_tokens=1200, temperature=0.4)
+        return self._parse_reasoning(raw, context)
+
+    async def areason(self, user_prompt: str, context: Dict[str, Any], history: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        prompt = self._build_prompt(user_prompt, context, history)
+        raw = await self.llm.agenerate(prompt, max_tokens=1200, temperature=0.4)
+        return self._parse_reasoning(raw, context)
+
+    REVIEW_STATUSES = ("approved", "needs_revision")
+
+    def _split_fused(self, raw: str, context: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        """Split a fused response into (reasoner_output, self_review). The review is
+        None when it is missing or malformed, so the caller can fall back to
+        ReviewerAgent instead of treating the answer as approved."""
+        data = self._parse_reasoning(raw, context)
+        review = data.pop("review", None)
+        if not isinstance(review, dict) or review.get("status") not in self.REVIEW_STATUSES:
+            return data, None
+        review.setdefault("issues", [])
+        review.setdefault("suggestions", [])
+        review["mode"] = "fused"
+        return data, review
+
+    async def areason_and_review(self, user_prompt: str, context: Dict[str, Any], history: Optional[List[Dict[str, Any]]] = None) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        """Single structured call returning (reasoner_output, self_review) in the
+        same shapes as areason() and ReviewerAgent.areview(); self_review is
+        None when the model's review block could not be parsed."""
+        prompt = self._build_fused_prompt(user_prompt, context, history)
+        raw = await self.llm.agenerate(prompt, max_tokens=1600, temperature=0.3)
+        return self._split_fused(raw, context)
+
+    async def astream_reason(self, user_prompt: str, context: Dict[str, Any], history: Optional[List[Dict[str, Any]]] = None, fused: bool = False) -> AsyncIterator[Tuple[str, Any]]:
+        """Streamed areason() / areason_and_review(). Yields ("token", text) as the
+        "answer" field is generated, ("error", detail) if the stream breaks
+        partway (the answer is then regenerated without streaming, so tokens
+        already sent must be discarded), and finally ("result", (reasoner_output,
+        review)) where review is None unless fused."""
+        prompt = self._build_fused_prompt(user_prompt, context, history) if fused else self._build_prompt(user_prompt, context, history)
+        max_tokens, temperature = (1600, 0.3) if fused else (1200, 0.4)
+        answer = _AnswerStream()
+        stream = self.llm.astream(prompt, max_tokens=max_tokens, temperature=temperature)
+        try:
+            async for chunk in stream:
+                text = answer.feed(chunk)
+                if text:
+                    yield "token", text
+        except StreamInterrupted as e:
+            yield "error", str(e)
+            if fused:
+                yield "result", await self.areason_and_review(user_prompt, context, history)
+            else:
+                yield "result", (await self.areason(user_prompt, context, history), None)
+            return
+        finally:
+            await stream.aclose()
+        if fused:
+            yield "result", self._split_fused(answer.raw, context)
+        else:
+            yield "result", (self._parse_reasoning(answer.raw, context), None)
+
+    def revise(self, current_answer: str, suggestions: List[str]) -> str:
+        prompt = self._build_revision_prompt(current_answer, suggestions)
         return self.llm.generate(prompt, max_tokens=800, temperature=0.3)
+
+    async def arevise(self, current_answer: str, suggestions: List[str]) -> str:
+        prompt = self._build_revision_prompt(current_answer, suggestions)
+        return await self.llm.agenerate(prompt, max_tokens=800, temperature=0.3)
+
+    async def astream_revision(self, current_answer: str, suggestions: List[str]) -> AsyncIterator[str]:
+        prompt = self._build_revision_prompt(current_answer, suggestions)
+        stream = self.llm.astream(prompt, max_tokens=800, temperature=0.3)
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
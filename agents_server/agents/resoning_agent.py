@@ -3,10 +3,7 @@ class ReasoningAgent:
     def __init__(self, llm):
         self.llm = llm
 
-    def synthesize(self, reports):
-        """
-        Synthesize multiple agent reports into a comprehensive patient-friendly summary
-        """
+    def _build_prompt(self, reports):
         # Build the reports section dynamically based on available reports
         report_sections = []
         
@@ -59,4 +56,16 @@ class ReasoningAgent:
         - Make actionable recommendations when possible
         """
         
-        return self.llm.generate(prompt, max_tokens=3000, temperature=0.7)
+        return prompt
+
+    def synthesize(self, reports):
+        """
+        Synthesize multiple agent reports into a comprehensive patient-friendly summary
+        """
+        return self.llm.generate(self._build_prompt(reports), max_tokens=3000, temperature=0.7)
+
+    async def asynthesize(self, reports):
+        """
+        Async variant of synthesize() for callers running on an event loop
+        """
+        return await self.llm.agenerate(self._build_prompt(reports), max_tokens=3000, temperature=0.7)
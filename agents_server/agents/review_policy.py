@@ -0,0 +1,92 @@
+"""
+ReviewPolicy
+ - Decides whether a ReasonerAgent answer goes through ReviewerAgent
+ - Modes: always | never | sampled (REVIEW_SAMPLE_RATE) | rules
+ - Rules skip review for trivially-routed (general-only) turns and for short,
+   high-confidence answers from a fully successful orchestration
+
+Environment variables:
+- REVIEW_POLICY: mode (default: always)
+- REVIEW_SAMPLE_RATE: fraction of turns reviewed in "sampled" mode (default 0.2)
+- REVIEW_MAX_ANSWER_CHARS: "rules" mode reviews answers longer than this (default 1500)
+- REVIEW_SKIP_CONFIDENCE: comma-separated confidences that may skip review (default high)
+- REVIEW_SKIP_AGENTS: comma-separated agents whose answers may skip review (default general)
+"""
+from __future__ import annotations
+
+import os
+import random
+from typing import Any, Dict, Iterable, Optional
+
+
+class ReviewPolicy:
+    MODES = ("always", "never", "sampled", "rules")
+
+    def __init__(
+        self,
+        mode: str = "always",
+        sample_rate: float = 0.2,
+        max_answer_chars: int = 1500,
+        skip_confidence: Iterable[str] = ("high",),
+        skip_agents: Iterable[str] = ("general",),
+    ):
+        mode = (mode or "always").strip().lower()
+        self.mode = mode if mode in self.MODES else "always"
+        self.sample_rate = min(1.0, max(0.0, float(sample_rate)))
+        self.max_answer_chars = int(max_answer_chars)
+        self.skip_confidence = {c.strip().lower() for c in skip_confidence if c.strip()}
+        self.skip_agents = {a.strip().lower() for a in skip_agents if a.strip()}
+
+    @classmethod
+    def from_env(cls) -> "ReviewPolicy":
+        try:
+            sample_rate = float(os.getenv("REVIEW_SAMPLE_RATE", "0.2"))
+            max_answer_chars = int(os.getenv("REVIEW_MAX_ANSWER_CHARS", "1500"))
+        except Exception:
+            sample_rate, max_answer_chars = 0.2, 1500
+        return cls(
+            mode=os.getenv("REVIEW_POLICY", "always"),
+            sample_rate=sample_rate,
+            max_answer_chars=max_answer_chars,
+            skip_confidence=os.getenv("REVIEW_SKIP_CONFIDENCE", "high").split(","),
+            skip_agents=os.getenv("REVIEW_SKIP_AGENTS", "general").split(","),
+        )
+
+    def decide(self, reasoner_out: Dict[str, Any], agent_results: Dict[str, Any], mode: Optional[str] = None) -> Dict[str, Any]:
+        """Return {"review": bool, "mode": str, "reason": str}."""
+        mode = (mode or self.mode).strip().lower()
+        if mode == "never":
+            return {"review": False, "mode": mode, "reason": "policy disabled review"}
+        if mode == "sampled":
+            sampled = random.random() < self.sample_rate
+            return {"review": sampled, "mode": mode, "reason": f"sampled at {self.sample_rate:.0%}" if sampled else "not sampled"}
+        if mode != "rules":
+            return {"review": True, "mode": "always", "reason": "policy requires review"}
+
+        status = agent_results.get("status", "success")
+        if status != "success":
+            return {"review": True, "mode": mode, "reason": f"orchestrator status {status}"}
+
+        activated = {str(a).lower() for a in agent_results.get("activated_agents", [])}
+        if activated and activated <= self.skip_agents:
+            return {"review": False, "mode": mode, "reason": f"trivially routed to {', '.join(sorted(activated))}"}
+
+        confidence = str(reasoner_out.get("confidence", "")).lower()
+        answer = reasoner_out.get("answer", "") or ""
+        if confidence in self.skip_confidence and len(answer) <= self.max_answer_chars:
+            return {"review": False, "mode": mode, "reason": f"{confidence} confidence, {len(answer)} chars"}
+
+        return {"review": True, "mode": mode, "reason": f"{confidence or 'unknown'} confidence, {len(answer)} chars"}
+
+    @staticmethod
+    def skipped_review(decision: Dict[str, Any]) -> Dict[str, Any]:
+        """Review-shaped placeholder for turns that bypass ReviewerAgent."""
+        return {
+            "status": "skipped",
+            "issues": [],
+            "suggestions": [],
+            "quality": None,
+            "consistency": None,
+            "safety_notes": "",
+            "policy": decision,
+        }
@@ -13,7 +13,7 @@ class ReviewerAgent:
     def __init__(self, llm):
         self.llm = llm
 
-    def review(self, user_prompt: str, reasoner_output: Dict[str, Any]) -> Dict[str, Any]:
+    def _build_prompt(self, user_prompt: str, reasoner_output: Dict[str, Any]) -> str:
         draft = reasoner_output.get("answer", "")
         steps = reasoner_output.get("steps", [])
         citations = reasoner_output.get("citations", [])
@@ -45,7 +45,10 @@ Guidelines:
 - Flag unsupported claims, unclear phrasing, or inconsistencies.
 - Prefer "approved" only if issues are minor.
 """
-        raw = self.llm.generate(prompt, max_tokens=600, temperature=0.2)
+        return prompt
+
+    @staticmethod
+    def _parse_review(raw: str) -> Dict[str, Any]:
         try:
             data = json.loads(raw)
         except Exception:
@@ -58,3 +61,13 @@ Guidelines:
                 "safety_notes": ""
             }
         return data
+
+    def review(self, user_prompt: str, reasoner_output: Dict[str, Any]) -> Dict[str, Any]:
+        prompt = self._build_prompt(user_prompt, reasoner_output)
+        raw = self.llm.generate(prompt, max_tokens=600, temperature=0.2)
+        return self._parse_review(raw)
+
+    async def areview(self, user_prompt: str, reasoner_output: Dict[str, Any]) -> Dict[str, Any]:
+        prompt = self._build_prompt(user_prompt, reasoner_output)
+        raw = await self.llm.agenerate(prompt, max_tokens=600, temperature=0.2)
+        return self._parse_review(raw)
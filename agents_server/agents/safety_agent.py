@@ -1,62 +1,205 @@
 # agents/safety_agent.py
-import requests
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from openfda_client import OpenFDAClient
+from storage.label_store import LabelStore
 from .base_agent import LLMAgent
+from .label_summarizer import LabelSummarizer
 
 class SafetyAgent(LLMAgent):
-    def __init__(self, llm, fda_api_key=None):
+    # api = live openFDA only; local = bulk-dump store only; auto = local store, live API as fallback
+    LABEL_BACKENDS = ("api", "local", "auto")
+
+    def __init__(self, llm, fda_api_key=None, fda_client=None, label_backend=None, label_store=None, summarizer=None):
         super().__init__("Safety", "Analyze drug safety data", llm)
         self.api_key = fda_api_key
-        self.base_url = "https://api.fda.gov/drug/label.json"
+        # Pooled keep-alive client with timeouts and retry/backoff on 429/5xx
+        self.fda = fda_client or OpenFDAClient(api_key=fda_api_key)
+        self.base_url = self.fda.base_url
+        backend = (label_backend or os.getenv("FDA_LABEL_BACKEND", "auto")).strip().lower()
+        self.label_backend = backend if backend in self.LABEL_BACKENDS else "auto"
+        self.labels = label_store
+        if self.labels is None and self.label_backend != "api":
+            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            db_path = os.getenv("FDA_LABEL_DB") or os.path.join(base_dir, "datasets", "openfda_labels.db")
+            self.labels = LabelStore.open_existing(db_path)
+            if self.labels is None and self.label_backend == "local":
+                print(f"FDA_LABEL_BACKEND=local but no label store at {db_path}; run scripts/load_openfda_labels.py")
+        # Ranks and trims label sections to a token budget before prompting
+        self.summarizer = summarizer or LabelSummarizer.from_env()
+        # Bounded fan-out for multi-drug lookups; never more than the HTTP pool can serve
+        try:
+            fanout = int(os.getenv("SAFETY_FANOUT_CONCURRENCY", "8"))
+        except Exception:
+            fanout = 8
+        self.fanout_concurrency = max(1, min(fanout, getattr(self.fda, "pool_size", fanout)))
+        self._fanout_executor = None
 
-    def fetch_safety_data(self, drug_name, limit=1):
-        """Fetch safety data for a specific drug"""
+    def _local_lookup(self, method, term, limit):
+        """Query the local store; returns None when the live API should be used instead."""
+        if self.label_backend == "api" or self.labels is None:
+            return [] if self.label_backend == "local" else None
+        try:
+            results = getattr(self.labels, method)(term, limit)
+        except Exception as e:
+            print(f"Local label store query failed: {e}")
+            return [] if self.label_backend == "local" else None
+        if results or self.label_backend == "local":
+            print(f"Local label store returned {len(results)} results for '{term}'")
+            return results
+        return None
+
+    @staticmethod
+    def _drug_params(drug_name, limit):
         # Clean the drug name for better API search
         clean_drug_name = drug_name.strip().lower()
-        
-        params = {
+        return {
             'search': f'openfda.generic_name:"{clean_drug_name}" OR openfda.brand_name:"{clean_drug_name}"',
             'limit': limit
         }
-        
+
+    @staticmethod
+    def _disease_params(disease, limit):
+        return {
+            'search': f'indications_and_usage:"{disease}" OR purpose:"{disease}"',
+            'limit': limit
+        }
+
+    @staticmethod
+    def _drug_results(response, drug_name):
+        print(f"FDA API Request URL: {response.url}")
+        if response.status_code == 200:
+            results = (response.data or {}).get("results", [])
+            print(f"FDA API returned {len(results)} results for '{drug_name}'")
+            return results
+        elif response.status_code == 404:
+            print(f"FDA API: No data found for drug '{drug_name}'")
+            return []
+        else:
+            print(f"FDA API request failed with status code: {response.status_code}")
+            print(f"Response: {response.text[:200]}...")
+            return []
+
+    @staticmethod
+    def _disease_results(response):
+        if response.status_code == 200:
+            return (response.data or {}).get("results", [])
+        print(f"FDA API request failed with status code: {response.status_code}")
+        return []
+
+    def fetch_safety_data(self, drug_name, limit=1):
+        """Fetch safety data for a specific drug"""
+        local = self._local_lookup("search_drug", drug_name, limit)
+        if local is not None:
+            return local
         try:
-            response = requests.get(self.base_url, params=params)
-            print(f"FDA API Request URL: {response.url}")
-            
-            if response.status_code == 200:
-                data = response.json()
-                results = data.get("results", [])
-                print(f"FDA API returned {len(results)} results for '{drug_name}'")
-                return results
-            elif response.status_code == 404:
-                print(f"FDA API: No data found for drug '{drug_name}'")
-                return []
-            else:
-                print(f"FDA API request failed with status code: {response.status_code}")
-                print(f"Response: {response.text[:200]}...")
-                return []
+            response = self.fda.search(self._drug_params(drug_name, limit))
+            return self._drug_results(response, drug_name)
+        except Exception as e:
+            print(f"Error fetching FDA data: {e}")
+            return []
+
+    async def afetch_safety_data(self, drug_name, limit=1):
+        """Async variant of fetch_safety_data"""
+        # Local FTS lookups take milliseconds; no need to leave the loop
+        local = self._local_lookup("search_drug", drug_name, limit)
+        if local is not None:
+            return local
+        try:
+            response = await self.fda.asearch(self._drug_params(drug_name, limit))
+            return self._drug_results(response, drug_name)
         except Exception as e:
             print(f"Error fetching FDA data: {e}")
             return []
 
+    @staticmethod
+    def _unique_names(drug_names):
+        """Drop blanks and case-insensitive duplicates, keeping the first spelling."""
+        seen = set()
+        names = []
+        for name in drug_names:
+            key = (name or "").strip().lower()
+            if key and key not in seen:
+                seen.add(key)
+                names.append(name.strip())
+        return names
+
+    def fetch_safety_data_many(self, drug_names, limit=1):
+        """
+        Fetch labels for several drugs concurrently (at most fanout_concurrency
+        lookups in flight). Returns {drug_name: results} in input order.
+        """
+        names = self._unique_names(drug_names)
+        if len(names) < 2 or self.fanout_concurrency < 2:
+            return {name: self.fetch_safety_data(name, limit) for name in names}
+        if self._fanout_executor is None:
+            self._fanout_executor = ThreadPoolExecutor(max_workers=self.fanout_concurrency, thread_name_prefix="fda")
+        futures = [self._fanout_executor.submit(self.fetch_safety_data, name, limit) for name in names]
+        merged = {}
+        for name, future in zip(names, futures):
+            try:
+                merged[name] = future.result()
+            except Exception as e:
+                # fetch_safety_data already traps request errors; this guards the pool itself
+                print(f"Error fetching FDA data for '{name}': {e}")
+                merged[name] = []
+        return merged
+
+    async def afetch_safety_data_many(self, drug_names, limit=1):
+        """Async variant of fetch_safety_data_many"""
+        names = self._unique_names(drug_names)
+        semaphore = asyncio.Semaphore(self.fanout_concurrency)
+
+        async def fetch(name):
+            async with semaphore:
+                return await self.afetch_safety_data(name, limit)
+
+        results = await asyncio.gather(*[fetch(name) for name in names], return_exceptions=True)
+        return {name: ([] if isinstance(result, BaseException) else result) for name, result in zip(names, results)}
+
+    def shutdown(self):
+        """Release the fan-out pool (safe to call more than once)"""
+        if self._fanout_executor is not None:
+            self._fanout_executor.shutdown(wait=False)
+            self._fanout_executor = None
+
     def fetch_drugs_by_disease(self, disease, limit=10):
         """Fetch drugs approved for a specific disease/condition"""
-        params = {
-            'search': f'indications_and_usage:"{disease}" OR purpose:"{disease}"',
-            'limit': limit
-        }
-        
+        local = self._local_lookup("search_indication", disease, limit)
+        if local is not None:
+            return local
         try:
-            response = requests.get(self.base_url, params=params)
-            if response.status_code == 200:
-                data = response.json()
-                return data.get("results", [])
-            else:
-                print(f"FDA API request failed with status code: {response.status_code}")
-                return []
+            return self._disease_results(self.fda.search(self._disease_params(disease, limit)))
+        except Exception as e:
+            print(f"Error fetching drugs by disease: {e}")
+            return []
+
+    async def afetch_drugs_by_disease(self, disease, limit=10):
+        """Async variant of fetch_drugs_by_disease"""
+        local = self._local_lookup("search_indication", disease, limit)
+        if local is not None:
+            return local
+        try:
+            return self._disease_results(await self.fda.asearch(self._disease_params(disease, limit)))
         except Exception as e:
             print(f"Error fetching drugs by disease: {e}")
             return []
 
+    @staticmethod
+    def _safety_info(label, drug_name):
+        return {
+            'drug': label.get('openfda', {}).get('generic_name', [drug_name]),
+            'brand_names': label.get('openfda', {}).get('brand_name', []),
+            'warnings': label.get('warnings', []),
+            'boxed_warning': label.get('boxed_warning', []),
+            'contraindications': label.get('contraindications', []),
+            'adverse_reactions': label.get('adverse_reactions', []),
+            'precautions': label.get('precautions', []),
+            'drug_interactions': label.get('drug_interactions', [])
+        }
+
     def analyze_drug_safety(self, drug_name):
         """Analyze safety data for a specific drug"""
         data = self.fetch_safety_data(drug_name)
@@ -93,23 +236,12 @@ class SafetyAgent(LLMAgent):
             return self.run(prompt)
         
         # Extract relevant safety information from FDA labels
-        safety_info = []
-        for label in data:
-            info = {
-                'drug': label.get('openfda', {}).get('generic_name', [drug_name]),
-                'brand_names': label.get('openfda', {}).get('brand_name', []),
-                'warnings': label.get('warnings', []),
-                'boxed_warning': label.get('boxed_warning', []),
-                'contraindications': label.get('contraindications', []),
-                'adverse_reactions': label.get('adverse_reactions', []),
-                'precautions': label.get('precautions', []),
-                'drug_interactions': label.get('drug_interactions', [])
-            }
-            safety_info.append(info)
+        safety_info = [self._safety_info(label, drug_name) for label in data]
+        safety_info = self.summarizer.render(self.summarizer.summarize(safety_info, query=drug_name), name_fields=("drug",))
         
         prompt = f"""
         You are a clinical safety expert providing information to patients and healthcare professionals.
-        Analyze the following FDA drug label safety information for {drug_name}:
+        Analyze the following FDA drug label safety information for {drug_name} (excerpted to the most relevant statements):
         
         {safety_info}
         
@@ -139,6 +271,49 @@ class SafetyAgent(LLMAgent):
         
         return self.run(prompt)
 
+    def analyze_multiple_drug_safety(self, drug_names):
+        """Compare the safety profiles of several drugs from one concurrent label fetch"""
+        names = self._unique_names(drug_names)
+        if len(names) < 2:
+            return self.analyze_drug_safety(names[0]) if names else "No drug names provided for safety analysis."
+        
+        labels = self.fetch_safety_data_many(names)
+        safety_info = [self._safety_info(label, name) for name in names for label in labels[name]]
+        missing = [name for name in names if not labels[name]]
+        excerpts = self.summarizer.render(self.summarizer.summarize(safety_info, query=" ".join(names)), name_fields=("drug",)) if safety_info else "None available."
+        missing_note = f"\n        No FDA label was found for: {', '.join(missing)}. Use established medical knowledge for these and say so." if missing else ""
+        
+        prompt = f"""
+        You are a clinical safety expert providing information to patients and healthcare professionals.
+        Compare the safety of the following drugs: {', '.join(names)}.
+        
+        FDA drug label safety information (excerpted to the most relevant statements):
+        
+        {excerpts}
+        {missing_note}
+        
+        Structure your response in TWO sections:
+        
+        **PATIENT-FRIENDLY SUMMARY** (Write in simple, clear language):
+        - Which drugs carry the most serious warnings (black box warnings if present)
+        - How the common side effects differ between them
+        - Who should avoid each medication
+        - Practical safety advice for choosing between them
+        - Keep it concise (3-4 paragraphs)
+        
+        **DETAILED TECHNICAL ANALYSIS**:
+        1. Black box warnings per drug
+        2. Contraindications side by side
+        3. Common adverse reactions and their frequencies
+        4. Significant drug interactions, including between the compared drugs
+        5. Special populations and monitoring requirements
+        6. Overall comparative risk assessment
+        
+        Always start with the PATIENT-FRIENDLY SUMMARY first.
+        """
+        
+        return self.run(prompt)
+
     def analyze_drugs_for_disease(self, disease):
         """Analyze drugs available for a specific disease/condition"""
         data = self.fetch_drugs_by_disease(disease)
@@ -174,9 +349,10 @@ class SafetyAgent(LLMAgent):
                 'pregnancy_category': openfda_info.get('pregnancy_category', [])
             }
             drug_profiles.append(drug_info)
+        drug_profiles = self.summarizer.render(self.summarizer.summarize(drug_profiles, query=disease), name_fields=("primary_name",))
         
         prompt = f"""
-        Analyze the following FDA-approved drugs for treating {disease}:
+        Analyze the following FDA-approved drugs for treating {disease} (label sections excerpted to the most relevant statements):
         
         {drug_profiles}
         
@@ -214,8 +390,11 @@ class SafetyAgent(LLMAgent):
         
         return self.run(prompt)
 
-    def analyze(self, query, analysis_type="auto"):
+    def analyze(self, query, analysis_type="auto", drug_names=None):
         
+        # Several named drugs: one concurrent label fetch and a comparative analysis
+        if drug_names and len(self._unique_names(drug_names)) > 1:
+            return self.analyze_multiple_drug_safety(drug_names)
         
         # Auto-detect analysis type if not specified
         if analysis_type == "auto":
@@ -1,10 +1,12 @@
 from __future__ import annotations
 
 import os
-from typing import Optional, Dict, Any
+import json
+from typing import Optional, Dict, Any, AsyncIterator
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
@@ -17,6 +19,8 @@ from simple_dynamic_orchestrator import SimpleDynamicOrchestrator
 class ChatRequest(BaseModel):
     prompt: str
     session_id: Optional[str] = None
+    # "chain" (reason -> review -> revise) or "fused" (single reason+self-review call)
+    pipeline_mode: Optional[str] = None
 
 
 load_dotenv()
@@ -57,6 +61,15 @@ async def startup_event():
     print("🎉 Application ready!")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush buffered chat/audit writes and release worker pools before the process exits"""
+    if _mongo_store is not None:
+        await _mongo_store.aclose()
+    if _orchestrator is not None:
+        _orchestrator.shutdown()
+
+
 def _new_proxy(session_id: Optional[str] = None) -> HumanProxyAgent:
     """Create a lightweight proxy using shared resources"""
     return HumanProxyAgent(
@@ -77,10 +90,42 @@ async def chat(req: ChatRequest):
     if not req.prompt or not req.prompt.strip():
         raise HTTPException(status_code=400, detail="prompt is required")
     proxy = _new_proxy(session_id=req.session_id)
-    result = await proxy.handle_user_prompt_async(req.prompt)
+    result = await proxy.handle_user_prompt_async(req.prompt, pipeline_mode=req.pipeline_mode)
     return result
 
 
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest):
+    """Server-Sent Events variant of /chat: emits `stage` events as the pipeline
+    progresses, `token` events as the answer is generated (`reset` discards the
+    tokens received so far, e.g. before a revision), `error` events and a
+    closing `done` event whose data matches the /chat response."""
+    if not req.prompt or not req.prompt.strip():
+        raise HTTPException(status_code=400, detail="prompt is required")
+    proxy = _new_proxy(session_id=req.session_id)
+
+    async def events() -> AsyncIterator[str]:
+        pipeline = proxy.stream_user_prompt(req.prompt, pipeline_mode=req.pipeline_mode)
+        try:
+            async for event in pipeline:
+                yield _sse(event["event"], event["data"])
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+        finally:
+            # Runs when the client disconnects too, releasing the Gemini stream
+            await pipeline.aclose()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/history/{session_id}")
 async def history(session_id: str):
     proxy = _new_proxy(session_id=session_id)
@@ -95,6 +140,13 @@ async def replay(session_id: str):
     return data
 
 
+@app.get("/restore/{session_id}")
+async def restore(session_id: str):
+    proxy = _new_proxy(session_id=session_id)
+    data = await proxy.restore_session(session_id)
+    return data
+
+
 if __name__ == "__main__":
     # Allow running with: python api.py
     import uvicorn
@@ -1,12 +1,30 @@
 # gemini_client.py
 import os
+import time
+import random
+import asyncio
 import google.generativeai as genai
-from typing import Optional
+from typing import Optional, Dict, Any, Iterator, AsyncIterator
 from dotenv import load_dotenv
 
+from storage.llm_cache import LLMResponseCache, cache_key
+from llm_concurrency import SingleFlight, AsyncSingleFlight, RateLimiter, estimate_tokens
+
 load_dotenv()
+
+
+class StreamInterrupted(Exception):
+    """The upstream stream failed after some text was already yielded."""
+
+    def __init__(self, error: Exception, partial: str):
+        super().__init__(f"Stream interrupted after {len(partial)} characters: {error}")
+        self.error = error
+        self.partial = partial
+
+
 class GeminiClient:
-    def __init__(self, model_name: str = "gemini-2.0-pro", api_key: Optional[str] = None):
+    def __init__(self, model_name: str = "gemini-2.0-pro", api_key: Optional[str] = None,
+                 cache: Optional[LLMResponseCache] = None):
         
         self.api_key = api_key or os.getenv('GOOGLE_API_KEY') or os.getenv('GEMINI_API_KEY')
         if not self.api_key:
@@ -15,50 +33,139 @@ class GeminiClient:
         genai.configure(api_key=self.api_key)
         self.model_name = model_name
         self.model = genai.GenerativeModel(model_name)
-    
-    def generate(self, prompt: str, max_tokens: int = 2048, temperature: float = 0.7) -> str:
-        
+        # Optional response cache (see storage/llm_cache.py); disabled unless LLM_CACHE=1
+        self.cache = cache if cache is not None else LLMResponseCache.from_env()
+        # Concurrent callers with the same cache key share one in-flight Gemini call
+        self.single_flight = os.getenv("LLM_SINGLE_FLIGHT", "1") != "0"
+        self._inflight = SingleFlight()
+        self._ainflight = AsyncSingleFlight()
+        # Process-wide RPM/TPM/concurrency governor shared by every client for this model
+        self.limiter = RateLimiter.from_env(model_name)
         try:
-            generation_config = genai.types.GenerationConfig(
-                max_output_tokens=max_tokens,
-                temperature=temperature,
-            )
-            
-            # Configure safety settings to be more permissive for medical/clinical content
-            safety_settings = [
-                {
-                    "category": "HARM_CATEGORY_HARASSMENT",
-                    "threshold": "BLOCK_ONLY_HIGH"
-                },
-                {
-                    "category": "HARM_CATEGORY_HATE_SPEECH",
-                    "threshold": "BLOCK_ONLY_HIGH"
-                },
-                {
-                    "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                    "threshold": "BLOCK_ONLY_HIGH"
-                },
-                {
-                    "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                    "threshold": "BLOCK_ONLY_HIGH"
-                }
-            ]
-            
-            response = self.model.generate_content(
-                prompt,
-                generation_config=generation_config,
-                safety_settings=safety_settings
-            )
-            
-            # Check if response has valid content
-            if response.candidates and len(response.candidates) > 0:
-                candidate = response.candidates[0]
-                
-                # Check finish reason
-                if hasattr(candidate, 'finish_reason'):
-                    if candidate.finish_reason == 2:  # SAFETY
-                        # Try a more clinical/educational approach with explicit medical context
-                        educational_prompt = f"""
+            self.rate_limit_retries = max(0, int(os.getenv("GEMINI_RATE_LIMIT_RETRIES", "3")))
+        except Exception:
+            self.rate_limit_retries = 3
+    
+    # Configure safety settings to be more permissive for medical/clinical content
+    SAFETY_SETTINGS = [
+        {
+            "category": "HARM_CATEGORY_HARASSMENT",
+            "threshold": "BLOCK_ONLY_HIGH"
+        },
+        {
+            "category": "HARM_CATEGORY_HATE_SPEECH",
+            "threshold": "BLOCK_ONLY_HIGH"
+        },
+        {
+            "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+            "threshold": "BLOCK_ONLY_HIGH"
+        },
+        {
+            "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+            "threshold": "BLOCK_ONLY_HIGH"
+        }
+    ]
+
+    # Last resort when the prompt is still blocked after the educational retry
+    SAFETY_FALLBACK = (
+        "Here is general clinical trial guidance: Enrollment and outcomes vary widely by phase, "
+        "condition, and study design. Typical enrollment success ranges roughly by phase — "
+        "Phase 1: 40–60%, Phase 2: 50–70%, Phase 3: 70–85%, Phase 4: 75–90%.\n\n"
+        "To help with specifics, please share one of: an NCT ID (e.g., NCT01234567), your condition and location, "
+        "or a treatment name. I can then summarize enrollment patterns, safety considerations, and effectiveness data."
+    )
+
+    # Responses that signal a failed/blocked generation and must never be cached
+    _UNCACHEABLE_PREFIXES = (
+        "Error generating response",
+        "Response blocked",
+        "Response generation failed",
+        "No valid text content",
+        "No response candidates",
+    )
+
+    def _is_cacheable(self, text: str) -> bool:
+        return bool(text) and text != self.SAFETY_FALLBACK and not text.startswith(self._UNCACHEABLE_PREFIXES)
+
+    def _cache_lookup(self, key: str) -> Optional[str]:
+        if self.cache is None:
+            return None
+        return self.cache.get(key)
+
+    def _cache_store(self, key: str, text: str) -> None:
+        if self.cache is not None and self._is_cacheable(text):
+            self.cache.set(key, text)
+
+    # Async variants keep the SQLite tier off the event loop
+    async def _acache_lookup(self, key: str) -> Optional[str]:
+        if self.cache is None:
+            return None
+        return await self.cache.aget(key)
+
+    async def _acache_store(self, key: str, text: str) -> None:
+        if self.cache is not None and self._is_cacheable(text):
+            await self.cache.aset(key, text)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model_name,
+            "cache": self.cache.stats() if self.cache is not None else None,
+            "single_flight": {
+                "enabled": self.single_flight,
+                "leaders": self._inflight.leaders + self._ainflight.leaders,
+                "coalesced": self._inflight.coalesced + self._ainflight.coalesced,
+                "in_flight": self._inflight.in_flight() + self._ainflight.in_flight(),
+            },
+            "rate_limiter": self.limiter.stats(),
+        }
+
+    @staticmethod
+    def _is_rate_limited(error: Exception) -> bool:
+        text = f"{type(error).__name__} {error}".lower()
+        return "resourceexhausted" in text or "429" in text or "quota" in text or "rate limit" in text
+
+    def _backoff(self, attempt: int) -> float:
+        return min(30.0, 2.0 ** attempt) + random.uniform(0, 1.0)
+
+    def _call_model(self, prompt: str, kwargs: dict):
+        """generate_content under the shared limiter, backing off on 429/quota errors."""
+        attempt = 0
+        while True:
+            try:
+                with self.limiter.acquire(estimate_tokens(prompt)):
+                    return self.model.generate_content(prompt, **kwargs)
+            except Exception as e:
+                if attempt >= self.rate_limit_retries or not self._is_rate_limited(e):
+                    raise
+                delay = self._backoff(attempt)
+                print(f"Gemini rate limited, retrying in {delay:.1f}s: {e}")
+                time.sleep(delay)
+                attempt += 1
+
+    async def _acall_model(self, prompt: str, kwargs: dict):
+        attempt = 0
+        while True:
+            try:
+                async with self.limiter.aacquire(estimate_tokens(prompt)):
+                    return await self.model.generate_content_async(prompt, **kwargs)
+            except Exception as e:
+                if attempt >= self.rate_limit_retries or not self._is_rate_limited(e):
+                    raise
+                delay = self._backoff(attempt)
+                print(f"Gemini rate limited, retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    def _request_kwargs(self, max_tokens: int, temperature: float) -> dict:
+        generation_config = genai.types.GenerationConfig(
+            max_output_tokens=max_tokens,
+            temperature=temperature,
+        )
+        return {"generation_config": generation_config, "safety_settings": self.SAFETY_SETTINGS}
+
+    @staticmethod
+    def _educational_prompt(prompt: str) -> str:
+        return f"""
                         You are a clinical research data analyst providing evidence-based educational information 
                         for healthcare professionals, medical researchers, and clinical trial coordinators.
                         
@@ -76,45 +183,193 @@ class GeminiClient:
                         Focus on: enrollment patterns, study design, eligibility criteria, statistical outcomes, 
                         and evidence-based recommendations. Use professional medical terminology as appropriate.
                         """
-                        try:
-                            # Retry with stronger educational framing and safety settings
-                            retry_response = self.model.generate_content(
-                                educational_prompt, 
-                                generation_config=generation_config,
-                                safety_settings=safety_settings
-                            )
-                            if retry_response.candidates and len(retry_response.candidates) > 0:
-                                retry_candidate = retry_response.candidates[0]
-                                if hasattr(retry_candidate, 'content') and retry_candidate.content and retry_candidate.content.parts:
-                                    return retry_candidate.content.parts[0].text
-                        except Exception as retry_error:
-                            print(f"Retry failed: {retry_error}")
-                        
-                        # Last resort: Return a neutral, educational fallback instead of an error
-                        return (
-                            "Here is general clinical trial guidance: Enrollment and outcomes vary widely by phase, "
-                            "condition, and study design. Typical enrollment success ranges roughly by phase — "
-                            "Phase 1: 40–60%, Phase 2: 50–70%, Phase 3: 70–85%, Phase 4: 75–90%.\n\n"
-                            "To help with specifics, please share one of: an NCT ID (e.g., NCT01234567), your condition and location, "
-                            "or a treatment name. I can then summarize enrollment patterns, safety considerations, and effectiveness data."
-                        )
-                    
-                    elif candidate.finish_reason == 3:  # RECITATION
-                        return "Response blocked due to potential copyright concerns. Please rephrase your query."
-                    elif candidate.finish_reason == 4:  # OTHER
-                        return "Response generation failed for unknown reasons. Please try again or rephrase your query."
-                
-                # Try to get text content
-                if hasattr(candidate, 'content') and candidate.content and candidate.content.parts:
-                    return candidate.content.parts[0].text
-                elif hasattr(response, 'text') and response.text:
-                    return response.text
-                else:
-                    return "No valid text content generated. Please try rephrasing your query."
+
+    @staticmethod
+    def _candidate_text(response) -> Optional[str]:
+        if response.candidates and len(response.candidates) > 0:
+            candidate = response.candidates[0]
+            if hasattr(candidate, 'content') and candidate.content and candidate.content.parts:
+                return candidate.content.parts[0].text
+        return None
+
+    @staticmethod
+    def _response_text(response) -> Optional[str]:
+        """Map a generate_content response to text. Returns None when the
+        candidate was blocked for SAFETY so the caller can retry with an
+        educational framing."""
+        # Check if response has valid content
+        if response.candidates and len(response.candidates) > 0:
+            candidate = response.candidates[0]
+            
+            # Check finish reason
+            if hasattr(candidate, 'finish_reason'):
+                if candidate.finish_reason == 2:  # SAFETY
+                    return None
+                elif candidate.finish_reason == 3:  # RECITATION
+                    return "Response blocked due to potential copyright concerns. Please rephrase your query."
+                elif candidate.finish_reason == 4:  # OTHER
+                    return "Response generation failed for unknown reasons. Please try again or rephrase your query."
+            
+            # Try to get text content
+            if hasattr(candidate, 'content') and candidate.content and candidate.content.parts:
+                return candidate.content.parts[0].text
+            elif hasattr(response, 'text') and response.text:
+                return response.text
             else:
-                return "No response candidates generated. Please try again with a different query."
+                return "No valid text content generated. Please try rephrasing your query."
+        else:
+            return "No response candidates generated. Please try again with a different query."
+
+    def generate(self, prompt: str, max_tokens: int = 2048, temperature: float = 0.7) -> str:
+        key = cache_key(self.model_name, prompt, max_tokens, temperature)
+        cached = self._cache_lookup(key)
+        if cached is not None:
+            return cached
+        if not self.single_flight:
+            return self._generate_and_store(key, prompt, max_tokens, temperature)
+        return self._inflight.do(key, lambda: self._generate_and_store(key, prompt, max_tokens, temperature))
+
+    async def agenerate(self, prompt: str, max_tokens: int = 2048, temperature: float = 0.7) -> str:
+        """Async counterpart of generate() built on the SDK's generate_content_async,
+        so awaiting callers never block the event loop on a Gemini round-trip."""
+        key = cache_key(self.model_name, prompt, max_tokens, temperature)
+        cached = await self._acache_lookup(key)
+        if cached is not None:
+            return cached
+        if not self.single_flight:
+            return await self._agenerate_and_store(key, prompt, max_tokens, temperature)
+        return await self._ainflight.do(key, lambda: self._agenerate_and_store(key, prompt, max_tokens, temperature))
+
+    def _generate_and_store(self, key: str, prompt: str, max_tokens: int, temperature: float) -> str:
+        text = self._generate_uncached(prompt, max_tokens, temperature)
+        self._cache_store(key, text)
+        return text
+
+    async def _agenerate_and_store(self, key: str, prompt: str, max_tokens: int, temperature: float) -> str:
+        text = await self._agenerate_uncached(prompt, max_tokens, temperature)
+        await self._acache_store(key, text)
+        return text
+
+    def _generate_uncached(self, prompt: str, max_tokens: int, temperature: float) -> str:
+        try:
+            kwargs = self._request_kwargs(max_tokens, temperature)
+            response = self._call_model(prompt, kwargs)
+            text = self._response_text(response)
+            if text is not None:
+                return text
+            
+            try:
+                # Retry with stronger educational framing and safety settings
+                retry_response = self._call_model(self._educational_prompt(prompt), kwargs)
+                retry_text = self._candidate_text(retry_response)
+                if retry_text:
+                    return retry_text
+            except Exception as retry_error:
+                print(f"Retry failed: {retry_error}")
+            
+            return self.SAFETY_FALLBACK
                 
         except Exception as e:
             error_msg = str(e)
             print(f"Generation error: {error_msg}")
-            return f"Error generating response: {error_msg}"
\ No newline at end of file
+            return f"Error generating response: {error_msg}"
+
+    async def _agenerate_uncached(self, prompt: str, max_tokens: int, temperature: float) -> str:
+        try:
+            kwargs = self._request_kwargs(max_tokens, temperature)
+            response = await self._acall_model(prompt, kwargs)
+            text = self._response_text(response)
+            if text is not None:
+                return text
+            
+            try:
+                retry_response = await self._acall_model(self._educational_prompt(prompt), kwargs)
+                retry_text = self._candidate_text(retry_response)
+                if retry_text:
+                    return retry_text
+            except Exception as retry_error:
+                print(f"Retry failed: {retry_error}")
+            
+            return self.SAFETY_FALLBACK
+                
+        except Exception as e:
+            error_msg = str(e)
+            print(f"Generation error: {error_msg}")
+            return f"Error generating response: {error_msg}"
+
+    @staticmethod
+    def _chunk_text(chunk) -> str:
+        # chunk.text raises when a streamed candidate is blocked; read parts directly
+        try:
+            if chunk.candidates and chunk.candidates[0].content and chunk.candidates[0].content.parts:
+                return "".join(getattr(p, "text", "") for p in chunk.candidates[0].content.parts)
+        except Exception:
+            pass
+        return ""
+
+    def stream(self, prompt: str, max_tokens: int = 2048, temperature: float = 0.7) -> Iterator[str]:
+        """Yield text chunks as Gemini produces them. Cache hits are yielded in one
+        chunk; if the stream yields nothing (e.g. blocked for SAFETY) this falls
+        back to generate() so callers still get the usual retry/fallback text.
+        Raises StreamInterrupted if the stream fails after text was yielded.
+        The limiter slot is released when the stream ends or the generator is
+        closed, so callers that stop early should close() it."""
+        key = cache_key(self.model_name, prompt, max_tokens, temperature)
+        cached = self._cache_lookup(key)
+        if cached is not None:
+            yield cached
+            return
+        parts = []
+        failure = None
+        slot = self.limiter.acquire(estimate_tokens(prompt))
+        slot.__enter__()
+        try:
+            response = self.model.generate_content(prompt, stream=True, **self._request_kwargs(max_tokens, temperature))
+            for chunk in response:
+                text = self._chunk_text(chunk)
+                if text:
+                    parts.append(text)
+                    yield text
+        except Exception as e:
+            print(f"Streaming error: {e}")
+            failure = e
+        finally:
+            slot.__exit__(None, None, None)
+        if failure is not None and parts:
+            raise StreamInterrupted(failure, "".join(parts))
+        if parts:
+            self._cache_store(key, "".join(parts))
+        else:
+            yield self.generate(prompt, max_tokens=max_tokens, temperature=temperature)
+
+    async def astream(self, prompt: str, max_tokens: int = 2048, temperature: float = 0.7) -> AsyncIterator[str]:
+        """Async counterpart of stream(). Consumers that may stop early (e.g. a
+        disconnected SSE client) must aclose() the generator to free the slot."""
+        key = cache_key(self.model_name, prompt, max_tokens, temperature)
+        cached = await self._acache_lookup(key)
+        if cached is not None:
+            yield cached
+            return
+        parts = []
+        failure = None
+        slot = self.limiter.aacquire(estimate_tokens(prompt))
+        await slot.__aenter__()
+        try:
+            response = await self.model.generate_content_async(prompt, stream=True, **self._request_kwargs(max_tokens, temperature))
+            async for chunk in response:
+                text = self._chunk_text(chunk)
+                if text:
+                    parts.append(text)
+                    yield text
+        except Exception as e:
+            print(f"Streaming error: {e}")
+            failure = e
+        finally:
+            # Also runs on aclose()/cancellation while suspended at a yield
+            await slot.__aexit__(None, None, None)
+        if failure is not None and parts:
+            raise StreamInterrupted(failure, "".join(parts))
+        if parts:
+            await self._acache_store(key, "".join(parts))
+        else:
+            yield await self.agenerate(prompt, max_tokens=max_tokens, temperature=temperature)
@@ -0,0 +1,297 @@
+# llm_concurrency.py
+"""
+Concurrency helpers shared by LLM clients.
+
+- SingleFlight: coalesces concurrent identical calls from threads onto one
+  in-flight future
+- AsyncSingleFlight: same for coroutines on an event loop
+- RateLimiter: process-wide requests/min + tokens/min buckets and a FIFO
+  concurrency governor, usable from threads and coroutines alike
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, Tuple
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+class AsyncSingleFlight:
+    def __init__(self):
+        self._calls: Dict[Tuple[int, str], asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        slot = (id(loop), key)
+        task = self._calls.get(slot)
+        if task is None:
+            task = loop.create_task(fn())
+            self._calls[slot] = task
+            self.leaders += 1
+            task.add_done_callback(lambda _t, slot=slot: self._calls.pop(slot, None))
+        else:
+            self.coalesced += 1
+        # Shield so a cancelled caller does not cancel the call other waiters share
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limits are enforced with
+    reservation-based token buckets (GCRA): each caller reserves capacity in
+    arrival order and sleeps until its slot, so callers are served FIFO and
+    bursts queue up instead of failing. A limit of 0 disables that bucket.
+    burst_seconds is the burst tolerance: after an idle period callers may go
+    through back to back until that many seconds of quota are used (never less
+    than one request), then they are paced. A reservation whose caller is
+    cancelled before the call starts is refunded.
+    max_concurrency caps in-flight calls; waiters are woken in FIFO order.
+    """
+
+    _shared: Dict[str, "RateLimiter"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, rpm: int = 0, tpm: int = 0, max_concurrency: int = 0, burst_seconds: float = 5.0):
+        self.rpm = max(0, int(rpm))
+        self.tpm = max(0, int(tpm))
+        self.burst_seconds = max(0.0, float(burst_seconds))
+        self.max_concurrency = max(0, int(max_concurrency))
+        self._lock = threading.Lock()
+        now = time.monotonic()
+        # Theoretical arrival times for each bucket
+        self._req_tat = now
+        self._tok_tat = now
+        self._free_slots = self.max_concurrency
+        self._slot_waiters: Deque[Any] = deque()
+        self._in_flight = 0
+        self._rate_waiting = 0
+        self._metrics = {"acquired": 0, "waited": 0, "total_wait_s": 0.0, "max_wait_s": 0.0}
+
+    @classmethod
+    def shared(cls, name: str, rpm: int = 0, tpm: int = 0, max_concurrency: int = 0, burst_seconds: float = 5.0) -> "RateLimiter":
+        """Process-wide limiter per name (e.g. per model), created on first use."""
+        with cls._shared_lock:
+            limiter = cls._shared.get(name)
+            if limiter is None:
+                limiter = cls(rpm=rpm, tpm=tpm, max_concurrency=max_concurrency, burst_seconds=burst_seconds)
+                cls._shared[name] = limiter
+            return limiter
+
+    @classmethod
+    def from_env(cls, name: str) -> "RateLimiter":
+        try:
+            rpm = int(os.getenv("GEMINI_RPM", "0"))
+            tpm = int(os.getenv("GEMINI_TPM", "0"))
+            max_concurrency = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+            burst_seconds = float(os.getenv("GEMINI_BURST_SECONDS", "5"))
+        except Exception:
+            rpm, tpm, max_concurrency, burst_seconds = 0, 0, 8, 5.0
+        return cls.shared(name, rpm=rpm, tpm=tpm, max_concurrency=max_concurrency, burst_seconds=burst_seconds)
+
+    # ---------- rate buckets ----------
+    def _reserve(self, tokens: int) -> Tuple[float, Tuple[float, float]]:
+        """Commit a reservation; returns (seconds to wait, reservation for _refund)."""
+        now = time.monotonic()
+        delay = 0.0
+        req_cost = tok_cost = 0.0
+        with self._lock:
+            if self.rpm:
+                req_cost = 60.0 / self.rpm
+                tat = max(self._req_tat, now) + req_cost
+                # Tolerance of burst_seconds, but at least this request's own cost
+                delay = max(delay, tat - max(self.burst_seconds, req_cost) - now)
+                self._req_tat = tat
+            if self.tpm:
+                tok_cost = min(max(1, tokens), self.tpm) * 60.0 / self.tpm
+                tat = max(self._tok_tat, now) + tok_cost
+                delay = max(delay, tat - max(self.burst_seconds, tok_cost) - now)
+                self._tok_tat = tat
+        return max(0.0, delay), (req_cost, tok_cost)
+
+    def _refund(self, reservation: Tuple[float, float]) -> None:
+        """Give back a reservation whose call never started (caller cancelled)."""
+        req_cost, tok_cost = reservation
+        now = time.monotonic()
+        with self._lock:
+            # Never move a bucket back past "now": that would bank extra burst
+            self._req_tat = max(now, self._req_tat - req_cost)
+            self._tok_tat = max(now, self._tok_tat - tok_cost)
+
+    # ---------- concurrency slots ----------
+    def _try_take_slot(self, waiter: Any) -> bool:
+        """Take a slot immediately or enqueue waiter. Caller must hold _lock."""
+        if not self.max_concurrency:
+            return True
+        if self._free_slots > 0 and not self._slot_waiters:
+            self._free_slots -= 1
+            return True
+        self._slot_waiters.append(waiter)
+        return False
+
+    def _release_slot(self) -> None:
+        if not self.max_concurrency:
+            return
+        with self._lock:
+            while self._slot_waiters:
+                waiter = self._slot_waiters.popleft()
+                # Hand the slot straight to the next waiter
+                if isinstance(waiter, threading.Event):
+                    waiter.set()
+                    return
+                loop, fut = waiter
+                try:
+                    loop.call_soon_threadsafe(_wake_future, fut)
+                    return
+                except RuntimeError:
+                    # Waiter's loop is closed; try the next one
+                    continue
+            self._free_slots += 1
+
+    def _record(self, waited: float) -> None:
+        with self._lock:
+            self._metrics["acquired"] += 1
+            self._in_flight += 1
+            if waited > 0.001:
+                self._metrics["waited"] += 1
+                self._metrics["total_wait_s"] += waited
+                self._metrics["max_wait_s"] = max(self._metrics["max_wait_s"], waited)
+
+    def _done(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+        self._release_slot()
+
+    @contextmanager
+    def acquire(self, tokens: int = 1):
+        start = time.monotonic()
+        delay, reservation = self._reserve(tokens)
+        if delay > 0:
+            with self._lock:
+                self._rate_waiting += 1
+            try:
+                time.sleep(delay)
+            except BaseException:
+                self._refund(reservation)
+                raise
+            finally:
+                with self._lock:
+                    self._rate_waiting -= 1
+        event = threading.Event()
+        with self._lock:
+            ready = self._try_take_slot(event)
+        if not ready:
+            event.wait()
+        self._record(time.monotonic() - start)
+        try:
+            yield
+        finally:
+            self._done()
+
+    @asynccontextmanager
+    async def aacquire(self, tokens: int = 1):
+        start = time.monotonic()
+        delay, reservation = self._reserve(tokens)
+        if delay > 0:
+            with self._lock:
+                self._rate_waiting += 1
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self._refund(reservation)
+                raise
+            finally:
+                with self._lock:
+                    self._rate_waiting -= 1
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        waiter = (loop, fut)
+        with self._lock:
+            ready = self._try_take_slot(waiter)
+        if not ready:
+            try:
+                await fut
+            except asyncio.CancelledError:
+                with self._lock:
+                    queued = waiter in self._slot_waiters
+                    if queued:
+                        self._slot_waiters.remove(waiter)
+                if not queued:
+                    # A slot was already handed to us; pass it on
+                    self._release_slot()
+                self._refund(reservation)
+                raise
+        self._record(time.monotonic() - start)
+        try:
+            yield
+        finally:
+            self._done()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics.update({
+                "rpm": self.rpm,
+                "tpm": self.tpm,
+                "burst_seconds": self.burst_seconds,
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self._in_flight,
+                "queue_depth": len(self._slot_waiters) + self._rate_waiting,
+                "avg_wait_s": (metrics["total_wait_s"] / metrics["waited"]) if metrics["waited"] else 0.0,
+            })
+        return metrics
+
+
+def _wake_future(fut: "asyncio.Future") -> None:
+    if fut.done():
+        # Waiter was cancelled after the hand-off was scheduled; its
+        # CancelledError handler passes the slot on.
+        return
+    fut.set_result(True)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough prompt token estimate (~4 characters per token)."""
+    return max(1, len(text) // 4)
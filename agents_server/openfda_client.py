@@ -0,0 +1,226 @@
+# openfda_client.py
+"""
+Pooled HTTP client for the openFDA drug label endpoint.
+
+- One keep-alive requests.Session per client (connection pool, no TLS
+  handshake per call) with explicit connect/read timeouts
+- Retries 429/5xx and connection errors with exponential backoff + jitter,
+  honouring Retry-After
+- asearch(): async variant on httpx with HTTP/2. One httpx.AsyncClient per
+  running event loop (connections cannot be shared across loops); aclose()
+  closes the current loop's client. Falls back to running search() in a
+  worker thread when httpx is not installed
+- The API key is sent as a query parameter; FDAResponse.url is redacted so
+  it can be logged or cached safely
+- Responses (including 404 "no data") are served from a persistent
+  FDALabelCache when enabled (see storage/fda_cache.py)
+
+Environment variables:
+- OPENFDA_API_KEY: optional openFDA key (raises the rate limit)
+- OPENFDA_CONNECT_TIMEOUT / OPENFDA_READ_TIMEOUT: seconds (default 3.05 / 15)
+- OPENFDA_RETRIES: retry attempts on 429/5xx/connection errors (default 3)
+"""
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, NamedTuple, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from storage.fda_cache import FDALabelCache
+
+
+def redact_url(url: str) -> str:
+    """Drop api_key from a request URL before it is logged or stored."""
+    parts = urlsplit(str(url))
+    if "api_key" not in parts.query:
+        return str(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != "api_key"]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+class FDAResponse(NamedTuple):
+    status_code: int
+    data: Optional[Dict[str, Any]]
+    url: str
+    text: str = ""
+
+
+class OpenFDAClient:
+    BASE_URL = "https://api.fda.gov/drug/label.json"
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+        retries: Optional[int] = None,
+        backoff: float = 0.5,
+        pool_size: int = 16,
+        cache: Optional[FDALabelCache] = None,
+    ):
+        self.base_url = base_url or self.BASE_URL
+        self.api_key = api_key or os.getenv("OPENFDA_API_KEY")
+        try:
+            self.connect_timeout = connect_timeout or float(os.getenv("OPENFDA_CONNECT_TIMEOUT", "3.05"))
+            self.read_timeout = read_timeout or float(os.getenv("OPENFDA_READ_TIMEOUT", "15"))
+            self.retries = retries if retries is not None else int(os.getenv("OPENFDA_RETRIES", "3"))
+        except Exception:
+            self.connect_timeout, self.read_timeout, self.retries = 3.05, 15.0, 3
+        self.backoff = backoff
+        self.pool_size = pool_size
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # id(event loop) -> (loop, httpx.AsyncClient); see _get_async_client
+        self._async_clients: Dict[int, Any] = {}
+        self._async_lock = threading.Lock()
+        self.cache = cache if cache is not None else FDALabelCache.from_env()
+
+    def _params(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        if self.api_key:
+            return {**params, "api_key": self.api_key}
+        return dict(params)
+
+    def _delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after:
+            try:
+                return min(30.0, float(retry_after))
+            except ValueError:
+                pass
+        # Full jitter keeps concurrent retries from synchronising
+        return random.uniform(0, min(10.0, self.backoff * (2 ** attempt)))
+
+    @staticmethod
+    def _result(status_code: int, url: str, payload: Any, text: str) -> FDAResponse:
+        return FDAResponse(status_code, payload if status_code == 200 else None, redact_url(url), text if status_code != 200 else "")
+
+    # ---------- cache ----------
+    def _cached(self, params: Dict[str, Any]):
+        if self.cache is None:
+            return None, None
+        key = FDALabelCache.key(self.base_url, params)
+        entry = self.cache.get(key)
+        if entry is None:
+            return key, None
+        return key, FDAResponse(entry["status_code"], entry.get("data"), self.base_url)
+
+    def _remember(self, key: Optional[str], response: FDAResponse) -> FDAResponse:
+        if key is not None and self.cache is not None:
+            self.cache.put(key, response.status_code, response.data)
+        return response
+
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        return self.cache.stats() if self.cache is not None else None
+
+    # ---------- sync ----------
+    def search(self, params: Dict[str, Any]) -> FDAResponse:
+        """GET the label endpoint with retries; raises only after retries are exhausted on connection errors."""
+        key, hit = self._cached(params)
+        if hit is not None:
+            return hit
+        return self._remember(key, self._search_uncached(params))
+
+    def _search_uncached(self, params: Dict[str, Any]) -> FDAResponse:
+        attempt = 0
+        while True:
+            try:
+                response = self.session.get(
+                    self.base_url,
+                    params=self._params(params),
+                    timeout=(self.connect_timeout, self.read_timeout),
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.retries:
+                    raise
+                time.sleep(self._delay(attempt))
+                attempt += 1
+                continue
+            if response.status_code in self.RETRY_STATUSES and attempt < self.retries:
+                time.sleep(self._delay(attempt, response.headers.get("Retry-After")))
+                attempt += 1
+                continue
+            payload = response.json() if response.status_code == 200 else None
+            return self._result(response.status_code, response.url, payload, response.text)
+
+    # ---------- async ----------
+    def _new_async_client(self):
+        import httpx  # type: ignore
+
+        return httpx.AsyncClient(
+            http2=importlib.util.find_spec("h2") is not None,
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+        )
+
+    def _get_async_client(self):
+        """The AsyncClient bound to the running loop; created on first use in that loop."""
+        loop = asyncio.get_running_loop()
+        with self._async_lock:
+            # Clients of loops that have since closed cannot be used or awaited; drop them
+            for key in [k for k, (l, _) in self._async_clients.items() if l.is_closed()]:
+                del self._async_clients[key]
+            entry = self._async_clients.get(id(loop))
+            if entry is None or entry[0] is not loop:
+                entry = (loop, self._new_async_client())
+                self._async_clients[id(loop)] = entry
+            return entry[1]
+
+    async def asearch(self, params: Dict[str, Any]) -> FDAResponse:
+        """Async variant of search()"""
+        key, hit = self._cached(params)
+        if hit is not None:
+            return hit
+        if importlib.util.find_spec("httpx") is None:
+            return self._remember(key, await asyncio.to_thread(self._search_uncached, params))
+        return self._remember(key, await self._asearch_uncached(params))
+
+    async def _asearch_uncached(self, params: Dict[str, Any]) -> FDAResponse:
+        import httpx  # type: ignore
+
+        client = self._get_async_client()
+        attempt = 0
+        while True:
+            try:
+                response = await client.get(self.base_url, params=self._params(params))
+            except (httpx.ConnectError, httpx.TimeoutException, httpx.RemoteProtocolError):
+                if attempt >= self.retries:
+                    raise
+                await asyncio.sleep(self._delay(attempt))
+                attempt += 1
+                continue
+            if response.status_code in self.RETRY_STATUSES and attempt < self.retries:
+                await asyncio.sleep(self._delay(attempt, response.headers.get("Retry-After")))
+                attempt += 1
+                continue
+            payload = response.json() if response.status_code == 200 else None
+            return self._result(response.status_code, str(response.url), payload, response.text)
+
+    def close(self) -> None:
+        self.session.close()
+
+    async def aclose(self) -> None:
+        """Close the session and the AsyncClient of the running loop."""
+        self.session.close()
+        loop = asyncio.get_running_loop()
+        with self._async_lock:
+            entry = self._async_clients.pop(id(loop), None)
+        if entry is not None and entry[0] is loop:
+            await entry[1].aclose()
+
+    async def __aenter__(self) -> "OpenFDAClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
@@ -1,95 +1,121 @@
+import argparse
 import pandas as pd
 import faiss
 import numpy as np
-import pickle
 import os
+import sys
 from sentence_transformers import SentenceTransformer
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from agents.enrollment_scoring import score_trials
+from storage.bm25_index import BM25Index
+from storage.trial_filters import TrialFilterIndex
+from storage.trial_store import NCTIndex, TrialStore, row_to_text
+from storage.vector_index import INDEX_TYPES, build_index, evaluate, format_report, load_index, save_index, training_sample
+
 # Get the correct path to the CSV file
 script_dir = os.path.dirname(os.path.abspath(__file__))
 csv_path = os.path.join(script_dir, "..", "datasets", "clinical_trials.csv")
+index_path = os.path.join(script_dir, "clinical_trials.faiss")
+# Columnar trial store: clinical_trials.arrow, .docs.bin, .docs.offsets.npy,
+# plus the lookup arrays the agent memory-maps (clinical_trials.<name>.npy)
+store_path = os.path.join(script_dir, "clinical_trials")
 
-try:
-    df = pd.read_csv(csv_path)
-    print(f"Loaded {len(df)} rows from {csv_path}")
-except FileNotFoundError:
-    print(f"Error: Could not find {csv_path}")
-    exit(1)
-except Exception as e:
-    print(f"Error loading CSV: {e}")
-    exit(1)
-
-def row_to_text(row):
-    def safe_get(field, default="N/A"):
-        value = row.get(field, default)
-        return str(value) if pd.notna(value) else default
-    
-    return (
-        f"Disease: {safe_get('Disease')}. "
-        f"NCT ID: {safe_get('NCT ID')}. "
-        f"Status: {safe_get('Overall Status')}. "
-        f"Why Stopped: {safe_get('Why Stopped')}. "
-        f"Eligibility: {safe_get('Eligibility Criteria')}. "
-        f"Phase: {safe_get('Phase')}. "
-        f"Conditions: {safe_get('Conditions')}. "
-        f"Study Type: {safe_get('Study type')}."
-    )
 
-documents = df.apply(row_to_text, axis=1).tolist()
+def build(args):
+    try:
+        df = pd.read_csv(csv_path)
+        print(f"Loaded {len(df)} rows from {csv_path}")
+    except FileNotFoundError:
+        print(f"Error: Could not find {csv_path}")
+        exit(1)
+    except Exception as e:
+        print(f"Error loading CSV: {e}")
+        exit(1)
 
-model = SentenceTransformer("all-MiniLM-L6-v2")
-embeddings = model.encode(documents, convert_to_numpy=True, normalize_embeddings=True)
+    documents = df.apply(row_to_text, axis=1).tolist()
+    # Enrollment success score and factor codes, stored as columns of the trial store
+    df = df.join(score_trials(df))
 
-d = embeddings.shape[1]  # dimension of embeddings
-index = faiss.IndexFlatIP(d)  # Inner Product (cosine similarity)
-index.add(embeddings)
+    model = SentenceTransformer("all-MiniLM-L6-v2")
+    embeddings = model.encode(documents, convert_to_numpy=True, normalize_embeddings=True)
 
-print("FAISS index created with", index.ntotal, "vectors")
+    # Inner Product over normalized embeddings (cosine similarity)
+    index, params = build_index(
+        embeddings,
+        index_type=args.index_type,
+        nlist=args.nlist,
+        pq_m=args.pq_m,
+        hnsw_m=args.hnsw_m,
+        nprobe=args.nprobe,
+        ef_search=args.ef_search,
+        train_size=args.train_size,
+    )
 
-index_path = os.path.join(script_dir, "clinical_trials.faiss")
-metadata_path = os.path.join(script_dir, "clinical_trials_metadata.pkl")
+    print(f"FAISS {params['index_type']} index created with", index.ntotal, "vectors")
 
-faiss.write_index(index, index_path)
+    if args.report and params["index_type"] != "flat":
+        report(index, params, embeddings, args)
 
-with open(metadata_path, "wb") as f:
-    pickle.dump({"documents": documents, "df": df}, f)
+    save_index(index, index_path, params)
+    paths = TrialStore.write(df, documents, store_path)
+    # Lookup structures built from the written store, so they match what the agent reads
+    trials = TrialStore.open(store_path)
+    try:
+        NCTIndex.build(trials.column("NCT ID")).save(store_path)
+        TrialFilterIndex.build(trials).save(store_path)
+    finally:
+        trials.close()
+    # Lexical index over the same documents for hybrid (BM25 + vector) search
+    BM25Index.build(documents).save(store_path)
+
+    print(f"Saved {index_path} (+ .json settings), {paths['table']}, {paths['docs']}, {paths['offsets']} "
+          f"and the NCT / filter / BM25 arrays ({store_path}.*.npy)")
+
+
+def report(index, params, embeddings, args):
+    """recall@k vs. latency against the exact flat index, sweeping nprobe/efSearch."""
+    flat = faiss.IndexFlatIP(embeddings.shape[1])
+    flat.add(embeddings)
+    # Corpus vectors stand in for a query log; both indexes see the same queries
+    queries = training_sample(embeddings, min(args.report_queries, len(embeddings)), seed=7)
+    if params["index_type"] == "hnsw":
+        sweep = [16, 32, 64, 128, 256]
+    else:
+        sweep = [n for n in (1, 2, 4, 8, 16, 32, 64, 128) if n <= params.get("nlist", 1)]
+    rows = evaluate(index, flat, queries, k=args.k, sweep=sweep, params=params)
+    print(f"\nrecall@{args.k} vs. latency over {len(queries)} queries ({len(embeddings)} vectors):")
+    print(format_report(rows, args.k))
+    print("Pick nprobe/efSearch with --nprobe/--ef-search (saved to the .json sidecar) or FAISS_NPROBE/FAISS_EF_SEARCH\n")
 
-print(f"Saved {index_path} and {metadata_path}")
 
 def search(query, top_k=5):
-    # Get file paths
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    index_path = os.path.join(script_dir, "clinical_trials.faiss")
-    metadata_path = os.path.join(script_dir, "clinical_trials_metadata.pkl")
-    
     try:
-        # Load index
-        index = faiss.read_index(index_path)
-        
-        # Load metadata
-        with open(metadata_path, "rb") as f:
-            metadata = pickle.load(f)
-        documents = metadata["documents"]
-        df = metadata["df"]
+        # Load index (with its saved nprobe/efSearch)
+        index, _ = load_index(index_path)
+
+        # Memory-map metadata; rows are only materialised for the hits
+        trials = TrialStore.open(store_path)
 
         # Load model for encoding query
         model = SentenceTransformer("all-MiniLM-L6-v2")
-        
+
         # Encode query
         q_embedding = model.encode([query], convert_to_numpy=True, normalize_embeddings=True)
-        
+
         # Search
         D, I = index.search(q_embedding, k=top_k)
-        
+
         results = []
         for idx in I[0]:
             results.append({
-                "text": documents[idx],
-                "row": df.iloc[idx].to_dict(),
+                "text": trials.document(int(idx)),
+                "row": trials.row(int(idx)),
                 "score": float(D[0][len(results)])  # Add similarity score
             })
         return results
-    
+
     except FileNotFoundError as e:
         print(f"Error: Could not find required files. Make sure to run the indexing first. {e}")
         return []
@@ -98,14 +124,27 @@ def search(query, top_k=5):
         return []
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the clinical trial FAISS index and columnar trial store")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=os.getenv("FAISS_INDEX_TYPE", "flat"))
+    parser.add_argument("--nlist", type=int, default=None, help="IVF cells (default ~4*sqrt(n))")
+    parser.add_argument("--pq-m", type=int, default=None, help="IVF-PQ sub-quantizers (must divide the dimension)")
+    parser.add_argument("--hnsw-m", type=int, default=32, help="HNSW graph degree")
+    parser.add_argument("--nprobe", type=int, default=None, help="IVF cells searched per query (saved)")
+    parser.add_argument("--ef-search", type=int, default=None, help="HNSW search beam (saved)")
+    parser.add_argument("--train-size", type=int, default=None, help="IVF training sample size (default 256*nlist)")
+    parser.add_argument("--report", action="store_true", help="print recall@k vs. latency against the flat index")
+    parser.add_argument("--report-queries", type=int, default=500)
+    parser.add_argument("-k", type=int, default=10)
+    build(parser.parse_args())
+
     # Test the search functionality
     print("\n" + "="*50)
     print("Testing search functionality...")
     print("="*50)
-    
+
     query = "breast cancer phase 3 trial eligibility"
     results = search(query, top_k=3)
-    
+
     if results:
         print(f"\nFound {len(results)} results for query: '{query}'")
         for i, r in enumerate(results, 1):
@@ -0,0 +1,79 @@
+"""
+Ingest openFDA bulk drug-label dumps into the local label store.
+
+Download the drug/label partitions listed at https://open.fda.gov/data/downloads/
+(drug-label-0001-of-00NN.json.zip, ...) into datasets/openfda/, then run:
+
+    python scripts/load_openfda_labels.py [dump files or directories] [--db PATH]
+
+With no paths, every *.json / *.json.zip under datasets/openfda/ is loaded.
+SafetyAgent picks the store up through FDA_LABEL_BACKEND / FDA_LABEL_DB.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from storage.label_store import LabelStore
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+default_dump_dir = os.path.join(script_dir, "..", "datasets", "openfda")
+default_db_path = os.path.join(script_dir, "..", "datasets", "openfda_labels.db")
+
+
+def iter_dump_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for pattern in ("*.json.zip", "*.json"):
+                yield from sorted(glob.glob(os.path.join(path, pattern)))
+        else:
+            yield path
+
+
+def read_labels(path):
+    """Yield the `results` entries of one dump partition (.json or .json.zip)."""
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            for name in archive.namelist():
+                if name.endswith(".json"):
+                    with archive.open(name) as f:
+                        yield from json.load(f).get("results", [])
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            yield from json.load(f).get("results", [])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load openFDA drug-label bulk dumps into a local SQLite FTS5 store")
+    parser.add_argument("paths", nargs="*", default=[default_dump_dir], help="dump files or directories")
+    parser.add_argument("--db", default=os.getenv("FDA_LABEL_DB", default_db_path), help="output SQLite file")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    files = list(iter_dump_files(args.paths))
+    if not files:
+        print(f"Error: no openFDA label dumps found in {', '.join(args.paths)}")
+        sys.exit(1)
+
+    store = LabelStore(args.db)
+    start = time.time()
+    total = 0
+    for path in files:
+        print(f"Loading {path}...")
+        written = store.ingest(read_labels(path), batch_size=args.batch_size)
+        total += written
+        print(f"  {written} labels")
+
+    print("Optimizing full-text index...")
+    store.optimize()
+    print(f"Loaded {total} labels into {args.db} ({store.count()} total) in {time.time() - start:.1f}s")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
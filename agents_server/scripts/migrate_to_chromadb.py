@@ -1,77 +1,70 @@
 import chromadb
-import faiss
 import pickle
 import pandas as pd
 import numpy as np
 import os
+import sys
 from sentence_transformers import SentenceTransformer
 from typing import List, Dict, Any
 
-def load_faiss_data(base_dir: str = None):
-    """Load FAISS index and metadata"""
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from storage.trial_store import TrialStore
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+
+def load_trials(base_dir: str = None):
+    """Load trial metadata and documents (columnar store from load_faiss.py, else legacy pkl)"""
     if base_dir is None:
         script_dir = os.path.dirname(os.path.abspath(__file__))
         base_dir = os.path.join(script_dir, "..", "datasets")
     
-    index_path = os.path.join(base_dir, "clinical_trials.faiss")
+    store_path = os.path.join(base_dir, "clinical_trials")
     metadata_path = os.path.join(base_dir, "clinical_trials_metadata.pkl")
     
-    print(f"Loading FAISS index from: {index_path}")
-    print(f"Loading metadata from: {metadata_path}")
-    
     try:
-        # Load FAISS index
-        index = faiss.read_index(index_path)
-        print(f"Loaded FAISS index with {index.ntotal} vectors")
-        
-        # Load metadata
-        with open(metadata_path, "rb") as f:
-            metadata = pickle.load(f)
-        
-        documents = metadata["documents"]
-        df = metadata["df"]
-        
-        print(f"Loaded {len(documents)} documents and DataFrame with {len(df)} rows")
-        
-        return index, documents, df
+        if TrialStore.exists(store_path):
+            print(f"Loading metadata from: {store_path}.arrow")
+            trials = TrialStore.open(store_path)
+        else:
+            print(f"Loading metadata from: {metadata_path}")
+            with open(metadata_path, "rb") as f:
+                metadata = pickle.load(f)
+            trials = TrialStore.from_dataframe(metadata["df"], metadata["documents"])
+        
+        print(f"Loaded {len(trials)} trials")
+        
+        return trials
     
     except FileNotFoundError as e:
         print(f"Error: Could not find required files: {e}")
-        return None, None, None
+        return None
     except Exception as e:
         print(f"Error loading data: {e}")
-        return None, None, None
-
-def extract_embeddings_from_faiss(index: faiss.Index) -> np.ndarray:
-    """Extract embeddings from FAISS index"""
-    try:
-        # For IndexFlatIP, we can reconstruct the vectors
-        embeddings = np.zeros((index.ntotal, index.d), dtype=np.float32)
-        index.reconstruct_n(0, index.ntotal, embeddings)
-        return embeddings
-    except Exception as e:
-        print(f"Error extracting embeddings: {e}")
         return None
 
+def encode_documents(model: SentenceTransformer, documents: List[str]) -> np.ndarray:
+    """
+    Embed documents exactly as scripts/load_faiss.py does. Vectors are not read
+    back from the FAISS index: IVF indexes cannot reconstruct without a direct
+    map, and IVF-PQ reconstruction is lossy.
+    """
+    return model.encode(documents, convert_to_numpy=True, normalize_embeddings=True)
+
 def migrate_to_chromadb(
     client: chromadb.CloudClient,
     collection_name: str = "ClinicalAgents",
     batch_size: int = 100
 ):
-    """Migrate FAISS data to ChromaDB"""
-    
-    # Load FAISS data
-    index, documents, df = load_faiss_data()
-    if index is None:
-        return False
+    """Migrate the local trial corpus to ChromaDB, re-encoding each batch of documents"""
     
-    # Extract embeddings
-    print("Extracting embeddings from FAISS index...")
-    embeddings = extract_embeddings_from_faiss(index)
-    if embeddings is None:
+    trials = load_trials()
+    if trials is None:
         return False
     
-    print(f"Extracted embeddings shape: {embeddings.shape}")
+    print(f"Loading sentence model {MODEL_NAME} to encode documents...")
+    model = SentenceTransformer(MODEL_NAME)
     
     try:
         # Create or get collection
@@ -86,7 +79,7 @@ def migrate_to_chromadb(
         print(f"Created collection '{collection_name}'")
         
         # Prepare data for ChromaDB
-        total_docs = len(documents)
+        total_docs = len(trials)
         print(f"Preparing to add {total_docs} documents to ChromaDB...")
         
         # Process in batches
@@ -98,13 +91,13 @@ def migrate_to_chromadb(
             
             # Prepare batch data
             batch_ids = [str(i + j) for j in range(batch_size_actual)]
-            batch_documents = documents[i:end_idx]
-            batch_embeddings = embeddings[i:end_idx].tolist()
+            batch_documents = trials.documents[i:end_idx]
+            batch_embeddings = encode_documents(model, batch_documents).tolist()
             
             # Prepare metadata for each document
             batch_metadata = []
             for j in range(batch_size_actual):
-                row_data = df.iloc[i + j]
+                row_data = trials.row(i + j)
                 metadata = {
                     "nct_id": str(row_data.get("NCT ID", "N/A")),
                     "disease": str(row_data.get("Disease", "N/A")),
@@ -151,7 +144,7 @@ def test_chromadb_search(
         collection = client.get_collection(collection_name)
         
         # Load sentence transformer for query encoding
-        model = SentenceTransformer("all-MiniLM-L6-v2")
+        model = SentenceTransformer(MODEL_NAME)
         query_embedding = model.encode([query], convert_to_numpy=True, normalize_embeddings=True)
         
         # Search
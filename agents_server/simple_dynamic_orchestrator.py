@@ -1,6 +1,8 @@
 # simple_dynamic_orchestrator.py
 import os
 import re
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional, Any
 from dotenv import load_dotenv
 
@@ -19,10 +21,29 @@ class SimpleDynamicOrchestrator:
     based on user prompts using keyword analysis and intent detection.
     """
     
-    def __init__(self, llm=None, verbose: bool = False):
+    def __init__(self, llm=None, verbose: bool = False, max_concurrency: Optional[int] = None):
         self.llm = llm or GeminiClient(model_name="gemini-2.5-flash")
         self.verbose = verbose
         
+        # Upper bound on agents executed at once for "parallel" coordination (1 = sequential)
+        if max_concurrency is None:
+            try:
+                max_concurrency = int(os.getenv("AGENT_MAX_CONCURRENCY", "3"))
+            except Exception:
+                max_concurrency = 3
+        self.max_concurrency = max(1, max_concurrency)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        
+        # Dedicated pools for aprocess_query: agents run in the I/O pool (openFDA,
+        # Neo4j, Gemini); only the retrieval/scoring stage (embeddings/FAISS) uses the CPU pool
+        try:
+            self.cpu_workers = max(1, int(os.getenv("ORCHESTRATOR_CPU_WORKERS", "2")))
+            self.io_workers = max(1, int(os.getenv("ORCHESTRATOR_IO_WORKERS", "16")))
+        except Exception:
+            self.cpu_workers, self.io_workers = 2, 16
+        self._cpu_executor: Optional[ThreadPoolExecutor] = None
+        self._io_executor: Optional[ThreadPoolExecutor] = None
+        
         # Track available agents regardless of individual init failures
         self.agents_available: List[str] = []
         
@@ -244,27 +265,17 @@ class SimpleDynamicOrchestrator:
         """
         info = {}
         
-        # Extract NCT ID
-        nct_match = re.search(r'NCT\d{8}', query, re.IGNORECASE)
-        if nct_match:
-            info['nct_id'] = nct_match.group().upper()
+        # Extract NCT IDs (the first one is kept as nct_id)
+        nct_ids = list(dict.fromkeys(m.upper() for m in re.findall(r'NCT\d{8}', query, re.IGNORECASE)))
+        if nct_ids:
+            info['nct_id'] = nct_ids[0]
             print(f"Extracted NCT ID: {info['nct_id']}")
+            if len(nct_ids) > 1:
+                info['nct_ids'] = nct_ids
+                print(f"Extracted NCT IDs: {', '.join(nct_ids)}")
         
         # Extract disease/condition
-        disease_patterns = [
-            (r'diabetes\w*', 'diabetes'),
-            (r'cancer\w*', 'cancer'), 
-            (r'alzheimer\w*', 'alzheimer'),
-            (r'parkinson\w*', 'parkinson'),
-            (r'covid\w*', 'covid'),
-            (r'heart\s+disease', 'heart disease'),
-            (r'stroke\w*', 'stroke'),
-            (r'asthma\w*', 'asthma'),
-            (r'depression\w*', 'depression'),
-            (r'hiv\w*', 'hiv')
-        ]
-        
-        for pattern, condition in disease_patterns:
+        for pattern, condition in self.DISEASE_PATTERNS:
             if re.search(pattern, query, re.IGNORECASE):
                 info['condition'] = condition
                 print(f"Extracted condition: {condition}")
@@ -285,8 +296,124 @@ class SimpleDynamicOrchestrator:
                     print(f"Extracted drug: {drug_name}")
                     break
         
+        # Several drugs being compared ("compare X, Y and Z", "X vs Y")
+        drugs = self.extract_compared_drugs(query, info.get('condition'))
+        if drugs:
+            info['drugs'] = drugs
+            print(f"Extracted drugs: {', '.join(drugs)}")
+        
+        # Structured trial filters (phase / status / study type) for prefiltered search
+        filters = {}
+        phases = re.findall(r'\bphase\s*(iv|iii|ii|i|[1-4])\b', query, re.IGNORECASE)
+        if phases:
+            filters['phase'] = [f"phase {p.lower()}" for p in dict.fromkeys(phases)]
+        status_patterns = [
+            (r'not\s+yet\s+recruiting', 'not yet recruiting'),
+            (r'active,?\s+not\s+recruiting', 'active not recruiting'),
+            (r'(?<!not yet )\brecruiting\b', 'recruiting'),
+            (r'\bcompleted\b', 'completed'),
+            (r'\bterminated\b', 'terminated'),
+            (r'\bwithdrawn\b', 'withdrawn'),
+            (r'\bsuspended\b', 'suspended'),
+        ]
+        statuses = []
+        for pattern, status in status_patterns:
+            if re.search(pattern, query, re.IGNORECASE):
+                statuses.append(status)
+                query = re.sub(pattern, ' ', query, flags=re.IGNORECASE)
+        if statuses:
+            filters['status'] = statuses
+        study_types = re.findall(r'\b(interventional|observational)\b', query, re.IGNORECASE)
+        if study_types:
+            filters['study_type'] = list(dict.fromkeys(t.lower() for t in study_types))
+        if filters:
+            info['filters'] = filters
+            print(f"Extracted trial filters: {filters}")
+        
         return info
     
+    DISEASE_PATTERNS = [
+        (r'diabetes\w*', 'diabetes'),
+        (r'cancer\w*', 'cancer'), 
+        (r'alzheimer\w*', 'alzheimer'),
+        (r'parkinson\w*', 'parkinson'),
+        (r'covid\w*', 'covid'),
+        (r'heart\s+disease', 'heart disease'),
+        (r'stroke\w*', 'stroke'),
+        (r'asthma\w*', 'asthma'),
+        (r'depression\w*', 'depression'),
+        (r'hiv\w*', 'hiv')
+    ]
+    
+    # Comparison span, ending at a context clause or punctuation: "X compares with Y",
+    # "compare ...", or "X vs Y"
+    COMPARISON_PATTERNS = [
+        r'([\w-]+\s+compar(?:e|es|ed)\s+(?:with|to|against)\s+.+?)(?=\s+(?:for|in|among|during|when|if)\b|[?.;!]|$)',
+        r'compar\w*\s+(.+?)(?=\s+(?:for|in|among|during|when|if)\b|[?.;!]|$)',
+        r'([\w-]+(?:\s*,\s*[\w-]+)*\s+(?:vs\.?|versus)\s+[\w-]+)',
+    ]
+    # Words around a drug name that describe what is compared ("the risks of", "side effects")
+    COMPARISON_QUALIFIERS = (
+        r'the|a|an|their|its|those|safety|efficacy|effectiveness|risks?|benefits?|side\s+effects?|'
+        r'adverse\s+(?:events?|effects?|reactions?)|outcomes?|results?|enrollment|data|profiles?|'
+        r'trials?|studies|study|labels?|warnings?|interactions?|doses?|dosing|use|drugs?|medications?|treatments?'
+    )
+    # Trial attributes and IDs that are never drug names ("phase 2", "recruiting", "NCT01234567")
+    NON_DRUG_TERMS = re.compile(
+        r'^(?:phase\s*(?:iv|iii|ii|i|[1-4])?|early\s+phase.*|(?:not\s+yet\s+|active,?\s+not\s+)?recruiting|'
+        r'completed|terminated|withdrawn|suspended|active|interventional|observational|placebo|patients?|'
+        r'trials?|studies|them|both|each|other|others|nct\d{8})$',
+        re.IGNORECASE,
+    )
+    
+    @classmethod
+    def extract_compared_drugs(cls, query: str, condition: Optional[str] = None) -> List[str]:
+        """
+        Drug names from a comparison query, or [] when fewer than two remain.
+        
+        Supported phrasings (qualifiers before/after each name are dropped):
+        - "compare aspirin and warfarin", "compare aspirin, warfarin and heparin"
+        - "compare aspirin with warfarin" / "compare aspirin to warfarin"
+        - "compare the safety of aspirin and warfarin", "compare risks of aspirin and warfarin"
+        - "compare aspirin and warfarin side effects in elderly patients"
+        - "how does metformin compare with insulin", "aspirin compared to warfarin"
+        - "aspirin vs warfarin", "aspirin, heparin versus warfarin"
+        
+        Not treated as drugs: phase, status and study-type terms, NCT IDs and
+        diseases (DISEASE_PATTERNS or the extracted condition), so
+        "compare phase 2 and phase 3 enrollment" and
+        "compare recruiting trials in diabetes vs cancer" yield [].
+        Each name must be 1-3 word-like tokens starting with a letter.
+        """
+        leading = re.compile(rf'^(?:(?:{cls.COMPARISON_QUALIFIERS})\s+(?:(?:of|for|between|with|on|from)\s+)?)+', re.IGNORECASE)
+        trailing = re.compile(rf'(?:\s+(?:{cls.COMPARISON_QUALIFIERS}))+$', re.IGNORECASE)
+        qualifier_only = re.compile(rf'(?:{cls.COMPARISON_QUALIFIERS})(?:\s+(?:{cls.COMPARISON_QUALIFIERS}))*', re.IGNORECASE)
+        for pattern in cls.COMPARISON_PATTERNS:
+            match = re.search(pattern, query, re.IGNORECASE)
+            if not match:
+                continue
+            parts = re.split(
+                r'\s*,\s*|\s+(?:compar(?:e|es|ed)\s+)?(?:and|or|vs\.?|versus|with|to|against)\s+',
+                match.group(1).strip(),
+                flags=re.IGNORECASE,
+            )
+            drugs = []
+            for part in parts:
+                name = trailing.sub('', leading.sub('', part.strip())).strip()
+                tokens = name.split()
+                if not 0 < len(tokens) <= 3 or len(name) <= 2 or cls.NON_DRUG_TERMS.match(name) or qualifier_only.fullmatch(name):
+                    continue
+                if (condition and name.lower() == condition.lower()) or any(
+                    re.search(rf'\b{pattern}', name, re.IGNORECASE) for pattern, _ in cls.DISEASE_PATTERNS
+                ):
+                    continue
+                if all(re.fullmatch(r'[a-z][\w-]*', t, re.IGNORECASE) for t in tokens):
+                    drugs.append(name)
+            drugs = list(dict.fromkeys(drugs))
+            if len(drugs) > 1:
+                return drugs
+        return []
+    
     def execute_agent_analysis(self, agent_name: str, query: str, clinical_info: Dict[str, str]) -> Dict[str, Any]:
         """
         Execute analysis for a specific agent
@@ -309,7 +436,12 @@ class SimpleDynamicOrchestrator:
                 # Enrollment agent supports search_type and context
                 analysis_kwargs = {}
                 
-                if 'nct_id' in clinical_info:
+                if 'nct_ids' in clinical_info:
+                    # Several trials named: one batch lookup against the NCT ID index
+                    analysis_kwargs['search_type'] = 'nct_id'
+                    agent_query = " ".join(clinical_info['nct_ids'])
+                    print(f"Using batch NCT ID search for {agent_name}: {agent_query}")
+                elif 'nct_id' in clinical_info:
                     analysis_kwargs['search_type'] = 'nct_id'
                     agent_query = clinical_info['nct_id']
                     print(f"Using NCT ID search for {agent_name}: {clinical_info['nct_id']}")
@@ -323,6 +455,9 @@ class SimpleDynamicOrchestrator:
                     agent_query = clinical_info['drug']
                     print(f"Using drug context for {agent_name}: {clinical_info['drug']}")
                 
+                if 'filters' in clinical_info and 'nct_id' not in clinical_info:
+                    analysis_kwargs['filters'] = clinical_info['filters']
+                
                 result = agent.analyze(agent_query, **analysis_kwargs)
                 
             elif agent_name == "efficacy":
@@ -344,7 +479,12 @@ class SimpleDynamicOrchestrator:
                 # Safety agent takes query and analysis_type
                 analysis_kwargs = {}
                 
-                if 'drug' in clinical_info:
+                if len(clinical_info.get('drugs', [])) > 1:
+                    # Labels for all compared drugs are fetched concurrently
+                    agent_query = ", ".join(clinical_info['drugs'])
+                    analysis_kwargs['drug_names'] = clinical_info['drugs']
+                    print(f"Using multi-drug analysis for {agent_name}: {agent_query}")
+                elif 'drug' in clinical_info:
                     agent_query = clinical_info['drug']
                     analysis_kwargs['analysis_type'] = 'drug'
                     print(f"Using drug analysis for {agent_name}: {clinical_info['drug']}")
@@ -380,12 +520,52 @@ class SimpleDynamicOrchestrator:
                 "query_used": agent_query
             }
     
-    def synthesize_results(self, agent_results: List[Dict[str, Any]], original_query: str) -> Dict[str, Any]:
+    def _execute_and_report(self, agent_name: str, query: str, clinical_info: Dict[str, str]) -> Dict[str, Any]:
+        print(f"  ⚡ Executing {agent_name} agent...")
+        result = self.execute_agent_analysis(agent_name, query, clinical_info)
+        status_emoji = "✅" if result['status'] == 'success' else "❌"
+        print(f"  {status_emoji} {agent_name} agent completed - Status: {result['status']}")
+        return result
+    
+    def run_agents(self, agent_names: List[str], query: str, clinical_info: Dict[str, str],
+                   coordination_strategy: str = "parallel") -> List[Dict[str, Any]]:
         """
-        Synthesize results from multiple agents using the reasoning agent
+        Execute the given agents and return their results in activation order.
+        With the "parallel" strategy agents are fanned out over a shared thread pool
+        bounded by max_concurrency, so a multi-agent query costs roughly as much as
+        its slowest agent rather than the sum of all of them.
+        """
+        if coordination_strategy != "parallel" or len(agent_names) < 2 or self.max_concurrency < 2:
+            return [self._execute_and_report(name, query, clinical_info) for name in agent_names]
+        
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="agent")
+        futures = [
+            self._executor.submit(self._execute_and_report, name, query, clinical_info)
+            for name in agent_names
+        ]
+        results = []
+        for agent_name, future in zip(agent_names, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                # execute_agent_analysis already traps agent errors; this guards the pool itself
+                results.append({
+                    "agent": agent_name,
+                    "status": "error",
+                    "error": str(e),
+                    "query_used": query
+                })
+        return results
+    
+    @staticmethod
+    def _prepare_synthesis(agent_results: List[Dict[str, Any]], original_query: str):
+        """
+        Returns (final_result, None) when no LLM synthesis is needed, otherwise
+        (None, {agent: result}) for the reasoning agent
         """
         if not agent_results:
-            return {"error": "No agent results to synthesize"}
+            return {"error": "No agent results to synthesize"}, None
         
         successful_results = [r for r in agent_results if r["status"] == "success"]
         
@@ -401,7 +581,7 @@ class SimpleDynamicOrchestrator:
                 "error_details": error_summary,
                 "individual_results": agent_results,
                 "original_query": original_query
-            }
+            }, None
         
         # If only one agent succeeded, return its result directly with minimal synthesis
         if len(successful_results) == 1:
@@ -412,46 +592,92 @@ class SimpleDynamicOrchestrator:
                 "activated_agents": [result["agent"]],
                 "individual_results": agent_results,
                 "synthesized_summary": f"Analysis from {result['agent']} agent:\n\n{result['result']}"
-            }
+            }, None
         
         # Prepare synthesis input for multiple agents
         synthesis_input = {}
         for result in successful_results:
             synthesis_input[result["agent"]] = result["result"]
+        return None, synthesis_input
+    
+    @staticmethod
+    def _fallback_summary(synthesis_input: Dict[str, str]) -> str:
+        final_summary = "Multiple agent analysis:\n\n"
+        for agent_name, result in synthesis_input.items():
+            final_summary += f"=== {agent_name.upper()} ANALYSIS ===\n"
+            final_summary += result + "\n\n"
+        return final_summary
+    
+    @staticmethod
+    def _synthesized(agent_results: List[Dict[str, Any]], original_query: str, synthesis_input: Dict[str, str], final_summary: str) -> Dict[str, Any]:
+        return {
+            "status": "success",
+            "original_query": original_query,
+            "activated_agents": list(synthesis_input.keys()),
+            "individual_results": agent_results,
+            "synthesized_summary": final_summary
+        }
+    
+    @staticmethod
+    def _synthesis_failed(agent_results: List[Dict[str, Any]], original_query: str, synthesis_input: Dict[str, str], error: Exception) -> Dict[str, Any]:
+        print(f"Synthesis error: {error}")
+        # Return individual results if synthesis fails
+        return {
+            "status": "partial_success",
+            "error": f"Synthesis failed: {str(error)}",
+            "original_query": original_query,
+            "activated_agents": list(synthesis_input.keys()),
+            "individual_results": agent_results
+        }
+    
+    def synthesize_results(self, agent_results: List[Dict[str, Any]], original_query: str) -> Dict[str, Any]:
+        """
+        Synthesize results from multiple agents using the reasoning agent
+        """
+        final_result, synthesis_input = self._prepare_synthesis(agent_results, original_query)
+        if final_result is not None:
+            return final_result
         
         # Use reasoning agent for synthesis if available
         try:
             if self.reasoning_agent:
                 final_summary = self.reasoning_agent.synthesize(synthesis_input)
             else:
-                # Fallback synthesis
-                final_summary = "Multiple agent analysis:\n\n"
-                for agent_name, result in synthesis_input.items():
-                    final_summary += f"=== {agent_name.upper()} ANALYSIS ===\n"
-                    final_summary += result + "\n\n"
-            
-            return {
-                "status": "success",
-                "original_query": original_query,
-                "activated_agents": list(synthesis_input.keys()),
-                "individual_results": agent_results,
-                "synthesized_summary": final_summary
-            }
+                final_summary = self._fallback_summary(synthesis_input)
+            return self._synthesized(agent_results, original_query, synthesis_input, final_summary)
         except Exception as e:
-            print(f"Synthesis error: {e}")
-            # Return individual results if synthesis fails
-            return {
-                "status": "partial_success",
-                "error": f"Synthesis failed: {str(e)}",
-                "original_query": original_query,
-                "activated_agents": list(synthesis_input.keys()),
-                "individual_results": agent_results
-            }
+            return self._synthesis_failed(agent_results, original_query, synthesis_input, e)
     
-    def process_query(self, query: str) -> Dict[str, Any]:
+    async def asynthesize_results(self, agent_results: List[Dict[str, Any]], original_query: str) -> Dict[str, Any]:
         """
-        Main method to process user queries dynamically
+        Async variant of synthesize_results: awaits the reasoning agent's Gemini
+        call on the event loop instead of holding an I/O pool thread for it
         """
+        final_result, synthesis_input = self._prepare_synthesis(agent_results, original_query)
+        if final_result is not None:
+            return final_result
+        
+        try:
+            if self.reasoning_agent:
+                final_summary = await self.reasoning_agent.asynthesize(synthesis_input)
+            else:
+                final_summary = self._fallback_summary(synthesis_input)
+            return self._synthesized(agent_results, original_query, synthesis_input, final_summary)
+        except Exception as e:
+            return self._synthesis_failed(agent_results, original_query, synthesis_input, e)
+    
+    def _cpu_pool(self) -> ThreadPoolExecutor:
+        if self._cpu_executor is None:
+            self._cpu_executor = ThreadPoolExecutor(max_workers=self.cpu_workers, thread_name_prefix="orch-cpu")
+        return self._cpu_executor
+    
+    def _io_pool(self) -> ThreadPoolExecutor:
+        if self._io_executor is None:
+            self._io_executor = ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix="orch-io")
+        return self._io_executor
+    
+    def _plan_query(self, query: str):
+        """Intent analysis and clinical info extraction shared by process_query and aprocess_query"""
         print(f"\n📝 Processing query: {query}")
         
         # Analyze query intent
@@ -461,34 +687,95 @@ class SimpleDynamicOrchestrator:
         # Extract clinical trial information
         clinical_info = self.extract_clinical_trial_info(query)
         
-        # Execute agent analyses
-        agent_results = []
         activated_agents = intent_analysis["agents_to_activate"]
-        
+        if activated_agents:
+            print(f"🚀 Activating {len(activated_agents)} agent(s): {', '.join(activated_agents)}")
+        return intent_analysis, clinical_info
+    
+    @staticmethod
+    def _no_agents(query: str) -> Dict[str, Any]:
+        return {
+            "status": "error",
+            "error": "No suitable agents available for this query",
+            "original_query": query
+        }
+    
+    @staticmethod
+    def _report_completion(agent_results: List[Dict[str, Any]]) -> None:
+        success_count = sum(1 for r in agent_results if r['status'] == 'success')
+        print(f"✨ Analysis complete - {success_count}/{len(agent_results)} agents successful")
+    
+    async def aprocess_query(self, query: str) -> Dict[str, Any]:
+        """
+        Async entry point for process_query that keeps the event loop free. Agents
+        run in the I/O pool (their LLM, openFDA and Neo4j calls block on the
+        network), at most max_concurrency at a time for "parallel" coordination.
+        Only the Enrollment Agent's retrieval/scoring stage (encoding, FAISS, BM25)
+        is handed to the small CPU pool, so CPU work is bounded without capping
+        how many LLM calls can be waiting at once. The final synthesis awaits the
+        reasoning agent directly on the loop.
+        """
+        intent_analysis, clinical_info = self._plan_query(query)
+        activated_agents = intent_analysis["agents_to_activate"]
         if not activated_agents:
-            return {
-                "status": "error",
-                "error": "No suitable agents available for this query",
-                "original_query": query
-            }
+            return self._no_agents(query)
         
-        print(f"🚀 Activating {len(activated_agents)} agent(s): {', '.join(activated_agents)}")
+        if self.enrollment_agent is not None:
+            self.enrollment_agent.cpu_executor = self._cpu_pool()
+        loop = asyncio.get_running_loop()
+        parallel = intent_analysis["coordination_strategy"] == "parallel"
+        limit = asyncio.Semaphore(self.max_concurrency if parallel else 1)
         
-        for agent_name in activated_agents:
-            print(f"  ⚡ Executing {agent_name} agent...")
-            result = self.execute_agent_analysis(agent_name, query, clinical_info)
-            agent_results.append(result)
-            
-            status_emoji = "✅" if result['status'] == 'success' else "❌"
-            print(f"  {status_emoji} {agent_name} agent completed - Status: {result['status']}")
+        async def run(name: str) -> Dict[str, Any]:
+            async with limit:
+                return await loop.run_in_executor(self._io_pool(), self._execute_and_report, name, query, clinical_info)
+        
+        outcomes = await asyncio.gather(*[run(name) for name in activated_agents], return_exceptions=True)
+        agent_results = []
+        for agent_name, outcome in zip(activated_agents, outcomes):
+            if isinstance(outcome, BaseException):
+                agent_results.append({
+                    "agent": agent_name,
+                    "status": "error",
+                    "error": str(outcome),
+                    "query_used": query
+                })
+            else:
+                agent_results.append(outcome)
         
-        # Synthesize results
         print("🔄 Synthesizing results...")
-        final_result = self.synthesize_results(agent_results, query)
+        final_result = await self.asynthesize_results(agent_results, query)
+        self._report_completion(agent_results)
+        return final_result
+    
+    def shutdown(self) -> None:
+        """Release worker pools (safe to call more than once)"""
+        for attr in ("_executor", "_cpu_executor", "_io_executor"):
+            pool = getattr(self, attr)
+            if pool is not None:
+                pool.shutdown(wait=False)
+                setattr(self, attr, None)
+        if self.enrollment_agent is not None:
+            self.enrollment_agent.cpu_executor = None
+        if self.safety_agent is not None:
+            self.safety_agent.shutdown()
+    
+    def process_query(self, query: str) -> Dict[str, Any]:
+        """
+        Main method to process user queries dynamically
+        """
+        intent_analysis, clinical_info = self._plan_query(query)
+        activated_agents = intent_analysis["agents_to_activate"]
+        if not activated_agents:
+            return self._no_agents(query)
         
-        success_count = sum(1 for r in agent_results if r['status'] == 'success')
-        print(f"✨ Analysis complete - {success_count}/{len(agent_results)} agents successful")
+        # Execute agent analyses
+        agent_results = self.run_agents(activated_agents, query, clinical_info, intent_analysis["coordination_strategy"])
         
+        # Synthesize results
+        print("🔄 Synthesizing results...")
+        final_result = self.synthesize_results(agent_results, query)
+        self._report_completion(agent_results)
         return final_result
 
     def get_agent_capabilities(self) -> Dict[str, str]:
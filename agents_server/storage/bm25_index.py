@@ -0,0 +1,144 @@
+"""
+BM25 inverted index over the trial documents (row_to_text), for hybrid search.
+
+Lexical matching catches rare condition and drug names that MiniLM embeds
+poorly; reciprocal-rank fusion (rrf_fuse) merges its ranking with the FAISS
+ranking without having to calibrate the two score scales.
+
+Postings are stored CSR-style: for term t, rows doc_ids[offsets[t]:offsets[t+1]]
+with precomputed BM25 weights (idf * saturated, length-normalized tf) in the
+same slice, so a query is a handful of gathers and adds into one score array.
+scripts/load_faiss.py saves the arrays as <base>.bm25_*.npy next to the trial
+store and load() memory-maps them; terms are found by binary search over the
+sorted vocabulary, so loading builds nothing per worker. The agent builds the
+index in memory only for DataFrame-backed trials (CSV / pickle fallback).
+"""
+from __future__ import annotations
+
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# Field labels from row_to_text and filler words that carry no signal
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it not of on or that the to was were with "
+    "n/a na disease nct id status why stopped eligibility phase conditions study type".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(str(text).lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+class BM25Index:
+    def __init__(self, vocab: np.ndarray, offsets: np.ndarray, doc_ids: np.ndarray, weights: np.ndarray, n_docs: int, k1: float = 1.2, b: float = 0.75):
+        # Sorted terms; term id = position
+        self.vocab = vocab
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.n_docs = int(n_docs)
+        self.k1 = k1
+        self.b = b
+
+    def __len__(self) -> int:
+        return self.n_docs
+
+    # ---------- build / persist ----------
+    @classmethod
+    def build(cls, documents: Iterable[str], k1: float = 1.2, b: float = 0.75) -> "BM25Index":
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        lengths: List[int] = []
+        for pos, doc in enumerate(documents):
+            tokens = tokenize(doc)
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append((pos, tf))
+
+        n = len(lengths)
+        doc_len = np.asarray(lengths, dtype=np.float32)
+        avgdl = float(doc_len.mean()) if n and doc_len.sum() else 1.0
+        vocab = sorted(postings)
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        for i, term in enumerate(vocab):
+            offsets[i + 1] = offsets[i] + len(postings[term])
+        doc_ids = np.empty(int(offsets[-1]), dtype=np.int32)
+        weights = np.empty(int(offsets[-1]), dtype=np.float32)
+        for i, term in enumerate(vocab):
+            rows = postings[term]
+            docs = np.fromiter((d for d, _ in rows), dtype=np.int32, count=len(rows))
+            tf = np.fromiter((f for _, f in rows), dtype=np.float32, count=len(rows))
+            df = len(rows)
+            # Lucene's idf variant: always positive
+            idf = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+            norm = k1 * (1.0 - b + b * doc_len[docs] / avgdl)
+            doc_ids[offsets[i]:offsets[i + 1]] = docs
+            weights[offsets[i]:offsets[i + 1]] = idf * tf * (k1 + 1.0) / (tf + norm)
+        return cls(np.array(vocab, dtype=str), offsets, doc_ids, weights, n, k1, b)
+
+    def save(self, base_path: str) -> None:
+        from storage.trial_store import TrialStore
+
+        TrialStore.save_array(base_path, "bm25_vocab", self.vocab)
+        TrialStore.save_array(base_path, "bm25_offsets", self.offsets)
+        TrialStore.save_array(base_path, "bm25_doc_ids", self.doc_ids)
+        TrialStore.save_array(base_path, "bm25_weights", self.weights)
+        TrialStore.save_array(base_path, "bm25_params", np.array([self.n_docs, self.k1, self.b], dtype=np.float64))
+
+    @classmethod
+    def load(cls, trials) -> Optional["BM25Index"]:
+        """Memory-mapped index saved next to the trial store, or None when missing."""
+        arrays = [trials.open_array(f"bm25_{name}") for name in ("vocab", "offsets", "doc_ids", "weights", "params")]
+        if any(a is None for a in arrays):
+            return None
+        vocab, offsets, doc_ids, weights, params = arrays
+        n_docs, k1, b = params.tolist()
+        return cls(vocab, offsets, doc_ids, weights, int(n_docs), k1, b)
+
+    def term_id(self, term: str) -> Optional[int]:
+        t = int(np.searchsorted(self.vocab, term))
+        return t if t < len(self.vocab) and self.vocab[t] == term else None
+
+    # ---------- query ----------
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            t = self.term_id(term)
+            if t is None:
+                continue
+            start, end = self.offsets[t], self.offsets[t + 1]
+            # Row ids are unique within a posting list, so fancy-index add is safe
+            scores[self.doc_ids[start:end]] += self.weights[start:end]
+        return scores
+
+    def search(self, query: str, top_k: int = 10, rows: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Top rows as (position, score); rows outside `rows` (sorted allowlist) and rows with no matching term are dropped."""
+        scores = self.scores(query)
+        if rows is not None:
+            hits = rows[scores[rows] > 0]
+        else:
+            hits = np.flatnonzero(scores > 0)
+        if not len(hits) or top_k <= 0:
+            return []
+        if len(hits) > top_k:
+            hits = hits[np.argpartition(-scores[hits], top_k - 1)[:top_k]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return [(int(pos), float(scores[pos])) for pos in hits]
+
+
+def rrf_fuse(rankings: Sequence[Sequence[int]], k: int = 60, top_k: Optional[int] = None) -> List[Tuple[int, float]]:
+    """
+    Reciprocal-rank fusion: score(d) = sum over rankings of 1 / (k + rank(d)),
+    ranks starting at 1. Ties keep first-seen order.
+    """
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, pos in enumerate(ranking, start=1):
+            fused[pos] = fused.get(pos, 0.0) + 1.0 / (k + rank)
+    ordered = sorted(fused.items(), key=lambda item: -item[1])
+    return ordered[:top_k] if top_k else ordered
@@ -0,0 +1,108 @@
+"""
+Persistent cache for openFDA label responses.
+
+Entries are keyed on the normalized request parameters (case/whitespace-folded
+search string, sorted keys, API key excluded). 200 responses are kept for
+OPENFDA_CACHE_TTL; 404 "no data" answers (misspelled or unknown drugs) are
+cached too, for the shorter OPENFDA_CACHE_NEGATIVE_TTL. Only the status code
+and payload are stored; the request URL (which may carry the API key) is not.
+
+Environment variables:
+- OPENFDA_CACHE: 1 to enable (default 1)
+- OPENFDA_CACHE_TTL: seconds to keep label payloads (default 604800, 7 days)
+- OPENFDA_CACHE_NEGATIVE_TTL: seconds to keep 404 results (default 21600, 6 hours)
+- OPENFDA_CACHE_MAX_ENTRIES: size bound (default 20000)
+- OPENFDA_CACHE_PATH: SQLite file (default outputs/openfda_cache.sqlite3)
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Any, Dict, Optional
+
+from storage.ttl_cache import SQLiteTTLCache
+
+
+def normalize_params(params: Dict[str, Any]) -> str:
+    normalized = {}
+    for key, value in params.items():
+        if key == "api_key":
+            continue
+        if isinstance(value, str):
+            value = re.sub(r"\s+", " ", value.strip().lower())
+        normalized[key] = value
+    return json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+
+
+class FDALabelCache:
+    def __init__(self, path: str, ttl: float = 604800, negative_ttl: float = 21600, max_entries: int = 20000):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._store = SQLiteTTLCache(path, max_entries=max_entries, ttl=ttl, table="openfda_labels")
+        self._counters = {"hits": 0, "negative_hits": 0, "misses": 0, "stores": 0, "negative_stores": 0}
+        self._counter_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional["FDALabelCache"]:
+        if os.getenv("OPENFDA_CACHE", "1") == "0":
+            return None
+        try:
+            ttl = float(os.getenv("OPENFDA_CACHE_TTL", "604800"))
+            negative_ttl = float(os.getenv("OPENFDA_CACHE_NEGATIVE_TTL", "21600"))
+            max_entries = int(os.getenv("OPENFDA_CACHE_MAX_ENTRIES", "20000"))
+        except Exception:
+            ttl, negative_ttl, max_entries = 604800, 21600, 20000
+        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        path = os.getenv("OPENFDA_CACHE_PATH") or os.path.join(base_dir, "outputs", "openfda_cache.sqlite3")
+        try:
+            return cls(path, ttl=ttl, negative_ttl=negative_ttl, max_entries=max_entries)
+        except Exception as e:
+            print(f"openFDA cache disabled: {e}")
+            return None
+
+    @staticmethod
+    def key(base_url: str, params: Dict[str, Any]) -> str:
+        raw = f"{base_url}?{normalize_params(params)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _count(self, name: str) -> None:
+        with self._counter_lock:
+            self._counters[name] += 1
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Cached {"status_code", "data"} entry, or None on a miss."""
+        try:
+            entry = self._store.get(key)
+        except Exception as e:
+            print(f"openFDA cache read failed: {e}")
+            entry = None
+        if entry is None:
+            self._count("misses")
+            return None
+        self._count("negative_hits" if entry.get("status_code") == 404 else "hits")
+        return entry
+
+    def put(self, key: str, status_code: int, data: Optional[Dict[str, Any]]) -> None:
+        if status_code == 200:
+            ttl, counter = self.ttl, "stores"
+        elif status_code == 404:
+            ttl, counter = self.negative_ttl, "negative_stores"
+        else:
+            return
+        try:
+            self._store.set(key, {"status_code": status_code, "data": data}, ttl=ttl)
+            self._count(counter)
+        except Exception as e:
+            print(f"openFDA cache write failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._counter_lock:
+            counters = dict(self._counters)
+        hits = counters["hits"] + counters["negative_hits"]
+        lookups = hits + counters["misses"]
+        counters["hit_rate"] = (hits / lookups) if lookups else 0.0
+        counters["entries"] = len(self._store)
+        return counters
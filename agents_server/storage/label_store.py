@@ -0,0 +1,168 @@
+"""
+Local openFDA drug-label store (SQLite + FTS5).
+
+Built offline from the openFDA bulk drug-label dumps by
+scripts/load_openfda_labels.py. Full label JSON is kept in `labels`; the
+`labels_fts` index covers generic_name, brand_name, indications_and_usage
+and purpose, so SafetyAgent's drug and disease lookups run locally in
+milliseconds and return the same label dicts as the live API.
+"""
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+FTS_COLUMNS = ("generic_name", "brand_name", "indications_and_usage", "purpose")
+
+
+def _field_text(value: Any) -> str:
+    if isinstance(value, list):
+        return " ".join(str(v) for v in value)
+    return str(value) if value else ""
+
+
+def _phrase(text: str) -> str:
+    """Quote free text as a single FTS5 phrase."""
+    return '"' + " ".join(text.split()).replace('"', '""') + '"'
+
+
+class LabelStore:
+    def __init__(self, path: str, readonly: bool = False):
+        self.path = path
+        if readonly:
+            self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        if not readonly:
+            self._create_schema()
+
+    @classmethod
+    def open_existing(cls, path: str) -> Optional["LabelStore"]:
+        """Open a built store read-only, or None if it is missing or empty."""
+        if not os.path.exists(path):
+            return None
+        try:
+            store = cls(path, readonly=True)
+            if store.count() == 0:
+                store.close()
+                return None
+            return store
+        except sqlite3.Error as e:
+            print(f"Local label store unavailable ({path}): {e}")
+            return None
+
+    def _create_schema(self) -> None:
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS labels ("
+                " id INTEGER PRIMARY KEY,"
+                " label_id TEXT UNIQUE,"
+                " effective_time TEXT,"
+                " doc TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS labels_fts USING fts5("
+                f"{', '.join(FTS_COLUMNS)}, content='', tokenize='unicode61')"
+            )
+            self._conn.commit()
+
+    # ---------- ingestion ----------
+    def ingest(self, labels: Iterable[Dict[str, Any]], batch_size: int = 1000) -> int:
+        """Insert labels (openFDA `results` entries), one row per set_id holding the
+        newest effective_time; returns the number written (older versions are skipped)."""
+        written = 0
+        batch: List[Dict[str, Any]] = []
+        for label in labels:
+            batch.append(label)
+            if len(batch) >= batch_size:
+                written += self._insert_batch(batch)
+                batch = []
+        if batch:
+            written += self._insert_batch(batch)
+        return written
+
+    def _insert_batch(self, labels: List[Dict[str, Any]]) -> int:
+        written = 0
+        with self._lock:
+            cur = self._conn.cursor()
+            for label in labels:
+                # set_id is stable across versions of a label; id changes with each version
+                label_id = label.get("set_id") or label.get("id")
+                effective_time = label.get("effective_time") or ""
+                if label_id is not None:
+                    # Keep only the newest version of each label (ties go to the later dump)
+                    row = cur.execute("SELECT id, effective_time FROM labels WHERE label_id = ?", (label_id,)).fetchone()
+                    if row is not None:
+                        if (row[1] or "") > effective_time:
+                            continue
+                        self._delete_locked(cur, row[0])
+                cur.execute(
+                    "INSERT INTO labels (label_id, effective_time, doc) VALUES (?, ?, ?)",
+                    (label_id, label.get("effective_time"), json.dumps(label, ensure_ascii=False)),
+                )
+                cur.execute(
+                    f"INSERT INTO labels_fts (rowid, {', '.join(FTS_COLUMNS)}) VALUES (?, ?, ?, ?, ?)",
+                    (cur.lastrowid, *self._fts_values(label)),
+                )
+                written += 1
+            self._conn.commit()
+        return written
+
+    @staticmethod
+    def _fts_values(label: Dict[str, Any]) -> List[str]:
+        openfda = label.get("openfda", {}) or {}
+        return [
+            _field_text(openfda.get("generic_name")),
+            _field_text(openfda.get("brand_name")),
+            _field_text(label.get("indications_and_usage")),
+            _field_text(label.get("purpose")),
+        ]
+
+    def _delete_locked(self, cur: sqlite3.Cursor, rowid: int) -> None:
+        (doc,) = cur.execute("SELECT doc FROM labels WHERE id = ?", (rowid,)).fetchone()
+        # Contentless FTS5 tables are deleted by re-supplying the indexed values
+        cur.execute(
+            f"INSERT INTO labels_fts (labels_fts, rowid, {', '.join(FTS_COLUMNS)}) VALUES ('delete', ?, ?, ?, ?, ?)",
+            (rowid, *self._fts_values(json.loads(doc))),
+        )
+        cur.execute("DELETE FROM labels WHERE id = ?", (rowid,))
+
+    def optimize(self) -> None:
+        with self._lock:
+            self._conn.execute("INSERT INTO labels_fts (labels_fts) VALUES ('optimize')")
+            self._conn.commit()
+
+    # ---------- queries ----------
+    def _match(self, expression: str, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT labels.doc FROM labels_fts JOIN labels ON labels.id = labels_fts.rowid "
+                "WHERE labels_fts MATCH ? ORDER BY labels_fts.rank, labels.effective_time DESC LIMIT ?",
+                (expression, int(limit)),
+            ).fetchall()
+        return [json.loads(doc) for (doc,) in rows]
+
+    def search_drug(self, drug_name: str, limit: int = 1) -> List[Dict[str, Any]]:
+        """Labels whose generic or brand name contains the drug name (phrase match)."""
+        phrase = _phrase(drug_name.strip().lower())
+        return self._match(f"generic_name:{phrase} OR brand_name:{phrase}", limit)
+
+    def search_indication(self, disease: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Labels whose indications or purpose mention the disease (phrase match)."""
+        phrase = _phrase(disease.strip().lower())
+        return self._match(f"indications_and_usage:{phrase} OR purpose:{phrase}", limit)
+
+    def count(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM labels").fetchone()
+        return int(count)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
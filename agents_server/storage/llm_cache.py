@@ -0,0 +1,141 @@
+"""
+Content-addressed cache for LLM responses.
+
+Entries are keyed on (model_name, sha256(prompt), max_tokens, temperature) and
+kept in an in-memory LRU tier backed by an optional SQLite tier, so repeated
+prompts (fallback analyses for popular drugs, general-agent boilerplate) skip
+the Gemini round-trip entirely.
+
+Environment variables:
+- LLM_CACHE: 1 to enable (default 0)
+- LLM_CACHE_TTL: entry lifetime in seconds (default 86400)
+- LLM_CACHE_MAX_ENTRIES: in-memory LRU size (default 1024)
+- LLM_CACHE_DISK: 1 to enable the SQLite tier (default 1)
+- LLM_CACHE_DISK_MAX_ENTRIES: on-disk size bound (default 50000)
+- LLM_CACHE_PATH: SQLite file (default outputs/llm_cache.sqlite3)
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from storage.ttl_cache import LRUCache, SQLiteTTLCache
+
+
+def cache_key(model_name: str, prompt: str, max_tokens: int, temperature: float) -> str:
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    raw = json.dumps([model_name, prompt_hash, int(max_tokens), round(float(temperature), 4)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    def __init__(
+        self,
+        ttl: Optional[float] = 86400,
+        max_entries: int = 1024,
+        disk_path: Optional[str] = None,
+        disk_max_entries: int = 50000,
+    ):
+        self.ttl = ttl
+        self._memory = LRUCache(max_entries=max_entries, ttl=ttl)
+        self._disk: Optional[SQLiteTTLCache] = None
+        if disk_path:
+            try:
+                self._disk = SQLiteTTLCache(disk_path, max_entries=disk_max_entries, ttl=ttl, table="llm_responses")
+            except Exception as e:
+                print(f"LLM cache: disk tier disabled ({e})")
+                self._disk = None
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0}
+        self._counter_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional["LLMResponseCache"]:
+        if os.getenv("LLM_CACHE", "0") == "0":
+            return None
+        try:
+            ttl = float(os.getenv("LLM_CACHE_TTL", "86400"))
+            max_entries = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024"))
+            disk_max_entries = int(os.getenv("LLM_CACHE_DISK_MAX_ENTRIES", "50000"))
+        except Exception:
+            ttl, max_entries, disk_max_entries = 86400, 1024, 50000
+        disk_path = None
+        if os.getenv("LLM_CACHE_DISK", "1") != "0":
+            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            disk_path = os.getenv("LLM_CACHE_PATH") or os.path.join(base_dir, "outputs", "llm_cache.sqlite3")
+        return cls(ttl=ttl or None, max_entries=max_entries, disk_path=disk_path, disk_max_entries=disk_max_entries)
+
+    def _count(self, name: str) -> None:
+        with self._counter_lock:
+            self._counters[name] += 1
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._memory.get(key)
+        if value is not None:
+            self._count("memory_hits")
+            return value
+        return self._get_disk(key)
+
+    async def aget(self, key: str) -> Optional[str]:
+        """get() for coroutines: the memory tier inline, the SQLite tier in a worker thread."""
+        value = self._memory.get(key)
+        if value is not None:
+            self._count("memory_hits")
+            return value
+        if self._disk is None:
+            self._count("misses")
+            return None
+        return await asyncio.to_thread(self._get_disk, key)
+
+    def _get_disk(self, key: str) -> Optional[str]:
+        if self._disk is not None:
+            try:
+                value = self._disk.get(key)
+            except Exception as e:
+                print(f"LLM cache: disk read failed ({e})")
+                value = None
+            if value is not None:
+                # Promote to the memory tier for subsequent hits
+                self._memory.set(key, value)
+                self._count("disk_hits")
+                return value
+        self._count("misses")
+        return None
+
+    def set(self, key: str, value: str) -> None:
+        self._memory.set(key, value)
+        self._set_disk(key, value)
+        self._count("stores")
+
+    async def aset(self, key: str, value: str) -> None:
+        self._memory.set(key, value)
+        if self._disk is not None:
+            await asyncio.to_thread(self._set_disk, key, value)
+        self._count("stores")
+
+    def _set_disk(self, key: str, value: str) -> None:
+        if self._disk is not None:
+            try:
+                self._disk.set(key, value)
+            except Exception as e:
+                print(f"LLM cache: disk write failed ({e})")
+
+    def clear(self) -> None:
+        self._memory.clear()
+        if self._disk is not None:
+            self._disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._counter_lock:
+            counters = dict(self._counters)
+        hits = counters["memory_hits"] + counters["disk_hits"]
+        lookups = hits + counters["misses"]
+        counters.update({
+            "hit_rate": (hits / lookups) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_entries": len(self._disk) if self._disk is not None else 0,
+        })
+        return counters
@@ -4,18 +4,33 @@ Async MongoDB storage layer for chat memory, audit logs, and backups.
 Environment variables:
 - MONGODB_URI: MongoDB connection string
 - MONGODB_DB: Database name (default: ClinicalAgents)
+- MONGO_WRITE_BEHIND: 1 to buffer chat/audit inserts and flush them in the background (default 1)
+- MONGO_WRITE_BATCH: flush as soon as this many writes are buffered (default 100)
+- MONGO_WRITE_FLUSH_MS: otherwise flush at least this often (default 250)
+- MONGO_WRITE_QUEUE_MAX: buffered writes beyond this are dropped and counted (default 10000)
+
+Chat-path reads (get_recent_history, snapshot_session) never wait on a flush:
+they merge the session's still-buffered documents into what Mongo returns.
+Only the history/audit endpoints flush first. A batch whose insert fails is
+put back at the head of the buffer and retried on the next flush, up to
+MAX_FLUSH_ATTEMPTS times, before its documents are counted as dropped.
 
 Collections:
 - chat_memory: per-turn chat messages and agent outputs
 - audit_logs: detailed event logs across the pipeline
-- backups: periodic session snapshots for rollback
+- backups: periodic session snapshots for rollback. Snapshots are incremental:
+  "delta" documents hold only events since the previous snapshot's high-water
+  mark, and every SNAPSHOT_CHECKPOINT_EVERY snapshots the deltas are compacted
+  into a full "checkpoint" (older backups for the session are then removed).
+  restore_session() rebuilds a session from its checkpoint plus deltas.
 """
 from __future__ import annotations
 
 import os
 import asyncio
 import datetime as dt
-from typing import Any, Dict, List, Optional
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
 
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 from typing import TYPE_CHECKING
@@ -28,6 +43,8 @@ else:
 
 
 class AsyncMongoStore:
+    MAX_FLUSH_ATTEMPTS = 5
+
     def __init__(self, uri: Optional[str] = None, db_name: Optional[str] = None):
         self._uri = uri or os.getenv("MONGODB_URI")
         self._db_name = db_name or os.getenv("MONGODB_DB") or "ClinicalAgents"
@@ -35,6 +52,22 @@ class AsyncMongoStore:
         self._db: Optional[Any] = None
         self._lock = asyncio.Lock()
         self._indexes_created = False
+        # Write-behind buffer for chat/audit inserts (kept off the request path)
+        self._write_behind = os.getenv("MONGO_WRITE_BEHIND", "1") != "0"
+        try:
+            self._batch_size = max(1, int(os.getenv("MONGO_WRITE_BATCH", "100")))
+            self._flush_interval = max(0.01, int(os.getenv("MONGO_WRITE_FLUSH_MS", "250")) / 1000.0)
+            self._buffer_max = max(1, int(os.getenv("MONGO_WRITE_QUEUE_MAX", "10000")))
+        except Exception:
+            self._batch_size, self._flush_interval, self._buffer_max = 100, 0.25, 10000
+        # (collection, doc, failed flush attempts)
+        self._buffer: Deque[Tuple[str, Dict[str, Any], int]] = deque()
+        # Batch popped by the flusher whose insert has not finished yet
+        self._inflight: List[Tuple[str, Dict[str, Any], int]] = []
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self.write_stats = {"enqueued": 0, "flushed": 0, "dropped": 0, "failed_batches": 0, "retried": 0}
 
     async def _ensure_connected(self):
         if (self._client is not None) and (self._db is not None):
@@ -76,11 +109,133 @@ class AsyncMongoStore:
     def db_name(self) -> str:
         return self._db_name
 
-    # ---------- Chat Memory ----------
+    # ---------- Write path ----------
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=0.5, max=4), reraise=True)
-    async def save_chat_message(self, session_id: str, role: str, content: str, agent_outputs: Optional[Dict[str, Any]] = None) -> str:
+    async def _insert_one(self, collection: str, doc: Dict[str, Any]) -> str:
         await self._ensure_connected()
         assert self._db is not None
+        res = await self._db[collection].insert_one(doc)
+        return str(res.inserted_id)
+
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=0.5, max=4), reraise=True)
+    async def _insert_many(self, collection: str, docs: List[Dict[str, Any]]) -> None:
+        await self._ensure_connected()
+        assert self._db is not None
+        try:
+            await self._db[collection].insert_many(docs, ordered=False)
+        except Exception as e:
+            # A retried batch may hit its own earlier partial insert; duplicate _ids mean already written
+            errors = (getattr(e, "details", None) or {}).get("writeErrors") or []
+            if errors and all(err.get("code") == 11000 for err in errors):
+                return
+            raise
+
+    async def _write(self, collection: str, doc: Dict[str, Any]) -> str:
+        if not self._write_behind:
+            return await self._insert_one(collection, doc)
+        return self._enqueue(collection, doc)
+
+    def _enqueue(self, collection: str, doc: Dict[str, Any]) -> str:
+        try:
+            from bson import ObjectId  # type: ignore  # ships with pymongo/motor
+            doc.setdefault("_id", ObjectId())
+        except Exception:  # pragma: no cover
+            pass
+        if len(self._buffer) >= self._buffer_max:
+            self.write_stats["dropped"] += 1
+            return ""
+        self._buffer.append((collection, doc, 0))
+        self.write_stats["enqueued"] += 1
+        self._ensure_flusher()
+        if len(self._buffer) >= self._batch_size and self._wake is not None:
+            self._wake.set()
+        return str(doc.get("_id", ""))
+
+    def _ensure_flusher(self) -> None:
+        loop = asyncio.get_running_loop()
+        task = self._flush_task
+        if task is not None and not task.done() and task.get_loop() is loop:
+            return
+        self._wake = asyncio.Event()
+        self._flush_task = loop.create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        assert self._wake is not None
+        wake = self._wake
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(wake.wait(), timeout=self._flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                wake.clear()
+                await self.flush()
+        except asyncio.CancelledError:
+            # Loop is shutting down: drain what is left before exiting
+            await self.flush()
+            raise
+
+    async def flush(self) -> None:
+        """
+        Write all buffered chat/audit documents now (grouped insert_many per
+        collection). Waits for a batch the background flusher is still writing,
+        so reads issued after flush() see every earlier write.
+        """
+        async with self._flush_lock:
+            while self._buffer:
+                items = [self._buffer.popleft() for _ in range(min(len(self._buffer), self._batch_size))]
+                self._inflight = items
+                batch: Dict[str, List[Tuple[str, Dict[str, Any], int]]] = {}
+                for item in items:
+                    batch.setdefault(item[0], []).append(item)
+                failed: List[Tuple[str, Dict[str, Any], int]] = []
+                for collection, group in batch.items():
+                    try:
+                        await self._insert_many(collection, [doc for _, doc, _ in group])
+                        self.write_stats["flushed"] += len(group)
+                    except Exception as e:
+                        self.write_stats["failed_batches"] += 1
+                        failed.extend(group)
+                        print(f"Mongo write-behind flush failed for {collection} ({len(group)} docs): {e}")
+                self._inflight = []
+                if failed:
+                    self._requeue(failed)
+                    # Mongo is unhappy; try again on the next flush tick
+                    break
+
+    def _requeue(self, items: List[Tuple[str, Dict[str, Any], int]]) -> None:
+        """Put a failed batch back at the head of the buffer, oldest first."""
+        retry_items = [(c, d, attempts + 1) for c, d, attempts in items if attempts + 1 < self.MAX_FLUSH_ATTEMPTS]
+        room = max(0, self._buffer_max - len(self._buffer))
+        kept = retry_items[:room]
+        self.write_stats["dropped"] += len(items) - len(kept)
+        self.write_stats["retried"] += len(kept)
+        self._buffer.extendleft(reversed(kept))
+
+    def _pending(self, collection: str, session_id: str) -> List[Dict[str, Any]]:
+        """Copies of this session's documents not yet written to Mongo, oldest first."""
+        return [
+            dict(doc)
+            for c, doc, _ in list(self._inflight) + list(self._buffer)
+            if c == collection and doc.get("session_id") == session_id
+        ]
+
+    async def aclose(self) -> None:
+        """Flush pending writes and stop the background flusher (call on shutdown)."""
+        task, self._flush_task = self._flush_task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        await self.flush()
+
+    def write_behind_stats(self) -> Dict[str, Any]:
+        return {**self.write_stats, "enabled": self._write_behind, "pending": len(self._buffer) + len(self._inflight)}
+
+    # ---------- Chat Memory ----------
+    async def save_chat_message(self, session_id: str, role: str, content: str, agent_outputs: Optional[Dict[str, Any]] = None) -> str:
         doc = {
             "session_id": session_id,
             "role": role,
@@ -88,11 +243,11 @@ class AsyncMongoStore:
             "agent_outputs": agent_outputs or {},
             "timestamp": dt.datetime.utcnow(),
         }
-        res = await self._db["chat_memory"].insert_one(doc)
-        return str(res.inserted_id)
+        return await self._write("chat_memory", doc)
 
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=0.5, max=4), reraise=True)
     async def get_session_history(self, session_id: str) -> List[Dict[str, Any]]:
+        await self.flush()
         await self._ensure_connected()
         assert self._db is not None
         cursor = self._db["chat_memory"].find({"session_id": session_id}).sort("timestamp", 1)
@@ -105,11 +260,29 @@ class AsyncMongoStore:
                 doc["timestamp"] = doc["timestamp"].isoformat()
         return docs
 
-    # ---------- Audit Logs ----------
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=0.5, max=4), reraise=True)
-    async def log_event(self, session_id: str, event: str, agent_name: str, content: Dict[str, Any], status: str = "info") -> str:
+    async def get_recent_history(self, session_id: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """Last `limit` messages (role/content/timestamp only), oldest first.
+        Served by the (session_id, timestamp) index walked in reverse, plus any
+        of the session's messages still in the write-behind buffer (no flush)."""
+        limit = max(1, int(limit))
+        # Read the buffer before Mongo: a doc flushed in between shows up twice
+        # (deduplicated by _id) instead of not at all
+        pending = self._pending("chat_memory", session_id)
         await self._ensure_connected()
         assert self._db is not None
+        cursor = (
+            self._db["chat_memory"]
+            .find({"session_id": session_id}, {"_id": 1, "role": 1, "content": 1, "timestamp": 1})
+            .sort("timestamp", -1)
+            .limit(limit)
+        )
+        stored = [doc async for doc in cursor]
+        recent = self._merge_events(self._serialize_docs(stored), self._serialize_docs(pending))[-limit:]
+        return [{k: doc[k] for k in ("role", "content", "timestamp") if k in doc} for doc in recent]
+
+    # ---------- Audit Logs ----------
+    async def log_event(self, session_id: str, event: str, agent_name: str, content: Dict[str, Any], status: str = "info") -> str:
         doc = {
             "session_id": session_id,
             "event": event,
@@ -118,11 +291,11 @@ class AsyncMongoStore:
             "status": status,
             "timestamp": dt.datetime.utcnow(),
         }
-        res = await self._db["audit_logs"].insert_one(doc)
-        return str(res.inserted_id)
+        return await self._write("audit_logs", doc)
 
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=0.5, max=4), reraise=True)
     async def get_audit_logs(self, session_id: str) -> List[Dict[str, Any]]:
+        await self.flush()
         await self._ensure_connected()
         assert self._db is not None
         cursor = self._db["audit_logs"].find({"session_id": session_id}).sort("timestamp", 1)
@@ -136,21 +309,165 @@ class AsyncMongoStore:
         return docs
 
     # ---------- Backups ----------
+    @staticmethod
+    def _serialize_docs(docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # Convert ObjectId and datetime to string for JSON serialization
+        for doc in docs:
+            if "_id" in doc:
+                doc["_id"] = str(doc["_id"])
+            if "timestamp" in doc and hasattr(doc["timestamp"], "isoformat"):
+                doc["timestamp"] = doc["timestamp"].isoformat()
+        return docs
+
+    @staticmethod
+    def _merge_events(*groups: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Concatenate event lists, dropping duplicate _ids and ordering by timestamp."""
+        seen = set()
+        merged: List[Dict[str, Any]] = []
+        for group in groups:
+            for doc in group or []:
+                key = doc.get("_id")
+                if key is not None:
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                merged.append(doc)
+        merged.sort(key=lambda d: str(d.get("timestamp", "")))
+        return merged
+
+    @staticmethod
+    def _high_water_mark(docs: List[Dict[str, Any]], previous: Optional[dt.datetime]) -> Optional[dt.datetime]:
+        mark = previous
+        for doc in docs:
+            ts = doc.get("timestamp")
+            if isinstance(ts, str):
+                try:
+                    ts = dt.datetime.fromisoformat(ts)
+                except ValueError:
+                    continue
+            if isinstance(ts, dt.datetime) and (mark is None or ts > mark):
+                mark = ts
+        return mark
+
+    async def _events_since(self, collection: str, session_id: str, since: Optional[dt.datetime]) -> List[Dict[str, Any]]:
+        assert self._db is not None
+        query: Dict[str, Any] = {"session_id": session_id}
+        if since is not None:
+            # $gte so same-timestamp writes are not lost; duplicates are dropped on merge
+            query["timestamp"] = {"$gte": since}
+        cursor = self._db[collection].find(query).sort("timestamp", 1)
+        return self._serialize_docs([doc async for doc in cursor])
+
+    async def _load_backup_chain(self, session_id: str, full: bool = True) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Latest checkpoint (legacy full snapshots count as checkpoints) and the deltas after it.
+        With full=False the event lists are projected out, so only metadata is read."""
+        assert self._db is not None
+        projection = None if full else {"chat_memory": 0, "audit_logs": 0}
+        checkpoint = await self._db["backups"].find_one(
+            {"session_id": session_id, "kind": {"$in": ["checkpoint", None]}},
+            projection,
+            sort=[("created_at", -1)],
+        )
+        delta_query: Dict[str, Any] = {"session_id": session_id, "kind": "delta"}
+        if checkpoint is not None:
+            delta_query["created_at"] = {"$gt": checkpoint["created_at"]}
+        cursor = self._db["backups"].find(delta_query, projection).sort("created_at", 1)
+        deltas = [doc async for doc in cursor]
+        return checkpoint, deltas
+
+    @staticmethod
+    def _boundary_ids(docs: List[Dict[str, Any]], mark: Optional[dt.datetime]) -> List[str]:
+        """Ids of events stamped exactly at the high-water mark (they reappear under $gte)."""
+        if mark is None:
+            return []
+        stamp = mark.isoformat()
+        return [d["_id"] for d in docs if d.get("timestamp") == stamp and "_id" in d]
+
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=0.5, max=4), reraise=True)
     async def snapshot_session(self, session_id: str) -> str:
+        # Runs on the chat path: buffered writes are included from memory, not flushed.
+        # The buffer is FIFO, so Mongo always holds a prefix of the session's events
+        pending = {c: self._serialize_docs(self._pending(c, session_id)) for c in ("chat_memory", "audit_logs")}
         await self._ensure_connected()
         assert self._db is not None
-        history = await self.get_session_history(session_id)
-        audits = await self.get_audit_logs(session_id)
+        try:
+            checkpoint_every = max(1, int(os.getenv("SNAPSHOT_CHECKPOINT_EVERY", "10")))
+        except Exception:
+            checkpoint_every = 10
+
+        checkpoint, deltas = await self._load_backup_chain(session_id, full=False)
+        last = deltas[-1] if deltas else checkpoint
+        # Legacy full snapshots carry no high-water mark: re-read everything once and checkpoint
+        legacy = checkpoint is not None and "hwm" not in checkpoint
+        hwm = {} if (last is None or legacy) else (last.get("hwm") or {})
+        seen = {} if (last is None or legacy) else (last.get("hwm_ids") or {})
+
+        new_events: Dict[str, List[Dict[str, Any]]] = {}
+        new_hwm: Dict[str, Any] = {}
+        new_ids: Dict[str, List[str]] = {}
+        for collection in ("chat_memory", "audit_logs"):
+            since = hwm.get(collection)
+            skip = set(seen.get(collection) or [])
+            since_iso = since.isoformat() if isinstance(since, dt.datetime) else since
+            buffered = [d for d in pending[collection] if since_iso is None or str(d.get("timestamp", "")) >= since_iso]
+            events = self._merge_events(await self._events_since(collection, session_id, since), buffered)
+            docs = [d for d in events if d.get("_id") not in skip]
+            new_events[collection] = docs
+            mark = self._high_water_mark(docs, since)
+            new_hwm[collection] = mark
+            new_ids[collection] = self._boundary_ids(docs, mark) if mark != since else list(skip | set(self._boundary_ids(docs, mark)))
+
+        if last is not None and not legacy and not any(new_events.values()):
+            return str(last["_id"])
+
+        now = dt.datetime.utcnow()
+        if checkpoint is None or legacy or len(deltas) + 1 >= checkpoint_every:
+            # Compact checkpoint + deltas + new events into a fresh full checkpoint
+            full_checkpoint, full_deltas = await self._load_backup_chain(session_id, full=True)
+            chain = ([full_checkpoint] if full_checkpoint is not None else []) + full_deltas
+            snapshot = {
+                "session_id": session_id,
+                "kind": "checkpoint",
+                "created_at": now,
+                "hwm": new_hwm,
+                "hwm_ids": new_ids,
+                "chat_memory": self._merge_events(*[b.get("chat_memory", []) for b in chain], new_events["chat_memory"]),
+                "audit_logs": self._merge_events(*[b.get("audit_logs", []) for b in chain], new_events["audit_logs"]),
+            }
+            res = await self._db["backups"].insert_one(snapshot)
+            await self._db["backups"].delete_many({"session_id": session_id, "_id": {"$ne": res.inserted_id}, "created_at": {"$lte": now}})
+            return str(res.inserted_id)
+
         snapshot = {
             "session_id": session_id,
-            "created_at": dt.datetime.utcnow(),
-            "chat_memory": history,
-            "audit_logs": audits,
+            "kind": "delta",
+            "created_at": now,
+            "since": hwm,
+            "hwm": new_hwm,
+            "hwm_ids": new_ids,
+            "chat_memory": new_events["chat_memory"],
+            "audit_logs": new_events["audit_logs"],
         }
         res = await self._db["backups"].insert_one(snapshot)
         return str(res.inserted_id)
 
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=0.5, max=4), reraise=True)
+    async def restore_session(self, session_id: str) -> Dict[str, Any]:
+        """Rebuild a session's chat memory and audit log from its latest checkpoint plus deltas."""
+        await self._ensure_connected()
+        assert self._db is not None
+        checkpoint, deltas = await self._load_backup_chain(session_id)
+        chain = ([checkpoint] if checkpoint is not None else []) + deltas
+        restored_at = chain[-1]["created_at"] if chain else None
+        return {
+            "session_id": session_id,
+            "checkpoint_id": str(checkpoint["_id"]) if checkpoint is not None else None,
+            "deltas_applied": len(deltas),
+            "restored_at": restored_at.isoformat() if hasattr(restored_at, "isoformat") else restored_at,
+            "chat_memory": self._merge_events(*[b.get("chat_memory", []) for b in chain]),
+            "audit_logs": self._merge_events(*[b.get("audit_logs", []) for b in chain]),
+        }
+
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=0.5, max=4), reraise=True)
     async def list_sessions(self, limit: int = 50) -> List[str]:
         await self._ensure_connected()
@@ -0,0 +1,234 @@
+"""
+Structured filters for trial search: phase, overall status, study type, disease.
+
+Local backend: TrialFilterIndex keeps the sorted row positions of every
+distinct (normalized) column value. A filter is an AND across fields and an
+OR within a field; the matching rows are packed into a bitmap that FAISS
+consumes through IDSelectorBitmap, so excluded rows are skipped inside the
+index scan instead of over-fetching and post-filtering.
+
+Chroma backend: chroma_where() maps the same filters onto a `where` clause
+over the migrated metadata keys (phase, status, study_type, disease).
+"""
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from storage.ttl_cache import LRUCache
+
+FILTER_FIELDS = {
+    "phase": "Phase",
+    "status": "Overall Status",
+    "study_type": "Study type",
+    "disease": "Disease",
+}
+
+_ROMAN = {"i": "1", "ii": "2", "iii": "3", "iv": "4"}
+
+
+def normalize_value(value: Any) -> str:
+    """'ACTIVE_NOT_RECRUITING' / 'Active, not recruiting' -> 'active not recruiting'."""
+    return " ".join(re.sub(r"[_,|/]+", " ", str(value)).lower().split())
+
+
+def phase_numbers(value: Any) -> List[str]:
+    """Phases mentioned by a value: 'PHASE2|PHASE3' -> ['2', '3'], 'Phase III' -> ['3']."""
+    text = str(value).lower()
+    numbers = re.findall(r"phase\s*_?([1-4])\b", text)
+    numbers += [_ROMAN[r] for r in re.findall(r"phase\s*(iv|iii|ii|i)\b", text)]
+    if not numbers and re.fullmatch(r"\s*([1-4]|iv|iii|ii|i)\s*", text):
+        numbers = [_ROMAN.get(text.strip(), text.strip())]
+    return sorted(set(numbers))
+
+
+def _as_list(value: Any) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return [str(v) for v in value if str(v).strip()]
+    return [str(value)] if str(value).strip() else []
+
+
+def clean_filters(filters: Optional[Dict[str, Any]]) -> Dict[str, List[str]]:
+    """Keep known fields with at least one value, as lists."""
+    cleaned = {}
+    for field, value in (filters or {}).items():
+        values = _as_list(value)
+        if field in FILTER_FIELDS and values:
+            cleaned[field] = values
+    return cleaned
+
+
+class TrialFilterIndex:
+    """
+    Per field, a CSR-style posting list: keys[i] matches the sorted row
+    positions rows[offsets[i]:offsets[i + 1]]. Memory is one int32 per
+    (row, matching value) instead of one n-byte mask per distinct value, and
+    masks for a filter are combined on demand (union within a field,
+    intersection across fields) and cached as row arrays. The packed FAISS
+    bitmap of a filter is memoized too, in a smaller LRU since each one is
+    n / 8 bytes. scripts/load_faiss.py saves the arrays next to the trial
+    store and load() memory-maps them.
+    """
+
+    def __init__(self, n: int, postings: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]], cache_size: int = 64, bitmap_cache_size: int = 8):
+        self.n = int(n)
+        # field -> (sorted keys, offsets, rows)
+        self._postings = postings
+        self._combined = LRUCache(max_entries=cache_size)
+        # "<n>:<filter key>" -> (packed bitmap, matching row count)
+        self._bitmaps = LRUCache(max_entries=bitmap_cache_size)
+
+    @classmethod
+    def build(cls, trials, cache_size: int = 64) -> "TrialFilterIndex":
+        postings: Dict[str, Tuple[List[str], np.ndarray, np.ndarray]] = {}
+        for field, column in FILTER_FIELDS.items():
+            positions: Dict[str, List[int]] = {}
+            for pos, value in enumerate(trials.column(column)):
+                if value is None or (isinstance(value, float) and np.isnan(value)):
+                    continue
+                keys = phase_numbers(value) if field == "phase" else [normalize_value(value)]
+                for key in keys:
+                    positions.setdefault(key, []).append(pos)
+            postings[field] = cls._pack(positions)
+        return cls(len(trials), postings, cache_size)
+
+    def save(self, base_path: str) -> None:
+        from storage.trial_store import TrialStore
+
+        for field, (keys, offsets, rows) in self._postings.items():
+            TrialStore.save_array(base_path, f"filter_{field}_keys", keys)
+            TrialStore.save_array(base_path, f"filter_{field}_offsets", offsets)
+            TrialStore.save_array(base_path, f"filter_{field}_rows", rows)
+
+    @classmethod
+    def load(cls, trials, cache_size: int = 64) -> Optional["TrialFilterIndex"]:
+        """Memory-mapped postings saved next to the store, or None when missing."""
+        postings = {}
+        for field in FILTER_FIELDS:
+            arrays = [trials.open_array(f"filter_{field}_{part}") for part in ("keys", "offsets", "rows")]
+            if any(a is None for a in arrays):
+                return None
+            postings[field] = tuple(arrays)
+        return cls(len(trials), postings, cache_size)
+
+    @staticmethod
+    def _pack(positions: Dict[str, List[int]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        keys = sorted(positions)
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        for i, key in enumerate(keys):
+            offsets[i + 1] = offsets[i] + len(positions[key])
+        rows = np.empty(int(offsets[-1]), dtype=np.int32)
+        for i, key in enumerate(keys):
+            # Rows were appended in scan order, so each slice is already sorted
+            rows[offsets[i]:offsets[i + 1]] = positions[key]
+        return np.array(keys, dtype=str), offsets, rows
+
+    def _key_index(self, field: str, key: str) -> int:
+        keys = self._postings[field][0]
+        i = int(np.searchsorted(keys, key))
+        return i if i < len(keys) and keys[i] == key else -1
+
+    def _field_rows(self, field: str, values: Iterable[str]) -> np.ndarray:
+        if field not in self._postings:
+            return np.empty(0, dtype=np.int32)
+        keys, offsets, rows = self._postings[field]
+        indexes: List[int] = []
+        for value in values:
+            if field == "disease":
+                # Substring over the distinct disease labels
+                term = normalize_value(value)
+                if term and len(keys):
+                    indexes += np.flatnonzero(np.char.find(keys, term) >= 0).tolist()
+                continue
+            for key in (phase_numbers(value) if field == "phase" else [normalize_value(value)]):
+                indexes.append(self._key_index(field, key))
+        slices = [rows[offsets[i]:offsets[i + 1]] for i in dict.fromkeys(indexes) if i >= 0]
+        if not slices:
+            return np.empty(0, dtype=np.int32)
+        if len(slices) == 1:
+            return slices[0]
+        return np.unique(np.concatenate(slices))
+
+    @staticmethod
+    def _filter_key(filters: Dict[str, List[str]]) -> str:
+        return repr(sorted((f, sorted(normalize_value(v) for v in vs)) for f, vs in filters.items()))
+
+    def rows(self, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Sorted row positions matching the filters, or None when no filter applies."""
+        filters = clean_filters(filters)
+        if not filters:
+            return None
+        key = self._filter_key(filters)
+        cached = self._combined.get(key)
+        if cached is not None:
+            return cached
+        combined: Optional[np.ndarray] = None
+        # Smallest field first keeps the intersections cheap
+        for rows in sorted((self._field_rows(f, vs) for f, vs in filters.items()), key=len):
+            combined = rows if combined is None else np.intersect1d(combined, rows, assume_unique=True)
+            if not len(combined):
+                break
+        self._combined.set(key, combined)
+        return combined
+
+    @staticmethod
+    def bitmap(rows: np.ndarray, n: int) -> np.ndarray:
+        """Pack row positions in the bit order FAISS IDSelectorBitmap reads (LSB first)."""
+        mask = np.zeros(n, dtype=bool)
+        mask[rows] = True
+        return np.packbits(mask, bitorder="little")
+
+    def selection(self, filters: Optional[Dict[str, Any]], n: Optional[int] = None) -> Optional[Tuple[np.ndarray, int]]:
+        """
+        (packed bitmap over n rows, matching row count) for the filters, or None
+        when no filter applies. Memoized per filter, so a repeated filter skips
+        the O(n) mask and packbits. Callers must not modify the bitmap.
+        """
+        filters = clean_filters(filters)
+        if not filters:
+            return None
+        n = self.n if n is None else int(n)
+        key = f"{n}:{self._filter_key(filters)}"
+        cached = self._bitmaps.get(key)
+        if cached is not None:
+            return cached
+        rows = self.rows(filters)
+        entry = (self.bitmap(rows, n), len(rows))
+        self._bitmaps.set(key, entry)
+        return entry
+
+    def values(self, field: str) -> List[str]:
+        return [str(k) for k in self._postings[field][0]] if field in self._postings else []
+
+
+def chroma_where(filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Map filters onto a Chroma `where` clause. Chroma has no substring match on
+    metadata, so each value expands to the spellings ClinicalTrials.gov exports
+    use (e.g. phase 3 -> PHASE3, PHASE2|PHASE3, Phase 3, ...).
+    """
+    clauses = []
+    for field, values in clean_filters(filters).items():
+        variants: List[str] = []
+        for value in values:
+            if field == "phase":
+                for n in phase_numbers(value):
+                    roman = {v: k for k, v in _ROMAN.items()}[n].upper()
+                    variants += [f"PHASE{n}", f"Phase {n}", f"Phase {roman}", f"EARLY_PHASE{n}", f"Early Phase {n}"]
+                    lower, upper = str(int(n) - 1), str(int(n) + 1)
+                    variants += [f"PHASE{lower}|PHASE{n}", f"PHASE{n}|PHASE{upper}", f"Phase {lower}/Phase {n}", f"Phase {n}/Phase {upper}"]
+            else:
+                plain = normalize_value(value)
+                variants += [value, plain, plain.title(), plain.upper(), plain.upper().replace(" ", "_"), plain.capitalize()]
+                if field == "status":
+                    variants.append(plain.capitalize().replace(" not ", ", not "))
+        variants = list(dict.fromkeys(v for v in variants if v))
+        if variants:
+            clauses.append({field: {"$in": variants}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
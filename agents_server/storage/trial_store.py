@@ -0,0 +1,270 @@
+"""
+Columnar, memory-mapped clinical trial store for the Enrollment Agent.
+
+Written by scripts/load_faiss.py next to the FAISS index:
+- <base>.arrow: trial metadata as uncompressed Feather v2 (Arrow IPC), read
+  zero-copy through a memory map
+- <base>.docs.bin: the indexed document strings, UTF-8, concatenated
+- <base>.docs.offsets.npy: int64 byte offsets (n + 1) into the blob
+
+Rows and documents are materialised lazily by position, so startup does not
+unpickle anything and every worker process shares the same pages through the
+OS page cache. TrialStore.from_dataframe wraps an in-memory DataFrame (CSV or
+legacy pickle fallback) behind the same interface.
+
+Lookup structures derived from the table (NCT ID index, filter postings, BM25)
+are written by the same script as <base>.<name>.npy arrays and opened with
+open_array(), i.e. memory-mapped as well; numeric columns are read zero-copy
+through column_array().
+"""
+from __future__ import annotations
+
+import mmap
+import os
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+
+def row_to_text(row) -> str:
+    """Document text embedded for each trial (keep in sync with the FAISS index)."""
+    def safe_get(field, default="N/A"):
+        value = row.get(field, default)
+        return str(value) if pd.notna(value) else default
+
+    return (
+        f"Disease: {safe_get('Disease')}. "
+        f"NCT ID: {safe_get('NCT ID')}. "
+        f"Status: {safe_get('Overall Status')}. "
+        f"Why Stopped: {safe_get('Why Stopped')}. "
+        f"Eligibility: {safe_get('Eligibility Criteria')}. "
+        f"Phase: {safe_get('Phase')}. "
+        f"Conditions: {safe_get('Conditions')}. "
+        f"Study Type: {safe_get('Study type')}."
+    )
+
+
+def array_path(base_path: str, name: str) -> str:
+    return f"{base_path}.{name}.npy"
+
+
+def store_paths(base_path: str) -> Dict[str, str]:
+    return {
+        "table": f"{base_path}.arrow",
+        "docs": f"{base_path}.docs.bin",
+        "offsets": f"{base_path}.docs.offsets.npy",
+    }
+
+
+class DocumentView(Sequence[str]):
+    """Read-only sequence over the document blob; decodes one string per access."""
+
+    def __init__(self, blob: Any, offsets: np.ndarray):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return max(0, len(self._offsets) - 1)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return bytes(self._blob[start:end]).decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        return (self[i] for i in range(len(self)))
+
+
+class TrialStore:
+    def __init__(self, table=None, df: Optional[pd.DataFrame] = None, documents: Optional[Sequence[str]] = None, files: Optional[List[Any]] = None, base_path: Optional[str] = None):
+        self._table = table
+        self._df = df
+        self.documents: Sequence[str] = documents if documents is not None else []
+        self._files = files or []
+        # Set for on-disk stores; sidecar arrays live next to the table
+        self.base_path = base_path
+
+    # ---------- constructors ----------
+    @classmethod
+    def exists(cls, base_path: str) -> bool:
+        return all(os.path.exists(p) for p in store_paths(base_path).values())
+
+    @classmethod
+    def open(cls, base_path: str) -> "TrialStore":
+        import pyarrow.feather as feather  # type: ignore
+
+        paths = store_paths(base_path)
+        table = feather.read_table(paths["table"], memory_map=True)
+        offsets = np.load(paths["offsets"], mmap_mode="r")
+        files: List[Any] = []
+        if os.path.getsize(paths["docs"]) > 0:
+            f = open(paths["docs"], "rb")
+            blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            files = [blob, f]
+        else:
+            blob = b""
+        return cls(table=table, documents=DocumentView(blob, offsets), files=files, base_path=base_path)
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame, documents: Optional[Sequence[str]] = None) -> "TrialStore":
+        df = df.reset_index(drop=True)
+        if documents is None:
+            documents = df.apply(row_to_text, axis=1).tolist()
+        return cls(df=df, documents=documents)
+
+    @staticmethod
+    def write(df: pd.DataFrame, documents: Sequence[str], base_path: str) -> Dict[str, str]:
+        """Write the columnar table, document blob and offsets for base_path."""
+        import pyarrow as pa  # type: ignore
+        import pyarrow.feather as feather  # type: ignore
+
+        paths = store_paths(base_path)
+        df = df.reset_index(drop=True).copy()
+        for column in df.columns:
+            if df[column].dtype == object:
+                # Mixed-type CSV columns become strings; missing values stay null
+                df[column] = df[column].where(df[column].isna(), df[column].astype(str))
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        # Uncompressed and a single record batch, so columns can be memory-mapped
+        # and read as one contiguous chunk without a decode or concatenation copy
+        feather.write_feather(table, paths["table"], compression="uncompressed", chunksize=max(1, len(df)))
+
+        offsets = np.zeros(len(documents) + 1, dtype=np.int64)
+        with open(paths["docs"], "wb") as f:
+            for i, doc in enumerate(documents):
+                data = doc.encode("utf-8")
+                f.write(data)
+                offsets[i + 1] = offsets[i] + len(data)
+        np.save(paths["offsets"], offsets)
+        return paths
+
+    @staticmethod
+    def save_array(base_path: str, name: str, array: np.ndarray) -> str:
+        path = array_path(base_path, name)
+        np.save(path, np.ascontiguousarray(array))
+        return path
+
+    def open_array(self, name: str) -> Optional[np.ndarray]:
+        """Memory-mapped sidecar array, or None (in-memory store or file missing)."""
+        if not self.base_path:
+            return None
+        path = array_path(self.base_path, name)
+        if not os.path.exists(path):
+            return None
+        return np.load(path, mmap_mode="r")
+
+    # ---------- access ----------
+    def __len__(self) -> int:
+        if self._table is not None:
+            return self._table.num_rows
+        return len(self._df) if self._df is not None else 0
+
+    @property
+    def columns(self) -> List[str]:
+        if self._table is not None:
+            return list(self._table.column_names)
+        return list(self._df.columns) if self._df is not None else []
+
+    def column(self, name: str) -> List[Any]:
+        if name not in self.columns:
+            return []
+        if self._table is not None:
+            return self._table.column(name).to_pylist()
+        return self._df[name].tolist()
+
+    def column_array(self, name: str) -> Optional[np.ndarray]:
+        """A column as a NumPy array; zero-copy for single-chunk numeric columns without nulls."""
+        if name not in self.columns:
+            return None
+        if self._table is not None:
+            column = self._table.column(name)
+            if column.num_chunks == 1 and column.null_count == 0:
+                try:
+                    return column.chunk(0).to_numpy(zero_copy_only=True)
+                except Exception:
+                    pass
+            return column.to_numpy()
+        return self._df[name].to_numpy()
+
+    def row(self, pos: int) -> Dict[str, Any]:
+        """Metadata of one trial; missing values are omitted."""
+        if self._table is not None:
+            record = self._table.slice(pos, 1).to_pylist()[0]
+        else:
+            record = self._df.iloc[pos].to_dict()
+        return {k: v for k, v in record.items() if v is not None and not (isinstance(v, float) and np.isnan(v))}
+
+    def document(self, pos: int) -> str:
+        return self.documents[pos] if 0 <= pos < len(self.documents) else ""
+
+    def close(self) -> None:
+        for handle in self._files:
+            try:
+                handle.close()
+            except Exception:
+                pass
+        self._files = []
+
+
+def normalize_nct_id(nct_id: Any) -> str:
+    return str(nct_id).strip().upper()
+
+
+class NCTIndex:
+    """
+    NCT ID -> row position as two parallel arrays (sorted fixed-width IDs and
+    their first row), looked up by binary search. Saved by scripts/load_faiss.py
+    and memory-mapped on load, so no per-worker dict is built at startup.
+    """
+
+    def __init__(self, keys: np.ndarray, positions: np.ndarray):
+        self.keys = keys
+        self.positions = positions
+
+    @classmethod
+    def build(cls, nct_ids: Sequence[Any]) -> "NCTIndex":
+        pairs = [(normalize_nct_id(v), pos) for pos, v in enumerate(nct_ids) if v is not None and pd.notna(v)]
+        if not pairs:
+            return cls(np.array([], dtype="<U11"), np.array([], dtype=np.int32))
+        ids = np.array([k for k, _ in pairs], dtype=str)
+        rows = np.array([p for _, p in pairs], dtype=np.int32)
+        # np.unique returns the first occurrence of each ID (first row wins, like the old scan)
+        keys, first = np.unique(ids, return_index=True)
+        return cls(keys, rows[first])
+
+    def save(self, base_path: str) -> None:
+        TrialStore.save_array(base_path, "nct_keys", self.keys)
+        TrialStore.save_array(base_path, "nct_rows", self.positions)
+
+    @classmethod
+    def load(cls, trials: TrialStore) -> Optional["NCTIndex"]:
+        keys, positions = trials.open_array("nct_keys"), trials.open_array("nct_rows")
+        if keys is None or positions is None:
+            return None
+        return cls(keys, positions)
+
+    def _find(self, nct_id: str) -> int:
+        i = int(np.searchsorted(self.keys, nct_id))
+        return i if i < len(self.keys) and self.keys[i] == nct_id else -1
+
+    def get(self, nct_id: str, default: Optional[int] = None) -> Optional[int]:
+        i = self._find(nct_id)
+        return int(self.positions[i]) if i >= 0 else default
+
+    def __contains__(self, nct_id: str) -> bool:
+        return self._find(nct_id) >= 0
+
+    def __getitem__(self, nct_id: str) -> int:
+        pos = self.get(nct_id)
+        if pos is None:
+            raise KeyError(nct_id)
+        return pos
+
+    def __len__(self) -> int:
+        return len(self.keys)
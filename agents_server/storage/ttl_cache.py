@@ -0,0 +1,198 @@
+"""
+Small key/value caches with TTL expiry and size-based eviction.
+
+- LRUCache: thread-safe in-memory LRU tier
+- SQLiteTTLCache: on-disk tier backed by a local SQLite file (JSON values)
+
+Both are process-local building blocks; callers decide what to key on and
+what is safe to cache.
+"""
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+class LRUCache:
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[Optional[float], Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = (time.time() + ttl) if ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def items(self):
+        """Snapshot of live (key, value) pairs, least recently used first."""
+        now = time.time()
+        with self._lock:
+            return [(k, v) for k, (exp, v) in self._data.items() if exp is None or exp > now]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteTTLCache:
+    """
+    Reads stay read-only: hits queue their access time and the LRU touches are
+    written in one batch (on the next write, every touch_batch hits, or close).
+    The row count is tracked incrementally and recounted only when it crosses
+    max_entries or during the expiry sweep, which runs every sweep_interval
+    seconds rather than on every write (other processes may share the file).
+    """
+
+    def __init__(self, path: str, max_entries: int = 50000, ttl: Optional[float] = None, table: str = "cache",
+                 touch_batch: int = 256, sweep_interval: float = 60.0):
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl
+        self.table = table
+        self.touch_batch = max(1, int(touch_batch))
+        self.sweep_interval = sweep_interval
+        self._touched: Dict[str, float] = {}
+        self._next_sweep = 0.0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table}(accessed_at)")
+            self._conn.commit()
+            (self._count,) = self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return default
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                # Left for the next sweep; no write on the read path
+                return default
+            self._touched[key] = now
+            if len(self._touched) >= self.touch_batch:
+                self._flush_touches_locked()
+                self._conn.commit()
+        try:
+            return json.loads(value)
+        except Exception:
+            return default
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        expires_at = (now + ttl) if ttl else None
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            exists = self._conn.execute(f"SELECT 1 FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, payload, expires_at, now),
+            )
+            if exists is None:
+                self._count += 1
+            self._touched.pop(key, None)
+            self._flush_touches_locked()
+            self._evict_locked(now)
+            self._conn.commit()
+
+    def _flush_touches_locked(self) -> None:
+        if self._touched:
+            self._conn.executemany(
+                f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?",
+                [(at, key) for key, at in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def _evict_locked(self, now: float) -> None:
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.sweep_interval
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+            )
+            # Resync with rows written by other processes sharing the file
+            (self._count,) = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        if self._count <= self.max_entries:
+            return
+        # Recount before evicting: other processes may have written or evicted
+        (self._count,) = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        excess = self._count - self.max_entries
+        if excess > 0:
+            # Least recently accessed rows go first
+            cursor = self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY accessed_at ASC LIMIT ?)",
+                (excess,),
+            )
+            self._count -= max(0, cursor.rowcount)
+
+    def pop(self, key: str) -> None:
+        with self._lock:
+            self._touched.pop(key, None)
+            cursor = self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._count -= max(0, cursor.rowcount)
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._touched.clear()
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._count = 0
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        return int(count)
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                self._flush_touches_locked()
+                self._conn.commit()
+            finally:
+                self._conn.close()
@@ -0,0 +1,276 @@
+"""
+FAISS index factory for the trial corpus.
+
+Index types (all inner product over normalized MiniLM embeddings, i.e. cosine):
+- flat: exact brute-force scan (IndexFlatIP)
+- ivf_flat: inverted lists over k-means cells; nprobe cells searched per query
+- ivf_pq: IVF with product-quantized vectors (much smaller, approximate scores)
+- hnsw: graph index; efSearch controls the search beam
+
+Search-time settings (nprobe / efSearch) are saved in a JSON sidecar next to
+the index (<index>.json) and re-applied on load; FAISS_NPROBE and
+FAISS_EF_SEARCH override them at runtime.
+
+With FAISS_MMAP=1 (default) indexes are memory-mapped instead of read into
+the heap, so every worker process shares one page-cached copy and cold start
+no longer scales with index size. Only IVF inverted lists are mapped by
+IO_FLAG_MMAP; flat and HNSW codes need IO_FLAG_MMAP_IFC (newer FAISS builds).
+read_index reports whether the index is actually mapped and logs when it was
+read into the heap instead.
+"""
+from __future__ import annotations
+
+import json
+import math
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+# IVF needs enough points per cell to train k-means (FAISS warns below ~39)
+MIN_POINTS_PER_CELL = 39
+
+
+def default_nlist(n: int) -> int:
+    return max(1, min(int(4 * math.sqrt(n)), n // MIN_POINTS_PER_CELL))
+
+
+def default_pq_m(d: int) -> int:
+    """Largest sub-quantizer count <= d/8 that divides d (e.g. 48 for 384)."""
+    for m in range(max(1, d // 8), 0, -1):
+        if d % m == 0:
+            return m
+    return 1
+
+
+def training_sample(embeddings: np.ndarray, size: int, seed: int = 1234) -> np.ndarray:
+    """Uniform random sample of rows for quantizer training."""
+    if size >= len(embeddings):
+        return embeddings
+    rng = np.random.default_rng(seed)
+    return embeddings[np.sort(rng.choice(len(embeddings), size=size, replace=False))]
+
+
+def build_index(
+    embeddings: np.ndarray,
+    index_type: str = "flat",
+    nlist: Optional[int] = None,
+    pq_m: Optional[int] = None,
+    pq_nbits: int = 8,
+    hnsw_m: int = 32,
+    ef_construction: int = 200,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    train_size: Optional[int] = None,
+):
+    """
+    Build and fill an index of the requested type. Returns (index, params),
+    where params holds the type and search settings for the sidecar. Corpora
+    too small to train an IVF quantizer fall back to flat.
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    n, d = embeddings.shape
+    index_type = (index_type or "flat").strip().lower()
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}'. Use one of: {', '.join(INDEX_TYPES)}")
+
+    params: Dict[str, Any] = {"index_type": index_type, "d": d, "ntotal": n}
+
+    if index_type in ("ivf_flat", "ivf_pq"):
+        nlist = nlist or default_nlist(n)
+        pq_bits_ok = index_type != "ivf_pq" or n >= MIN_POINTS_PER_CELL * (1 << pq_nbits)
+        if n < MIN_POINTS_PER_CELL * 2 or nlist < 2 or not pq_bits_ok:
+            print(f"Corpus of {n} vectors is too small to train {index_type}; using flat")
+            return build_index(embeddings, "flat")
+        quantizer = faiss.IndexFlatIP(d)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, d, nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            pq_m = pq_m or default_pq_m(d)
+            index = faiss.IndexIVFPQ(quantizer, d, nlist, pq_m, pq_nbits, faiss.METRIC_INNER_PRODUCT)
+            params.update({"pq_m": pq_m, "pq_nbits": pq_nbits})
+        # FAISS recommends 30-256 training points per cell
+        sample = training_sample(embeddings, train_size or min(n, 256 * nlist))
+        index.train(sample)
+        index.add(embeddings)
+        params.update({"nlist": nlist, "train_size": len(sample), "nprobe": nprobe or max(1, nlist // 16)})
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(d, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = ef_construction
+        index.add(embeddings)
+        params.update({"hnsw_m": hnsw_m, "ef_construction": ef_construction, "ef_search": ef_search or 64})
+    else:
+        index = faiss.IndexFlatIP(d)
+        index.add(embeddings)
+
+    apply_search_params(index, params)
+    return index, params
+
+
+def apply_search_params(index, params: Dict[str, Any]) -> None:
+    """Set nprobe / efSearch on an index from sidecar params (no-op for flat)."""
+    ivf = None
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except Exception:
+        pass
+    if ivf is not None and params.get("nprobe"):
+        ivf.nprobe = int(params["nprobe"])
+    if hasattr(index, "hnsw") and params.get("ef_search"):
+        index.hnsw.efSearch = int(params["ef_search"])
+
+
+def sidecar_path(index_path: str) -> str:
+    return f"{index_path}.json"
+
+
+def save_index(index, index_path: str, params: Dict[str, Any]) -> None:
+    faiss.write_index(index, index_path)
+    with open(sidecar_path(index_path), "w", encoding="utf-8") as f:
+        json.dump(params, f, indent=2)
+
+
+def load_params(index_path: str) -> Dict[str, Any]:
+    params: Dict[str, Any] = {}
+    path = sidecar_path(index_path)
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                params = json.load(f)
+        except Exception as e:
+            print(f"Warning: Failed to read index settings {path}: {e}")
+    for key, env in (("nprobe", "FAISS_NPROBE"), ("ef_search", "FAISS_EF_SEARCH")):
+        value = os.getenv(env)
+        if value:
+            try:
+                params[key] = int(value)
+            except ValueError:
+                pass
+    return params
+
+
+def mmap_enabled() -> bool:
+    return os.getenv("FAISS_MMAP", "1") != "0"
+
+
+def mmap_flags() -> int:
+    # IO_FLAG_MMAP maps IVF inverted lists; IO_FLAG_MMAP_IFC (newer FAISS)
+    # also maps flat/HNSW code storage in place
+    return faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+
+
+def is_mapped(index) -> bool:
+    """Whether the bulk of a loaded index lives in mapped pages rather than the heap."""
+    if hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+        return True
+    try:
+        # Without IFC only IVF inverted lists are mapped (the quantizer is small)
+        faiss.extract_index_ivf(index)
+        return True
+    except Exception:
+        return False
+
+
+def read_index(index_path: str, mmap: Optional[bool] = None):
+    """Read an index, memory-mapped when enabled and supported. Returns (index, mapped)."""
+    mmap = mmap_enabled() if mmap is None else mmap
+    if mmap:
+        try:
+            index = faiss.read_index(index_path, mmap_flags())
+        except Exception as e:
+            print(f"Memory-mapped load of {index_path} not supported ({e}); reading into memory")
+        else:
+            mapped = is_mapped(index)
+            if not mapped:
+                print(f"FAISS {getattr(faiss, '__version__', '?')} has no IO_FLAG_MMAP_IFC: "
+                      f"{type(index).__name__} from {index_path} was read into memory, not mapped")
+            return index, mapped
+    return faiss.read_index(index_path), False
+
+
+def load_index(index_path: str, mmap: Optional[bool] = None):
+    """Read an index and apply its saved (or env-overridden) search settings. Returns (index, mapped)."""
+    index, mapped = read_index(index_path, mmap=mmap)
+    apply_search_params(index, load_params(index_path))
+    return index, mapped
+
+
+def filtered_search(index, queries: np.ndarray, k: int, bitmap: np.ndarray):
+    """
+    Search only the rows whose bit is set in bitmap (LSB-first packed mask).
+    The selector is applied inside the scan, carrying over the index's
+    current nprobe / efSearch.
+    """
+    selector = faiss.IDSelectorBitmap(index.ntotal, faiss.swig_ptr(bitmap))
+    ivf = None
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except Exception:
+        pass
+    if ivf is not None:
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    elif hasattr(index, "hnsw"):
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    # bitmap must outlive the search; the selector only holds a raw pointer
+    D, I = index.search(queries, k, params=params)
+    return D, I
+
+
+# ---------- evaluation ----------
+def _timed_search(index, queries: np.ndarray, k: int):
+    latencies = []
+    ids = np.empty((len(queries), k), dtype=np.int64)
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, I = index.search(queries[i:i + 1], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids[i] = I[0]
+    return ids, np.array(latencies)
+
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray) -> float:
+    k = truth.shape[1]
+    hits = sum(len(set(t[t >= 0]) & set(f[f >= 0])) for t, f in zip(truth, found))
+    return hits / float(truth.size or 1) if k else 0.0
+
+
+def evaluate(index, flat_index, queries: np.ndarray, k: int = 10, sweep: Optional[List[int]] = None, params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    recall@k and single-query latency of index against the exact flat index.
+    `sweep` lists nprobe (IVF) or efSearch (HNSW) values to try; the index is
+    left with its original setting afterwards.
+    """
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    truth, flat_ms = _timed_search(flat_index, queries, k)
+    rows = [{"setting": "flat", "recall": 1.0, "p50_ms": float(np.percentile(flat_ms, 50)), "p95_ms": float(np.percentile(flat_ms, 95))}]
+
+    params = dict(params or {})
+    knob = "ef_search" if hasattr(index, "hnsw") else ("nprobe" if params.get("nlist") else None)
+    values = (sweep or []) if knob else []
+    for value in values + [None]:
+        trial = dict(params)
+        if value is not None:
+            trial[knob] = value
+        apply_search_params(index, trial)
+        found, ms = _timed_search(index, queries, k)
+        rows.append({
+            "setting": f"{params.get('index_type')} {knob}={trial.get(knob)}" if knob else str(params.get("index_type")),
+            "recall": recall_at_k(truth, found),
+            "p50_ms": float(np.percentile(ms, 50)),
+            "p95_ms": float(np.percentile(ms, 95)),
+        })
+    apply_search_params(index, params)
+    return rows
+
+
+def format_report(rows: List[Dict[str, Any]], k: int) -> str:
+    lines = [f"{'setting':<28} {'recall@' + str(k):>10} {'p50 ms':>9} {'p95 ms':>9}"]
+    for row in rows:
+        lines.append(f"{row['setting']:<28} {row['recall']:>10.4f} {row['p50_ms']:>9.3f} {row['p95_ms']:>9.3f}")
+    return "\n".join(lines)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import the server modules the same way the app and scripts do
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
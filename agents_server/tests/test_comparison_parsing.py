@@ -0,0 +1,21 @@
+import pytest
+
+# The orchestrator module imports every agent (FAISS, sentence-transformers, Gemini)
+orchestrator = pytest.importorskip("simple_dynamic_orchestrator")
+extract_compared_drugs = orchestrator.SimpleDynamicOrchestrator.extract_compared_drugs
+
+
+def test_diseases_are_not_compared_drugs():
+    assert extract_compared_drugs("compare recruiting trials in diabetes vs cancer") == []
+    assert extract_compared_drugs("compare asthma and copd", condition="copd") == []
+
+
+def test_x_compares_with_y():
+    assert extract_compared_drugs("how does metformin compare with insulin for diabetes") == ["metformin", "insulin"]
+    assert extract_compared_drugs("aspirin compared to warfarin in elderly patients") == ["aspirin", "warfarin"]
+
+
+def test_existing_phrasings_still_parse():
+    assert extract_compared_drugs("compare the safety of aspirin, warfarin and heparin") == ["aspirin", "warfarin", "heparin"]
+    assert extract_compared_drugs("aspirin vs warfarin") == ["aspirin", "warfarin"]
+    assert extract_compared_drugs("compare phase 2 and phase 3 enrollment") == []
@@ -0,0 +1,35 @@
+from storage.label_store import LabelStore
+
+
+def _label(label_id, effective_time, indication):
+    return {
+        "id": label_id,
+        "set_id": "set-aspirin",
+        "effective_time": effective_time,
+        "openfda": {"generic_name": ["aspirin"], "brand_name": ["Bayer"]},
+        "indications_and_usage": [indication],
+    }
+
+
+def test_newer_version_of_a_set_id_replaces_the_old_row(tmp_path):
+    store = LabelStore(str(tmp_path / "labels.db"))
+    store.ingest([_label("v1", "20200101", "pain relief")])
+    store.ingest([_label("v2", "20230101", "fever reduction")])
+
+    assert store.count() == 1
+    [label] = store.search_drug("aspirin", limit=5)
+    assert label["id"] == "v2"
+    # The old version's FTS entry is gone too
+    assert store.search_indication("pain relief") == []
+    assert [l["id"] for l in store.search_indication("fever reduction")] == ["v2"]
+    store.close()
+
+
+def test_older_version_does_not_replace_a_newer_one(tmp_path):
+    store = LabelStore(str(tmp_path / "labels.db"))
+    store.ingest([_label("v2", "20230101", "fever reduction")])
+    assert store.ingest([_label("v1", "20200101", "pain relief")]) == 0
+
+    assert store.count() == 1
+    assert [l["id"] for l in store.search_drug("aspirin", limit=5)] == ["v2"]
+    store.close()
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("requests")
+httpx = pytest.importorskip("httpx")
+
+from openfda_client import OpenFDAClient
+
+
+def _client(monkeypatch, requests_seen):
+    monkeypatch.setenv("OPENFDA_CACHE", "0")
+    client = OpenFDAClient(api_key="secret", retries=0)
+
+    def handler(request):
+        requests_seen.append(request)
+        return httpx.Response(200, json={"results": [{"id": "label-1"}]})
+
+    # Same client settings, but answered in-process instead of by api.fda.gov
+    monkeypatch.setattr(client, "_new_async_client", lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return client
+
+
+def test_asearch_works_on_separate_event_loops(monkeypatch):
+    seen = []
+    client = _client(monkeypatch, seen)
+    params = {"search": 'openfda.generic_name:"aspirin"', "limit": 1}
+
+    async def search():
+        response = await client.asearch(params)
+        return response, client._get_async_client()
+
+    first, first_client = asyncio.run(search())
+    second, second_client = asyncio.run(search())
+
+    assert first.status_code == second.status_code == 200
+    assert second.data == {"results": [{"id": "label-1"}]}
+    assert "api_key" not in second.url
+    assert len(seen) == 2
+    # Each loop gets its own AsyncClient; the first loop's client is dropped once that loop is closed
+    assert first_client is not second_client
+    assert len(client._async_clients) == 1
+    client.close()
+
+
+def test_aclose_closes_the_running_loops_client(monkeypatch):
+    client = _client(monkeypatch, [])
+
+    async def run():
+        async with client:
+            await client.asearch({"search": "x", "limit": 1})
+            async_client = client._get_async_client()
+        return async_client
+
+    async_client = asyncio.run(run())
+    assert async_client.is_closed
+    assert client._async_clients == {}
@@ -0,0 +1,46 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from storage.trial_filters import TrialFilterIndex
+
+
+class _Trials:
+    """Just the columns TrialFilterIndex.build reads."""
+
+    def __init__(self, columns):
+        self._columns = columns
+
+    def __len__(self):
+        return len(next(iter(self._columns.values())))
+
+    def column(self, name):
+        return self._columns.get(name, [None] * len(self))
+
+
+def _index():
+    return TrialFilterIndex.build(_Trials({
+        "Phase": ["PHASE2", "PHASE3", "PHASE2|PHASE3", None, "Phase 3"],
+        "Overall Status": ["RECRUITING", "COMPLETED", "RECRUITING", "RECRUITING", "COMPLETED"],
+        "Study type": ["INTERVENTIONAL"] * 5,
+        "Disease": ["breast cancer", "diabetes", "lung cancer", "asthma", "diabetes"],
+    }))
+
+
+def test_selection_packs_matching_rows():
+    index = _index()
+    bitmap, count = index.selection({"phase": ["phase 3"], "status": ["recruiting"]})
+    assert count == 1
+    mask = np.unpackbits(bitmap, bitorder="little")[:index.n].astype(bool)
+    assert np.flatnonzero(mask).tolist() == [2]
+
+
+def test_selection_is_memoized_per_normalized_filter():
+    index = _index()
+    first = index.selection({"status": ["COMPLETED"], "disease": "diabetes"})
+    again = index.selection({"disease": ["Diabetes"], "status": "completed"})
+    assert again is first
+    assert first[1] == 2
+    assert index.selection({}) is None
+    # A different row count is a different bitmap
+    assert index.selection({"status": ["completed"], "disease": "diabetes"}, n=64)[0].nbytes == 8